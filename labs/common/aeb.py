@@ -0,0 +1,162 @@
+"""
+Automatic emergency braking from the instantaneous time to collision (iTTC) of
+every LiDAR beam. Time it on full scans with
+
+    python -m labs.common.aeb --beams 1080
+"""
+
+import argparse
+import time
+from typing import Optional
+
+import numpy as np
+
+
+def time_to_collision(
+    ranges: np.ndarray, beam_offsets: np.ndarray, speed
+) -> np.ndarray:
+    """
+    iTTC of every beam, the range over the rate at which it closes when the
+    car drives straight at ``speed`` past static obstacles. Beams that are not
+    closing never collide and get inf.
+
+    Args:
+        ranges: (..., K) ranges of one or more scans
+        beam_offsets: (..., K) angle of each beam from the heading
+        speed: forward speed, a scalar or one per scan
+
+    Returns:
+        (..., K) time to collision in seconds
+    """
+    closing = np.asarray(speed, dtype=float)[..., None] * np.cos(beam_offsets)
+    return np.where(closing > 0, ranges / np.where(closing > 0, closing, 1), np.inf)
+
+
+def braking_beams(
+    ranges: np.ndarray,
+    beam_offsets: np.ndarray,
+    speed,
+    threshold: float,
+    max_deceleration: Optional[float] = None,
+    margin: float = 0.0,
+) -> np.ndarray:
+    """
+    Beams whose obstacle the car has to brake for now.
+
+    Without ``max_deceleration`` that is every beam with an iTTC below
+    ``threshold``. With it, braking from ``speed`` to a stop takes
+    speed / (2 max_deceleration) seconds of iTTC, so the beams that trigger are
+    those with an iTTC below ``threshold`` plus that, plus the time to close
+    ``margin``, i.e. whose range is within
+
+        closing speed * (threshold + speed / (2 max_deceleration)) + margin
+
+    A straight line stop then only needs ``threshold`` to cover the reaction
+    time, but a turning car closes in on obstacles faster than its straight
+    line iTTC, so keep a few scan periods, e.g. 0.1 s.
+
+    Args:
+        ranges: (..., K) ranges of one or more scans
+        beam_offsets: (..., K) angle of each beam from the heading
+        speed: forward speed, a scalar or one per scan
+        threshold: iTTC in seconds kept on top of the stopping distance
+        max_deceleration: deceleration of the brakes, or None for a plain
+            iTTC threshold
+        margin: distance to stop short of obstacles, e.g. the car's radius
+
+    Returns:
+        (..., K) bool
+    """
+    speed = np.asarray(speed, dtype=float)[..., None]
+    closing = speed * np.cos(beam_offsets)
+    horizon = threshold
+    if max_deceleration is not None:
+        horizon = threshold + speed / (2 * max_deceleration)
+    return (closing > 0) & (ranges < closing * horizon + margin)
+
+
+class EmergencyBrake:
+    """
+    Latching AEB for one car: once braking_beams finds a beam it commands a
+    stop until reset. Like the controllers, every per-scan buffer is allocated
+    at construction, so a 1080 beam scan takes microseconds.
+
+    Args:
+        beam_offsets: angle of each beam from the heading
+        threshold: iTTC in seconds kept on top of the stopping distance, or the
+            whole iTTC threshold without ``max_deceleration``
+        max_deceleration: deceleration of the brakes, so that the threshold
+            grows with the distance it takes to stop, see braking_beams
+        margin: distance to stop short of obstacles, e.g. the car's radius
+    """
+
+    def __init__(
+        self,
+        beam_offsets: np.ndarray,
+        threshold: float = 0.5,
+        max_deceleration: Optional[float] = None,
+        margin: float = 0.0,
+    ):
+        self.cosines = np.cos(beam_offsets)
+        self.threshold = threshold
+        self.max_deceleration = max_deceleration
+        self.margin = margin
+        self.ttc = np.empty(len(self.cosines))
+        # Beams that triggered the brake on the last scan
+        self.danger = np.zeros(len(self.cosines), dtype=bool)
+        self.braking = False
+        self._closing = np.empty(len(self.cosines))
+        self._is_closing = np.empty(len(self.cosines), dtype=bool)
+        self._limits = np.empty(len(self.cosines))
+
+    def reset(self) -> None:
+        self.braking = False
+
+    def get_horizon(self, speed: float) -> float:
+        """iTTC in seconds below which a beam triggers, before the margin"""
+        if self.max_deceleration is None:
+            return self.threshold
+        return self.threshold + speed / (2 * self.max_deceleration)
+
+    def step(self, ranges: np.ndarray, speed: float) -> bool:
+        """
+        Update self.ttc and self.danger from a scan and return whether the car
+        must brake
+        """
+        np.multiply(self.cosines, speed, out=self._closing)
+        np.greater(self._closing, 0, out=self._is_closing)
+        self.ttc.fill(np.inf)
+        np.divide(ranges, self._closing, out=self.ttc, where=self._is_closing)
+        np.multiply(self._closing, self.get_horizon(speed), out=self._limits)
+        np.add(self._limits, self.margin, out=self._limits)
+        np.less(ranges, self._limits, out=self.danger)
+        np.logical_and(self.danger, self._is_closing, out=self.danger)
+        if self.danger.any():
+            self.braking = True
+        return self.braking
+
+    def get_speed(self, speed: float) -> float:
+        """Speed command after braking, ``speed`` unless braking"""
+        return 0.0 if self.braking else speed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--beams", type=int, default=1080)
+    parser.add_argument("--fov", type=float, default=270.0, help="degrees")
+    parser.add_argument("--scans", type=int, default=10000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    offsets = np.radians(np.linspace(-args.fov / 2, args.fov / 2, args.beams))
+    scans = rng.uniform(0.5, 10.0, (args.scans, args.beams))
+    brake = EmergencyBrake(offsets, threshold=0.0, max_deceleration=2.0)
+    started = time.perf_counter()
+    for k in range(args.scans):
+        brake.step(scans[k], 2.0)
+    per_scan = (time.perf_counter() - started) / args.scans
+    print(f"EmergencyBrake.step: {per_scan * 1e6:.1f} us per {args.beams} beam scan")
+    started = time.perf_counter()
+    braking_beams(scans, offsets, np.full(args.scans, 2.0), 0.0, 2.0)
+    per_scan = (time.perf_counter() - started) / args.scans
+    print(f"braking_beams batch: {per_scan * 1e6:.1f} us per scan")
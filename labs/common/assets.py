@@ -0,0 +1,69 @@
+import os
+from functools import lru_cache
+
+from manimlib import DEFAULT_RESOLUTION, FRAME_HEIGHT, ImageMobject
+from manimlib.utils.directories import get_cache_dir
+from manimlib.utils.images import get_full_raster_image_path
+from manimlib.utils.simple_functions import hash_string
+from PIL import Image
+
+
+@lru_cache
+def _load_mip_level(path: str, level: int) -> Image.Image:
+    if level == 0:
+        return Image.open(path).convert("RGBA")
+    return _load_mip_level(path, level - 1).reduce(2)
+
+
+@lru_cache
+def _get_image_size(path: str) -> tuple[int, int]:
+    with Image.open(path) as image:
+        return image.size
+
+
+@lru_cache
+def _get_mip_level_path(path: str, level: int) -> str:
+    """Write mip ``level`` of the image to the cache once and return its path"""
+    if level == 0:
+        return path
+    image = _load_mip_level(path, level)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    mip_dir = os.path.join(get_cache_dir(), "mipmaps")
+    os.makedirs(mip_dir, exist_ok=True)
+    mip_path = os.path.join(
+        mip_dir, f"{stem}_{hash_string(path, 8)}_{image.width}x{image.height}.png"
+    )
+    if not os.path.exists(mip_path):
+        image.save(mip_path)
+    return mip_path
+
+
+@lru_cache
+def _get_prototype(path: str, level: int) -> ImageMobject:
+    return ImageMobject(_get_mip_level_path(path, level))
+
+
+def get_image(filename: str, height: float, oversample: float = 2.0) -> ImageMobject:
+    """
+    Return an ImageMobject of the given height backed by a cached, pre-scaled copy
+    of the image.
+
+    The smallest power-of-two mip level that still has ``oversample`` texels per
+    screen pixel is used, and every instance of that level shares one decoded image
+    and one GPU texture.
+
+    Args:
+        filename: path of the image, as passed to ImageMobject
+        height: height of the returned mobject in scene units
+        oversample: texels per output pixel to keep for rotation and scaling
+    """
+    path = get_full_raster_image_path(filename)
+    width, full_height = _get_image_size(path)
+    target_pixels = oversample * height / FRAME_HEIGHT * DEFAULT_RESOLUTION[1]
+    level = 0
+    while (
+        min(width, full_height) >> (level + 1) >= 1
+        and (full_height >> (level + 1)) >= target_pixels
+    ):
+        level += 1
+    return _get_prototype(path, level).copy().set_height(height)
@@ -0,0 +1,346 @@
+"""
+Reference controllers that allocate all their working buffers up front, so a
+steady stream of scans allocates nothing, not even a short lived object: the
+work of a scan goes through ufuncs writing into those buffers, with beam
+indices kept in 0-d arrays, as numpy scalars, views, iterators and Python ints
+above 256 would all allocate. Check it with
+
+    python -m labs.common.controllers --beams 1080
+"""
+
+import argparse
+import math
+import sys
+import tracemalloc
+from collections.abc import Callable, Sequence
+
+import numpy as np
+
+from labs.common.lidar import best_window, extend_disparities, farthest_beam
+from labs.common.pid import PID
+from labs.common.wall_following import get_distance_from_wall
+
+
+class GapFollower:
+    """
+    Follow the Gap steering towards the farthest beam, optionally after
+    extending disparities like extend_disparities, with every per-scan buffer
+    allocated at construction.
+
+    Args:
+        num_beams: beams of every scan
+        field_of_view: angle covered by the beams, centered on the heading
+        max_steering: limit of the steering angle output
+        extend: extend disparities before picking the farthest beam
+        threshold: minimum jump between adjacent beams that counts as a disparity
+        bubble_size: width of the car to pad around the near edge
+    """
+
+    def __init__(
+        self,
+        num_beams: int,
+        field_of_view: float = np.pi,
+        max_steering: float = 0.42,
+        extend: bool = True,
+        threshold: float = 2.0,
+        bubble_size: float = 0.3,
+    ):
+        self.offsets = np.linspace(-field_of_view / 2, field_of_view / 2, num_beams)
+        self.max_steering = max_steering
+        # Steering angle towards each beam, so a step only has to look it up
+        self._steering_table = np.clip(self.offsets, -max_steering, max_steering)
+        self.extend = extend
+        self.threshold = threshold
+        self.bubble_size = bubble_size
+        # Beams covered by a bubble_size wide arc at a range of 1
+        self._bubble_scale = bubble_size * (num_beams - 1) / field_of_view
+        self.ranges = np.empty(num_beams)
+        self.index = np.zeros((), dtype=np.intp)
+        self.steering = np.zeros(())
+        # Fixed views of the ranges buffer, so refilling it updates them
+        self._left = self.ranges[:-1]
+        self._right = self.ranges[1:]
+        self._jumps = np.empty(num_beams - 1)
+        self._threshold = np.full((), threshold)
+        self._is_disparity = np.empty(num_beams - 1, dtype=bool)
+        # Beam indices as floats, to compare with the bounds of a bubble
+        self._beams = np.arange(num_beams, dtype=float)
+        self._disparity_beams = self._beams[:-1]
+        self._in_bubble = np.empty(num_beams, dtype=bool)
+        self._before_stop = np.empty(num_beams, dtype=bool)
+        self._after_disparity = np.empty(num_beams - 1, dtype=bool)
+        # The disparity being extended, as 0-d arrays
+        self._disparity = np.zeros((), dtype=np.intp)
+        self._next = np.zeros((), dtype=np.intp)
+        self._one = np.ones((), dtype=np.intp)
+        self._found = np.zeros((), dtype=bool)
+        self._position = np.zeros(())
+        self._left_range = np.zeros(())
+        self._right_range = np.zeros(())
+        self._start = np.zeros(())
+        self._stop = np.zeros(())
+        self._near = np.zeros(())
+
+    def _extend_disparities(self) -> None:
+        """extend_disparities on self.ranges, without temporary objects"""
+        ranges = self.ranges
+        np.subtract(self._right, self._left, out=self._jumps)
+        np.absolute(self._jumps, out=self._jumps)
+        np.greater(self._jumps, self._threshold, out=self._is_disparity)
+        # Visit the disparities in beam order. Beam indices stay in 0-d arrays
+        # and floats, read through take, since indexing with them or reading
+        # them back would create a Python int above 256.
+        while True:
+            self._is_disparity.argmax(out=self._disparity)
+            self._is_disparity.take(self._disparity, out=self._found, mode="clip")
+            if not self._found.item():
+                return
+            np.add(self._disparity, self._one, out=self._next)
+            self._beams.take(self._disparity, out=self._position, mode="clip")
+            ranges.take(self._disparity, out=self._left_range, mode="clip")
+            ranges.take(self._next, out=self._right_range, mode="clip")
+            d = self._position.item()
+            left, right = self._left_range.item(), self._right_range.item()
+            # min and max would allocate an iterator over their arguments
+            near = left if left < right else right
+            # A zero range is an invalid return, not an obstacle touching the car
+            bubble = (self._bubble_scale / (near if near > 1e-9 else 1e-9)) // 1
+            if left < right:
+                self._start[()] = d + 1
+                self._stop[()] = d + bubble + 2
+            else:
+                self._start[()] = d - bubble
+                self._stop[()] = d + 1
+            self._near[()] = near
+            np.greater_equal(self._beams, self._start, out=self._in_bubble)
+            np.less(self._beams, self._stop, out=self._before_stop)
+            np.logical_and(self._in_bubble, self._before_stop, out=self._in_bubble)
+            np.putmask(ranges, self._in_bubble, self._near)
+            # Done with every disparity up to this one
+            np.greater(self._disparity_beams, self._position, out=self._after_disparity)
+            np.logical_and(
+                self._is_disparity, self._after_disparity, out=self._is_disparity
+            )
+
+    def _steer_to_index(self) -> np.ndarray:
+        # mode="clip" skips the bounds check buffer of the default mode
+        return self._steering_table.take(self.index, out=self.steering, mode="clip")
+
+    def step(self, ranges: np.ndarray) -> np.ndarray:
+        """Steering angle for a scan, written into and returned as self.steering"""
+        np.copyto(self.ranges, ranges)
+        if self.extend:
+            self._extend_disparities()
+        self.ranges.argmax(out=self.index)
+        return self._steer_to_index()
+
+
+class WindowFollower(GapFollower):
+    """
+    Best window gap following, steering to the center of the window of
+    ``window_size`` beams whose shortest beam is the longest, like best_window,
+    with every per-scan buffer allocated at construction.
+    """
+
+    def __init__(
+        self,
+        num_beams: int,
+        window_size: int = 13,
+        field_of_view: float = np.pi,
+        max_steering: float = 0.42,
+    ):
+        super().__init__(num_beams, field_of_view, max_steering, extend=False)
+        self.window_size = window_size
+        num_windows = num_beams - window_size + 1
+        self._window_minima = np.empty(num_windows)
+        # The k-th beam of every window, as fixed views of the ranges buffer.
+        # Taking their running minimum avoids the buffers of a reduction.
+        self._shifted = [self.ranges[k : k + num_windows] for k in range(window_size)]
+        # Steering towards the center beam of each window
+        self._steering_table = self._steering_table[
+            window_size // 2 : window_size // 2 + num_windows
+        ]
+
+    def step(self, ranges: np.ndarray) -> np.ndarray:
+        np.copyto(self.ranges, ranges)
+        np.copyto(self._window_minima, self._shifted[0])
+        # Indexing rather than a for loop, whose iterator would be a new object
+        k = 1
+        while k < self.window_size:
+            np.minimum(self._window_minima, self._shifted[k], out=self._window_minima)
+            k += 1
+        self._window_minima.argmax(out=self.index)
+        return self._steer_to_index()
+
+
+class WallFollower:
+    """
+    Lab1 wall following: the PID of the lookahead distance to the wall from
+    beams a and b, as a turn rate. Same as PID.update on get_distance_from_wall,
+    but the state and the outputs live in preallocated arrays instead of a new
+    tuple per call.
+
+    Args:
+        num_beams: beams of every scan
+        field_of_view: angle covered by the beams, centered on the heading
+        theta: angle between beams a and b
+        lookahead: lookahead distance used for the error
+        side: 1 to follow a wall on the left, -1 for a wall on the right
+        kp, ki, kd, setpoint, out_limits: as in PID
+    """
+
+    def __init__(
+        self,
+        num_beams: int,
+        field_of_view: float = np.radians(270.0),
+        theta: float = np.radians(45.0),
+        lookahead: float = 1.5,
+        side: int = 1,
+        kp: float = 1.0,
+        ki: float = 0.0,
+        kd: float = 0.5,
+        setpoint: float = 1.5,
+        out_limits: tuple[float, float] = (-2.0, 2.0),
+    ):
+        offsets = np.linspace(-field_of_view / 2, field_of_view / 2, num_beams)
+        self.b_index = int(np.argmin(np.abs(offsets - side * np.pi / 2)))
+        self.a_index = int(np.argmin(np.abs(offsets - side * (np.pi / 2 - theta))))
+        self.theta = theta
+        self.lookahead = lookahead
+        self.side = side
+        self.kp, self.ki, self.kd = kp, ki, kd
+        self.setpoint = setpoint
+        self.out_limits = out_limits
+        # u, proportional, integral and derivative terms of the last step
+        self.terms = np.zeros(4)
+        self.steering = np.zeros(())
+        self.reset()
+
+    def reset(self) -> None:
+        self.integral = 0.0
+        self.previous_error = math.nan
+
+    def step(self, ranges: np.ndarray, dt: float) -> np.ndarray:
+        """Turn rate for a scan, written into and returned as self.steering"""
+        a, b = ranges.item(self.a_index), ranges.item(self.b_index)
+        alpha = math.atan2(a * math.cos(self.theta) - b, a * math.sin(self.theta))
+        distance = b * math.cos(alpha) + self.lookahead * math.sin(alpha)
+        error = self.setpoint - distance
+        derivative = 0.0
+        if dt > 0:
+            self.integral += error * dt
+            if not math.isnan(self.previous_error):
+                derivative = (error - self.previous_error) / dt
+        self.previous_error = error
+        # Plain floats until stored, as reading self.terms back would create
+        # numpy scalars and min and max allocate an iterator
+        p_term = self.kp * error
+        i_term = self.ki * self.integral
+        d_term = self.kd * derivative
+        u = p_term + i_term + d_term
+        low, high = self.out_limits
+        u = low if u < low else high if u > high else u
+        self.terms[0] = u
+        self.terms[1] = p_term
+        self.terms[2] = i_term
+        self.terms[3] = d_term
+        self.steering[()] = -self.side * u
+        return self.steering
+
+
+def make_scans(num_beams: int, num_scans: int, seed: int = 0) -> np.ndarray:
+    """
+    (num_scans, num_beams) ranges of smooth walls with an object in front of
+    them, so every scan has disparities
+    """
+    rng = np.random.default_rng(seed)
+    scans = 2 + np.cumsum(rng.normal(0, 0.02, (num_scans, num_beams)), axis=1)
+    width = min(40, num_beams // 4)
+    for scan in scans:
+        start = rng.integers(0, num_beams - width)
+        scan[start : start + width] = rng.uniform(0.3, 1.0)
+    return scans
+
+
+def measure_allocations(
+    step: Callable[[np.ndarray], object], scans: Sequence[np.ndarray]
+) -> tuple[int, int]:
+    """
+    Bytes allocated by ``step`` over ``scans`` once warmed up, as traced by
+    tracemalloc. The warm up is a full pass over the same scans, so every
+    branch they take has filled whatever numpy caches before the measured
+    second pass.
+
+    Returns:
+        (retained, peak) with retained the memory still held after the last
+        scan and peak the most held at once, both relative to before the first
+        measured scan
+    """
+    scans = list(scans)
+    # The baseline lives in an array allocated up front, as a new int object
+    # holding it would itself count as retained
+    baseline = np.zeros(1, dtype=np.int64)
+    tracemalloc.start()
+    try:
+        # Warm up while tracing, so that blocks numpy caches between calls
+        # count towards the baseline rather than the measurement
+        for scan in scans:
+            step(scan)
+        # Loop counters and slices would allocate in the measurement, and so
+        # would an iterator over the list created once it started
+        measured = iter(scans)
+        baseline[0] = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        for scan in measured:
+            step(scan)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return current - baseline.item(), peak - baseline.item()
+
+
+def _reference_steps(num_beams: int, offsets: np.ndarray, dt: float):
+    """The lab functions the controllers replace, for comparison"""
+    pid = PID(kp=1.0, ki=0.0, kd=0.5, setpoint=1.5, out_limits=(-2.0, 2.0))
+    wall = WallFollower(num_beams)
+
+    def wall_following(ranges):
+        _, _, distance = get_distance_from_wall(
+            ranges[wall.a_index], ranges[wall.b_index], wall.theta, wall.lookahead
+        )
+        return pid.update(distance, dt)
+
+    return {
+        "disparity": lambda r: offsets[farthest_beam(extend_disparities(r.copy()))],
+        "window": lambda r: offsets[best_window(r, 13) + 13 // 2],
+        "wall_following": wall_following,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--beams", type=int, default=1080)
+    parser.add_argument("--scans", type=int, default=500)
+    args = parser.parse_args()
+
+    scans = make_scans(args.beams, args.scans)
+    dt = 1 / 40
+    wall = WallFollower(args.beams)
+    controllers = {
+        "disparity": GapFollower(args.beams).step,
+        "window": WindowFollower(args.beams).step,
+        "wall_following": lambda ranges: wall.step(ranges, dt),
+    }
+    offsets = GapFollower(args.beams).offsets
+    references = _reference_steps(args.beams, offsets, dt)
+
+    print(
+        f"{'controller':>15} {'retained B':>11} {'peak B':>8} {'reference peak B':>17}"
+    )
+    failed = False
+    for name, step in controllers.items():
+        retained, peak = measure_allocations(step, scans)
+        _, reference_peak = measure_allocations(references[name], scans)
+        print(f"{name:>15} {retained:>11} {peak:>8} {reference_peak:>17}")
+        failed |= retained != 0 or peak != 0
+    sys.exit(1 if failed else 0)
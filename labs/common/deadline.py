@@ -0,0 +1,313 @@
+"""
+Check whether the lab controllers keep up with a LiDAR publishing at a fixed
+rate, and what their late commands do to the car, e.g.
+
+    python -m labs.common.deadline --rate 40 --beams 1080 --slowdown 4
+"""
+
+import argparse
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+from labs.common.aeb import EmergencyBrake
+from labs.common.lidar import best_window, extend_disparities, farthest_beam
+from labs.common.obstacles import ObstacleField
+from labs.common.pid import PID
+from labs.common.vehicle import BicycleModel
+from labs.common.wall_following import get_distance_from_wall
+
+# A controller maps the ranges of one scan and the time since the previous
+# scan to a steering angle
+Controller = Callable[[np.ndarray, float], float]
+
+
+def make_track() -> ObstacleField:
+    """The elliptical track of the Lab2 race, about 2.5 m wide"""
+    field = ObstacleField()
+    field.add_ellipse((0, 0), (6.5, 3.75), negative=True)
+    field.add_ellipse((0, 0), (4, 1.5))
+    return field
+
+
+def make_controllers(
+    beam_offsets: np.ndarray, model: BicycleModel
+) -> dict[str, Callable[[], Controller]]:
+    """
+    Factories of the lab controllers for scans with the given beam offsets from
+    the heading, each steering towards its target beam or at its PID turn rate.
+    """
+
+    field_of_view = beam_offsets[-1] - beam_offsets[0]
+
+    def beam(angle: float) -> int:
+        return int(np.argmin(np.abs(beam_offsets - angle)))
+
+    def steer_to(index) -> float:
+        return float(
+            np.clip(beam_offsets[index], -model.max_steering, model.max_steering)
+        )
+
+    def naive() -> Controller:
+        return lambda ranges, dt: steer_to(farthest_beam(ranges))
+
+    def disparity() -> Controller:
+        def step(ranges, dt):
+            extended = extend_disparities(ranges.copy(), field_of_view=field_of_view)
+            return steer_to(farthest_beam(extended))
+
+        return step
+
+    def window(window_size: int = 13) -> Controller:
+        def step(ranges, dt):
+            return steer_to(best_window(ranges, window_size) + window_size // 2)
+
+        return step
+
+    def wall_following(theta: float = np.radians(45.0)) -> Controller:
+        pid = PID(kp=1.0, ki=0.0, kd=0.5, setpoint=0.6, out_limits=(-2.0, 2.0))
+        b_index, a_index = beam(np.pi / 2), beam(np.pi / 2 - theta)
+        speed = model.max_speed
+
+        def step(ranges, dt):
+            _, _, distance = get_distance_from_wall(
+                ranges[a_index], ranges[b_index], theta
+            )
+            u, _, _, _ = pid.update(distance, dt)
+            return float(model.steering_for_yaw_rate(-u, speed))
+
+        return step
+
+    return {
+        "naive": naive,
+        "disparity": disparity,
+        "window": window,
+        "wall_following": wall_following,
+    }
+
+
+@dataclass
+class DeadlineReport:
+    """
+    Args:
+        name: controller name
+        latencies: seconds spent on every processed scan, scaled to the car
+        period: seconds between two scans
+        dropped: scans that arrived while the controller was still busy
+        crashed: whether the car left the free space
+        crash_time: when it did, or inf
+        deviation: RMS distance from the path driven with instant commands
+        brake_time: when emergency braking started stopping the car, or inf
+    """
+
+    name: str
+    latencies: np.ndarray
+    period: float
+    dropped: int = 0
+    crashed: bool = False
+    crash_time: float = np.inf
+    deviation: float = 0.0
+    brake_time: float = np.inf
+
+    @property
+    def misses(self) -> int:
+        return int(np.sum(self.latencies > self.period))
+
+    def percentiles(self) -> tuple[float, float, float]:
+        """p50, p99 and max latency in seconds"""
+        p50, p99 = np.percentile(self.latencies, [50, 99])
+        return float(p50), float(p99), float(self.latencies.max())
+
+
+def simulate_loop(
+    controller: Controller,
+    field: ObstacleField,
+    start=(0.0, -2.625, 0.0),
+    rate: float = 40.0,
+    duration: float = 20.0,
+    beam_offsets: Optional[np.ndarray] = None,
+    model: Optional[BicycleModel] = None,
+    slowdown: float = 1.0,
+    instant: bool = False,
+    dt: float = 1e-3,
+    max_range: float = 20.0,
+    ttc_threshold: Optional[float] = None,
+):
+    """
+    Drive one car with ``controller`` while its LiDAR publishes at ``rate``.
+
+    Every scan that arrives while the controller is idle is processed, and its
+    command only reaches the car once the measured compute time, times
+    ``slowdown`` for a slower CPU, has passed. Scans arriving while it is still
+    busy are dropped, as a single threaded node would.
+
+    Args:
+        beam_offsets: angle of each beam from the heading, 1080 beams over
+            270 degrees by default
+        model: the car, a BicycleModel with a 2 m/s top speed by default
+        instant: apply every command the moment its scan arrives, as a
+            reference for what the controller does without latency
+        ttc_threshold: stop the car once a beam comes within its stopping
+            distance plus this many seconds of iTTC, see braking_beams. Checked
+            on every scan without delay like a separate safety node, or None to
+            never brake
+
+    Returns:
+        (latencies, dropped, states) with states the (T, 5) car states every
+        ``dt`` seconds
+    """
+    if beam_offsets is None:
+        beam_offsets = np.linspace(-3 * np.pi / 4, 3 * np.pi / 4, 1080)
+    if model is None:
+        model = BicycleModel(max_speed=2.0)
+    period = 1 / rate
+    num_steps = round(duration / dt)
+    state = model.make_states(start)
+    states = np.empty((num_steps, 5))
+    latencies = []
+    dropped = 0
+    next_scan, busy_until = 0.0, 0.0
+    # The controller sees the time since the last scan it processed, which
+    # spans the dropped ones
+    last_processed = -period
+    pending = None
+    steering = 0.0
+    speed = model.max_speed
+    brake = (
+        None
+        if ttc_threshold is None
+        else EmergencyBrake(
+            beam_offsets, ttc_threshold, max_deceleration=model.max_acceleration
+        )
+    )
+    for step in range(num_steps):
+        now = step * dt
+        if pending is not None and now >= pending[0]:
+            steering = pending[1]
+            pending = None
+        if now >= next_scan:
+            ranges = field.cast(
+                state[None, :2], state[None, 2:3] + beam_offsets, max_range
+            )[0]
+            if brake is not None:
+                brake.step(ranges, state[3])
+                speed = brake.get_speed(model.max_speed)
+            if now < busy_until:
+                dropped += 1
+            else:
+                started = time.perf_counter()
+                command = controller(ranges, now - last_processed)
+                last_processed = now
+                latency = time.perf_counter() - started
+                latencies.append(latency)
+                if instant:
+                    steering = command
+                else:
+                    busy_until = now + latency * slowdown
+                    pending = (busy_until, command)
+            next_scan += period
+        state = model.step(state, steering, speed, dt)
+        states[step] = state
+    return np.array(latencies), dropped, states
+
+
+def check_deadlines(
+    rate: float = 40.0,
+    num_beams: int = 1080,
+    field_of_view: float = np.radians(270.0),
+    slowdown: float = 1.0,
+    duration: float = 20.0,
+    speed: float = 2.0,
+    ttc_threshold: Optional[float] = None,
+) -> list[DeadlineReport]:
+    """
+    Run every lab controller with and without latency on the Lab2 track,
+    optionally behind emergency braking at ``ttc_threshold``
+    """
+    field = make_track()
+    beam_offsets = np.linspace(-field_of_view / 2, field_of_view / 2, num_beams)
+    model = BicycleModel(max_speed=speed)
+    kwargs = dict(
+        rate=rate,
+        duration=duration,
+        beam_offsets=beam_offsets,
+        model=model,
+        ttc_threshold=ttc_threshold,
+    )
+    reports = []
+    for name, factory in make_controllers(beam_offsets, model).items():
+        _, _, reference = simulate_loop(factory(), field, instant=True, **kwargs)
+        latencies, dropped, states = simulate_loop(
+            factory(), field, slowdown=slowdown, **kwargs
+        )
+        report = DeadlineReport(name, latencies * slowdown, 1 / rate, dropped)
+        outside = np.flatnonzero(field.contains(states[:, :2]))
+        if len(outside):
+            report.crashed = True
+            report.crash_time = outside[0] * duration / len(states)
+        # Without braking the speed command never drops, so the car only slows
+        # down once the brake engages
+        slowing = np.flatnonzero(np.diff(states[:, 3]) < 0)
+        if len(slowing):
+            report.brake_time = (slowing[0] + 1) * duration / len(states)
+        reference_outside = np.flatnonzero(field.contains(reference[:, :2]))
+        # Only compare the paths while both cars are still on the track
+        end = min(
+            outside[0] if len(outside) else len(states),
+            reference_outside[0] if len(reference_outside) else len(states),
+        )
+        if end:
+            offsets = states[:end, :2] - reference[:end, :2]
+            report.deviation = float(np.sqrt(np.mean((offsets**2).sum(axis=1))))
+        reports.append(report)
+    return reports
+
+
+def summarize(reports: list[DeadlineReport]) -> None:
+    """Print latency percentiles, deadline misses and the effect on the path"""
+    print(
+        f"{'controller':>15}   p50 ms   p99 ms   max ms  misses  dropped"
+        "  deviation m  crash s  brake s"
+    )
+    for report in reports:
+        p50, p99, worst = (1e3 * p for p in report.percentiles())
+        print(
+            f"{report.name:>15} {p50:>8.3f} {p99:>8.3f} {worst:>8.3f} "
+            f"{report.misses:>7} {report.dropped:>8} {report.deviation:>12.3f} "
+            f"{report.crash_time:>8.2f} {report.brake_time:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rate", type=float, default=40.0, help="scans per second")
+    parser.add_argument("--beams", type=int, default=1080)
+    parser.add_argument("--fov", type=float, default=270.0, help="degrees")
+    parser.add_argument(
+        "--slowdown",
+        type=float,
+        default=1.0,
+        help="how many times slower the car's CPU is than this machine",
+    )
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--speed", type=float, default=2.0)
+    parser.add_argument(
+        "--ttc",
+        type=float,
+        help="brake once a beam comes within the stopping distance plus this many "
+        "seconds of time to collision",
+    )
+    args = parser.parse_args()
+    reports = check_deadlines(
+        args.rate,
+        args.beams,
+        np.radians(args.fov),
+        args.slowdown,
+        args.duration,
+        args.speed,
+        args.ttc,
+    )
+    summarize(reports)
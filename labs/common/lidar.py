@@ -0,0 +1,216 @@
+from dataclasses import dataclass, field
+from typing import Callable
+
+import numpy as np
+
+
+@dataclass
+class ScanBuffer:
+    """
+    A single LiDAR scan shared between the ray caster, the controllers and the
+    visualization.
+
+    Args:
+        ranges: distance measured along each beam
+        angles: world-frame angle of each beam in radians
+        origin: position of the sensor when the scan was taken
+        timestamp: simulation time at which the scan was taken
+    """
+
+    ranges: np.ndarray
+    angles: np.ndarray
+    origin: np.ndarray = field(default_factory=lambda: np.zeros(3))
+    timestamp: float = 0.0
+    directions: np.ndarray = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        self.ranges = np.asarray(self.ranges, dtype=float)
+        self.angles = np.asarray(self.angles, dtype=float)
+        self.origin = np.asarray(self.origin, dtype=float)
+        self.directions = np.zeros((len(self.angles), 3))
+        self.set_angles(self.angles)
+
+    @classmethod
+    def empty(cls, num_beams: int) -> "ScanBuffer":
+        return cls(np.zeros(num_beams), np.zeros(num_beams))
+
+    def __len__(self) -> int:
+        return len(self.ranges)
+
+    def set_angles(self, angles: np.ndarray) -> None:
+        """Set the beam angles and the matching unit direction vectors in place"""
+        self.angles[:] = angles
+        np.cos(self.angles, out=self.directions[:, 0])
+        np.sin(self.angles, out=self.directions[:, 1])
+
+    def get_endpoints(self) -> np.ndarray:
+        """Return the world-frame point where each beam ends"""
+        return self.origin + self.ranges[:, None] * self.directions
+
+
+def cast_scan(
+    scan: ScanBuffer,
+    origin: np.ndarray,
+    heading: float,
+    is_outside: Callable[[np.ndarray], bool],
+    field_of_view: float = np.pi,
+    max_ray_length: float = 20,
+    dx: float = 0.1,
+    binary_search_iterations: int = 10,
+) -> ScanBuffer:
+    """
+    Fill ``scan`` in place by marching each beam until it leaves the free space.
+
+    Args:
+        scan: buffer to write ranges, angles and directions into
+        origin: position of the sensor
+        heading: angle of the center beam
+        is_outside: predicate returning True for points inside an obstacle
+        field_of_view: angle covered by the beams, centered on the heading
+        max_ray_length: range reported for beams that never hit anything
+        dx: step size of the coarse march
+        binary_search_iterations: refinement steps once a beam has hit
+    """
+    origin = np.asarray(origin, dtype=float)
+    scan.origin[:] = origin
+    scan.set_angles(
+        np.linspace(heading - field_of_view / 2, heading + field_of_view / 2, len(scan))
+    )
+    steps = np.arange(0, max_ray_length, dx)
+    for i, unit_vector in enumerate(scan.directions):
+        scan.ranges[i] = max_ray_length
+        for t in steps:
+            if is_outside(origin + t * unit_vector):
+                low, high = t - dx, t
+                for _ in range(binary_search_iterations):
+                    mid = (low + high) / 2
+                    if is_outside(origin + mid * unit_vector):
+                        high = mid
+                    else:
+                        low = mid
+                scan.ranges[i] = high
+                break
+    return scan
+
+
+def extend_disparities(
+    ranges: np.ndarray,
+    threshold: float = 2.0,
+    bubble_size: float = 0.3,
+    field_of_view: float = np.pi,
+) -> np.ndarray:
+    """
+    Overwrite the far side of every disparity with the near range, in place.
+
+    Args:
+        ranges: range array ordered by beam angle
+        threshold: minimum jump between adjacent beams that counts as a disparity
+        bubble_size: width of the car to pad around the near edge
+        field_of_view: angle covered by the beams
+    """
+    # Beams covered by a bubble_size wide arc at a range of 1
+    scale = bubble_size * (len(ranges) - 1) / field_of_view
+    disparities = np.where(np.abs(np.diff(ranges)) > threshold)[0]
+    for d in disparities:
+        if ranges[d] < ranges[d + 1]:
+            bubble_indices = int(scale / max(ranges[d], 1e-9))
+            ranges[d + 1 : d + bubble_indices + 2] = ranges[d]
+        else:
+            bubble_indices = int(scale / max(ranges[d + 1], 1e-9))
+            ranges[max(d - bubble_indices, 0) : d + 1] = ranges[d + 1]
+    return ranges
+
+
+def extend_disparities_batch(
+    ranges: np.ndarray,
+    threshold: float = 2.0,
+    bubble_size: float = 0.3,
+    field_of_view: float = np.pi,
+) -> np.ndarray:
+    """
+    extend_disparities for a (C, K) batch of scans at once, returning a copy.
+
+    Every beam takes the shortest near range of the disparities whose bubble
+    covers it, so overlapping bubbles do not depend on the order they are
+    visited in.
+    """
+    ranges = np.asarray(ranges, dtype=float)
+    extended = ranges.copy()
+    num_beams = ranges.shape[-1]
+    scans, d = np.nonzero(np.abs(np.diff(ranges, axis=-1)) > threshold)
+    if len(d) == 0:
+        return extended
+    left, right = ranges[scans, d], ranges[scans, d + 1]
+    near = np.minimum(left, right)
+    bubble_indices = np.minimum(
+        bubble_size * (num_beams - 1) / (np.maximum(near, 1e-9) * field_of_view),
+        num_beams,
+    ).astype(int)
+    starts = np.where(left < right, d + 1, np.maximum(d - bubble_indices, 0))
+    stops = np.minimum(np.where(left < right, d + bubble_indices + 2, d + 1), num_beams)
+    lengths = np.maximum(stops - starts, 0)
+    # Flatten every bubble into (scan, beam) pairs and keep the minimum
+    firsts = np.cumsum(lengths) - lengths
+    beams = np.repeat(starts - firsts, lengths) + np.arange(lengths.sum())
+    np.minimum.at(
+        extended,
+        (np.repeat(scans, lengths), beams),
+        np.repeat(near, lengths),
+    )
+    return extended
+
+
+def farthest_beam(ranges: np.ndarray):
+    """Index of the longest beam, or of each scan's longest for a (C, K) batch"""
+    index = np.argmax(ranges, axis=-1)
+    return int(index) if np.ndim(index) == 0 else index
+
+
+def best_window(ranges: np.ndarray, window_size: int):
+    """
+    Start index of the window of ``window_size`` beams whose shortest beam is
+    the longest, per scan for a (C, K) batch.
+    """
+    windows = np.lib.stride_tricks.sliding_window_view(ranges, window_size, axis=-1)
+    index = np.argmax(windows.min(axis=-1), axis=-1)
+    return int(index) if np.ndim(index) == 0 else index
+
+
+def polylines_to_segments(polylines: list[np.ndarray]) -> np.ndarray:
+    """Stack the edges of 2D polylines into an (M, 2, 2) array of segments"""
+    return np.concatenate(
+        [
+            np.stack([polyline[:-1, :2], polyline[1:, :2]], axis=1)
+            for polyline in map(np.asarray, polylines)
+        ]
+    )
+
+
+def cast_rays_against_segments(
+    origins: np.ndarray,
+    angles: np.ndarray,
+    segments: np.ndarray,
+    max_ray_length: float = 20,
+) -> np.ndarray:
+    """
+    Exact ranges of a batch of rays against line segments, in one vectorized step.
+
+    Args:
+        origins: (..., 2) ray origins
+        angles: (..., K) world-frame angle of each ray, sharing the leading shape
+            of origins
+        segments: (M, 2, 2) segment endpoints
+        max_ray_length: range reported for rays that hit nothing
+    """
+    origins = np.asarray(origins, dtype=float)[..., None, None, :2]
+    angles = np.asarray(angles, dtype=float)[..., None]
+    starts = segments[:, 0]
+    edges = segments[:, 1] - segments[:, 0]
+    dx, dy = np.cos(angles), np.sin(angles)
+    offset = starts - origins
+    denominator = dx * edges[:, 1] - dy * edges[:, 0]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = (offset[..., 0] * edges[:, 1] - offset[..., 1] * edges[:, 0]) / denominator
+        s = (offset[..., 0] * dy - offset[..., 1] * dx) / denominator
+    hit = (denominator != 0) & (t >= 0) & (s >= 0) & (s <= 1)
+    return np.where(hit, t, max_ray_length).min(axis=-1, initial=max_ray_length)
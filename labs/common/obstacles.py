@@ -0,0 +1,344 @@
+from typing import Optional
+
+import numpy as np
+
+
+def _ray_circle_distances(origins, directions, centers, radii) -> np.ndarray:
+    """Distance along unit rays to solid circles, 0 from inside, inf on a miss"""
+    offsets = origins - centers
+    b = (offsets * directions).sum(axis=-1)
+    c = (offsets**2).sum(axis=-1) - radii**2
+    discriminant = b**2 - c
+    near = -b - np.sqrt(np.maximum(discriminant, 0))
+    enters = (discriminant >= 0) & (near >= 0)
+    return np.where(c <= 0, 0.0, np.where(enters, near, np.inf))
+
+
+class MovingObstacles:
+    """
+    Solid circles that move between queries, such as scripted obstacles or
+    other cars, binned in a uniform grid that is updated in place.
+
+    Each circle is listed in every cell its bounding box, padded by half a
+    cell, overlaps. Moving k circles only rebins those whose cell range
+    changed, so an update costs O(k) whatever the number of circles, and
+    queries only run exact tests against the circles listed in the cells they
+    touch.
+
+    Args:
+        lower: (x, y) lower corner of the area covered by the grid
+        upper: (x, y) upper corner; circles and queries outside the area
+            share the border cells, which stays correct but slower
+        cell_size: side of a grid cell
+    """
+
+    def __init__(self, lower, upper, cell_size: float = 1.0):
+        self.lower = np.asarray(lower, float)[:2]
+        self.cell_size = cell_size
+        self.shape = np.maximum(
+            np.ceil((np.asarray(upper, float)[:2] - self.lower) / cell_size), 1
+        ).astype(int)
+        self.cells = np.full((*self.shape, 4), -1, dtype=np.int32)
+        self.centers = np.empty((16, 2))
+        self.radii = np.empty(16)
+        self.bins = np.empty((16, 4), dtype=int)
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _cell_of(self, points: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        cells = np.floor((points - self.lower) / self.cell_size).astype(int)
+        return (
+            np.clip(cells[..., 0], 0, self.shape[0] - 1),
+            np.clip(cells[..., 1], 0, self.shape[1] - 1),
+        )
+
+    def _bins_of(self, centers: np.ndarray, radii: np.ndarray) -> np.ndarray:
+        """(N, 4) inclusive x0, y0, x1, y1 cell range each circle is listed in"""
+        reach = (radii + self.cell_size / 2)[:, None]
+        x0, y0 = self._cell_of(centers - reach)
+        x1, y1 = self._cell_of(centers + reach)
+        return np.stack([x0, y0, x1, y1], axis=1)
+
+    @staticmethod
+    def _expand(indices: np.ndarray, bins: np.ndarray):
+        """Every (index, x, y) pair of the cell ranges in ``bins``"""
+        widths = bins[:, 2] - bins[:, 0] + 1
+        heights = bins[:, 3] - bins[:, 1] + 1
+        sizes = widths * heights
+        k = np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+        heights = np.repeat(heights, sizes)
+        return (
+            np.repeat(indices, sizes),
+            np.repeat(bins[:, 0], sizes) + k // heights,
+            np.repeat(bins[:, 1], sizes) + k % heights,
+        )
+
+    def _insert(self, indices: np.ndarray, bins: np.ndarray) -> None:
+        indices, x, y = self._expand(indices, bins)
+        while len(indices):
+            # One circle per cell per round, so no two land in the same slot
+            _, first = np.unique(x * self.shape[1] + y, return_index=True)
+            free = self.cells[x[first], y[first]] < 0
+            if not free.any(axis=1).all():
+                grown = np.full((*self.shape, 2 * self.cells.shape[2]), -1, np.int32)
+                grown[..., : self.cells.shape[2]] = self.cells
+                self.cells = grown
+                continue
+            slots = np.argmax(free, axis=1)
+            self.cells[x[first], y[first], slots] = indices[first]
+            rest = np.ones(len(indices), dtype=bool)
+            rest[first] = False
+            indices, x, y = indices[rest], x[rest], y[rest]
+
+    def _remove(self, indices: np.ndarray, bins: np.ndarray) -> None:
+        indices, x, y = self._expand(indices, bins)
+        slots = np.argmax(self.cells[x, y] == indices[:, None], axis=1)
+        self.cells[x, y, slots] = -1
+
+    def add(self, center, radius: float) -> int:
+        index = self._count
+        if index == len(self.radii):
+            for name in ("centers", "radii", "bins"):
+                old = getattr(self, name)
+                grown = np.empty((2 * len(old), *old.shape[1:]), dtype=old.dtype)
+                grown[:index] = old
+                setattr(self, name, grown)
+        self.centers[index] = np.asarray(center, float)[:2]
+        self.radii[index] = radius
+        self.bins[index] = self._bins_of(
+            self.centers[index : index + 1], self.radii[index : index + 1]
+        )[0]
+        self._insert(np.array([index]), self.bins[index : index + 1])
+        self._count += 1
+        return index
+
+    def move(self, indices, centers: np.ndarray) -> None:
+        """
+        Move some circles, rebinning only those that changed cells.
+
+        Args:
+            indices: (k,) circles to move
+            centers: (k, 2) their new centers
+        """
+        indices = np.asarray(indices, dtype=int)
+        self.centers[indices] = np.asarray(centers, float)[:, :2]
+        bins = self._bins_of(self.centers[indices], self.radii[indices])
+        changed = (bins != self.bins[indices]).any(axis=1)
+        if changed.any():
+            indices, bins = indices[changed], bins[changed]
+            self._remove(indices, self.bins[indices])
+            self._insert(indices, bins)
+            self.bins[indices] = bins
+
+    def contains(self, points: np.ndarray, ignore: Optional[np.ndarray] = None):
+        """
+        Whether each point is inside a circle.
+
+        Args:
+            points: (..., 2) points
+            ignore: (...,) circle each point should not collide with, or -1
+        """
+        points = np.asarray(points, float)[..., :2]
+        candidates = self.cells[self._cell_of(points)]
+        valid = candidates >= 0
+        if ignore is not None:
+            valid &= candidates != np.asarray(ignore)[..., None]
+        offsets = points[..., None, :] - self.centers[candidates]
+        inside = (offsets**2).sum(axis=-1) <= self.radii[candidates] ** 2
+        return (inside & valid).any(axis=-1)
+
+    def cast(
+        self,
+        origins: np.ndarray,
+        angles: np.ndarray,
+        max_range: float = 20.0,
+        ignore: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        """
+        Exact range of every ray to the first circle.
+
+        Each ray is sampled once per cell size, which with the half cell of
+        padding reaches every cell a circle it crosses is listed in.
+
+        Args:
+            origins: (C, 2) ray origins
+            angles: (C, K) world-frame angle of every ray of every origin
+            max_range: range reported for rays that hit nothing
+            ignore: (C,) circle each origin cannot see, e.g. its own car, or -1
+        """
+        origins = np.asarray(origins, float)[:, :2]
+        angles = np.asarray(angles, float)
+        ranges = np.full(angles.shape, float(max_range))
+        if self._count == 0:
+            return ranges
+        directions = np.stack([np.cos(angles), np.sin(angles)], axis=-1)
+        steps = np.arange(0, max_range + self.cell_size, self.cell_size)
+        samples = origins[:, None, None] + steps[:, None] * directions[:, :, None]
+        candidates = self.cells[self._cell_of(samples)]
+        if ignore is not None:
+            own = np.asarray(ignore)[:, None, None, None]
+            candidates = np.where(candidates == own, -1, candidates)
+        rays, beams, _, _ = np.nonzero(candidates >= 0)
+        circles = candidates[candidates >= 0]
+        distances = _ray_circle_distances(
+            origins[rays],
+            directions[rays, beams],
+            self.centers[circles],
+            self.radii[circles],
+        )
+        np.minimum.at(ranges, (rays, beams), distances)
+        return ranges
+
+
+class ObstacleField:
+    """
+    Analytic 2D world made of ellipses (circles included) and axis-aligned
+    boxes that can be queried for a whole batch of points or rays at once.
+
+    Every shape is either solid, or negative space whose inside is the free
+    space and whose outside is the obstacle, e.g. the outer edge of a track.
+    Extra circles, such as the other cars, can be passed to every query, and
+    the circles of ``moving`` are always part of the world as they are now.
+
+    Args:
+        moving: obstacles that move between queries
+    """
+
+    def __init__(self, moving: Optional[MovingObstacles] = None):
+        self.moving = moving
+        self.ellipse_centers = np.empty((0, 2))
+        self.ellipse_axes = np.empty((0, 2))
+        self.ellipse_negative = np.empty(0, dtype=bool)
+        self.box_lower = np.empty((0, 2))
+        self.box_upper = np.empty((0, 2))
+        self.box_negative = np.empty(0, dtype=bool)
+
+    def add_ellipse(self, center, semi_axes, negative: bool = False) -> int:
+        self.ellipse_centers = np.vstack([self.ellipse_centers, np.asarray(center)[:2]])
+        self.ellipse_axes = np.vstack([self.ellipse_axes, semi_axes])
+        self.ellipse_negative = np.append(self.ellipse_negative, negative)
+        return len(self.ellipse_negative) - 1
+
+    def add_circle(self, center, radius: float, negative: bool = False) -> int:
+        return self.add_ellipse(center, (radius, radius), negative)
+
+    def add_box(self, lower, upper, negative: bool = False) -> int:
+        self.box_lower = np.vstack([self.box_lower, np.asarray(lower)[:2]])
+        self.box_upper = np.vstack([self.box_upper, np.asarray(upper)[:2]])
+        self.box_negative = np.append(self.box_negative, negative)
+        return len(self.box_negative) - 1
+
+    def contains(
+        self,
+        points: np.ndarray,
+        circles: Optional[tuple[np.ndarray, np.ndarray]] = None,
+        ignore: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        """
+        Whether each point is inside an obstacle.
+
+        Args:
+            points: (..., 2) points
+            circles: extra solid (centers (M, 2), radii (M,)) circles
+            ignore: (...,) index of an extra circle each point should not
+                collide with, e.g. the car it belongs to, or -1
+        """
+        points = np.asarray(points, float)[..., None, :2]
+        scaled = (points - self.ellipse_centers) / self.ellipse_axes
+        inside = (scaled**2).sum(axis=-1) <= 1
+        hit = (inside != self.ellipse_negative).any(axis=-1)
+        inside = ((points >= self.box_lower) & (points <= self.box_upper)).all(-1)
+        hit |= (inside != self.box_negative).any(axis=-1)
+        if circles is not None:
+            centers, radii = circles
+            inside = np.hypot(*np.moveaxis(points - centers, -1, 0)) <= radii
+            if ignore is not None:
+                inside &= np.arange(len(radii)) != np.asarray(ignore)[..., None]
+            hit |= inside.any(axis=-1)
+        if self.moving is not None and len(self.moving):
+            hit |= self.moving.contains(points[..., 0, :])
+        return hit
+
+    def cast(
+        self,
+        origins: np.ndarray,
+        angles: np.ndarray,
+        max_range: float = 20.0,
+        circles: Optional[tuple[np.ndarray, np.ndarray]] = None,
+        ignore: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        """
+        Exact range of every ray to the first obstacle, in one vectorized step.
+
+        Args:
+            origins: (C, 2) ray origins, e.g. one per car
+            angles: (C, K) world-frame angle of every ray of every origin
+            max_range: range reported for rays that hit nothing
+            circles: extra solid (centers (M, 2), radii (M,)) circles
+            ignore: (C,) index of an extra circle each origin cannot see, e.g.
+                the car casting the rays, or -1
+
+        Returns:
+            (C, K) ranges
+        """
+        origins = np.asarray(origins, float)[:, None, None, :2]
+        angles = np.asarray(angles, float)
+        directions = np.stack([np.cos(angles), np.sin(angles)], axis=-1)[:, :, None]
+        ranges = np.full(angles.shape, float(max_range))
+
+        centers, axes = self.ellipse_centers, self.ellipse_axes
+        negative = self.ellipse_negative
+        if circles is not None:
+            centers = np.vstack([centers, circles[0][:, :2]])
+            axes = np.vstack([axes, np.repeat(circles[1][:, None], 2, axis=1)])
+            negative = np.concatenate([negative, np.zeros(len(circles[1]), bool)])
+        if len(centers):
+            distances = self._ray_ellipse_distances(
+                origins, directions, centers, axes, negative
+            )
+            if circles is not None and ignore is not None:
+                ignore = np.asarray(ignore)
+                own = np.where(ignore >= 0, len(self.ellipse_negative) + ignore, -1)
+                ignored = np.arange(len(centers)) == own[:, None, None]
+                distances = np.where(ignored, np.inf, distances)
+            ranges = np.minimum(ranges, distances.min(axis=-1))
+        if len(self.box_negative):
+            ranges = np.minimum(ranges, self._cast_boxes(origins, directions))
+        if self.moving is not None and len(self.moving):
+            ranges = np.minimum(
+                ranges, self.moving.cast(origins[:, 0, 0], angles, max_range)
+            )
+        return ranges
+
+    @staticmethod
+    def _ray_ellipse_distances(origins, directions, centers, axes, negative):
+        """(C, K, M) distance along every ray to every ellipse"""
+        # Scale space so every ellipse is a unit circle; t keeps world units
+        o = (origins - centers) / axes
+        d = directions / axes
+        a = (d**2).sum(axis=-1)
+        b = 2 * (o * d).sum(axis=-1)
+        c = (o**2).sum(axis=-1) - 1
+        discriminant = b**2 - 4 * a * c
+        root = np.sqrt(np.maximum(discriminant, 0))
+        near = (-b - root) / (2 * a)
+        far = (-b + root) / (2 * a)
+        inside = c <= 0
+        enters = (discriminant >= 0) & (near >= 0)
+        solid = np.where(inside, 0.0, np.where(enters, near, np.inf))
+        hollow = np.where(inside, far, 0.0)
+        return np.where(negative, hollow, solid)
+
+    def _cast_boxes(self, origins, directions) -> np.ndarray:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t_lower = (self.box_lower - origins) / directions
+            t_upper = (self.box_upper - origins) / directions
+        t_near = np.fmax.reduce(np.fmin(t_lower, t_upper), axis=-1)
+        t_far = np.fmin.reduce(np.fmax(t_lower, t_upper), axis=-1)
+        inside = ((origins >= self.box_lower) & (origins <= self.box_upper)).all(-1)
+        enters = (t_near <= t_far) & (t_near >= 0)
+        solid = np.where(inside, 0.0, np.where(enters, t_near, np.inf))
+        hollow = np.where(inside, t_far, 0.0)
+        return np.where(self.box_negative, hollow, solid).min(axis=-1)
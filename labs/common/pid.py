@@ -0,0 +1,37 @@
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+
+@dataclass
+class PID:
+    kp: float = 0.0
+    ki: float = 0.0
+    kd: float = 0.0
+    setpoint: float = 0.0
+    out_limits: Tuple[Optional[float], Optional[float]] = (-1.0, 1.0)
+    integral: float = 0.0
+    previous_error: Optional[float] = None
+
+    def reset(self) -> None:
+        self.integral = 0.0
+        self.previous_error = None
+
+    def update(
+        self, measurement: float, dt: Optional[float]
+    ) -> Tuple[float, float, float, float]:
+        error: float = self.setpoint - measurement
+        if dt and dt > 0.0:
+            self.integral += error * dt
+        derivative: float = (
+            (error - self.previous_error) / dt
+            if dt and dt > 0.0 and self.previous_error is not None
+            else 0.0
+        )
+        u: float = self.kp * error + self.ki * self.integral + self.kd * derivative
+        low, high = self.out_limits
+        if low is not None and u < low:
+            u = low
+        if high is not None and u > high:
+            u = high
+        self.previous_error = error
+        return u, self.kp * error, self.ki * self.integral, self.kd * derivative
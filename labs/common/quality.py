@@ -0,0 +1,48 @@
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+
+
+@dataclass(frozen=True)
+class QualityProfile:
+    """
+    How much visual detail to spend on a render. Only drawing is affected; the
+    simulations behind the scenes always run at full resolution.
+
+    Args:
+        name: name of the profile
+        ray_fraction: fraction of the LiDAR beams drawn as rays
+        plot_stride: plot one point every ``plot_stride`` frames
+        riemann_dx_scale: multiplier on the width of Riemann rectangles
+    """
+
+    name: str
+    ray_fraction: float
+    plot_stride: int
+    riemann_dx_scale: float
+
+    def num_rays(self, num_beams: int) -> int:
+        """Number of rays to draw for a scan of ``num_beams`` beams"""
+        return max(2, min(num_beams, round(num_beams * self.ray_fraction)))
+
+
+PROFILES = {
+    "draft": QualityProfile(
+        "draft", ray_fraction=0.25, plot_stride=4, riemann_dx_scale=2
+    ),
+    "preview": QualityProfile(
+        "preview", ray_fraction=0.5, plot_stride=2, riemann_dx_scale=1.5
+    ),
+    "final": QualityProfile("final", ray_fraction=1, plot_stride=1, riemann_dx_scale=1),
+}
+
+
+@lru_cache
+def get_quality() -> QualityProfile:
+    """Profile selected by the LAB_QUALITY environment variable, final by default"""
+    name = os.environ.get("LAB_QUALITY", "final")
+    if name not in PROFILES:
+        raise ValueError(
+            f"Unknown LAB_QUALITY {name!r}, expected one of {', '.join(PROFILES)}"
+        )
+    return PROFILES[name]
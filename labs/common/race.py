@@ -0,0 +1,176 @@
+from typing import Optional, Sequence, Union
+
+import numpy as np
+
+from labs.common.aeb import braking_beams, time_to_collision
+from labs.common.lidar import best_window, extend_disparities_batch, farthest_beam
+from labs.common.obstacles import ObstacleField
+from labs.common.vehicle import BicycleModel
+
+POLICIES = ("naive", "disparity", "window")
+
+
+class FollowTheGapRace:
+    """
+    Many Follow the Gap cars driving in one ObstacleField, stepped together.
+
+    Every step casts the scans of all cars in a single batched call, with the
+    other cars as moving circular obstacles, then runs each policy once over
+    the scans of the cars that use it and applies the steering rule of the
+    single car lab scene to all of them through a shared BicycleModel.
+
+    Args:
+        field: static world the cars drive in
+        poses: (C, 3) starting x, y, heading of every car
+        policies: one of POLICIES for every car, or a single one for all
+        num_beams: beams of every scan
+        field_of_view: angle covered by the beams, centered on the heading
+        car_radius: radius of the circle each car occupies
+        max_speed: speed the cars accelerate to
+        model: vehicle model of every car, accelerating at 1 by default
+        max_ray_length: range reported for beams that never hit anything
+        window_size: beams in a window of the window policy
+        threshold: disparity threshold of the disparity policy
+        bubble_size: car width padded around disparities
+        ttc_threshold: brake a car to a stop once a beam comes within its
+            stopping distance plus car_radius and this many seconds of iTTC,
+            see braking_beams. None drives without emergency braking
+    """
+
+    def __init__(
+        self,
+        field: ObstacleField,
+        poses: np.ndarray,
+        policies: Union[str, Sequence[str]] = "naive",
+        num_beams: int = 60,
+        field_of_view: float = np.pi,
+        car_radius: float = 0.2,
+        max_speed: float = 1.0,
+        model: Optional[BicycleModel] = None,
+        max_ray_length: float = 20.0,
+        window_size: int = 13,
+        threshold: float = 2.0,
+        bubble_size: float = 0.3,
+        ttc_threshold: Optional[float] = None,
+    ):
+        self.field = field
+        self.model = model or BicycleModel(max_acceleration=1.0, max_speed=max_speed)
+        self.states = self.model.make_states(poses)
+        num_cars = len(self.states)
+        if isinstance(policies, str):
+            policies = [policies] * num_cars
+        self.policies = np.asarray(policies)
+        unknown = set(self.policies) - set(POLICIES)
+        if unknown:
+            raise ValueError(f"Unknown policies {sorted(unknown)}")
+        self.crashed = np.zeros(num_cars, dtype=bool)
+        self.braking = np.zeros(num_cars, dtype=bool)
+        self.radii = np.full(num_cars, car_radius)
+        self.max_speed = max_speed
+        self.max_ray_length = max_ray_length
+        self.window_size = window_size
+        self.threshold = threshold
+        self.bubble_size = bubble_size
+        self.field_of_view = field_of_view
+        self.ttc_threshold = ttc_threshold
+        self.beam_offsets = np.linspace(
+            -field_of_view / 2, field_of_view / 2, num_beams
+        )
+        self.angles = np.zeros((num_cars, num_beams))
+        self.ranges = np.zeros((num_cars, num_beams))
+        self.ttc = np.full((num_cars, num_beams), np.inf)
+        self.danger = np.zeros((num_cars, num_beams), dtype=bool)
+        self.targets = np.zeros(num_cars, dtype=int)
+        self.time = 0.0
+
+    def __len__(self) -> int:
+        return len(self.states)
+
+    @property
+    def poses(self) -> np.ndarray:
+        """(C, 3) x, y, heading of every car, a view of the states"""
+        return self.states[:, :3]
+
+    def scan(self) -> np.ndarray:
+        """Cast the scans of all cars, returning the (C, K) ranges"""
+        self.angles[:] = self.poses[:, 2:] + self.beam_offsets
+        self.ranges[:] = self.field.cast(
+            self.poses[:, :2],
+            self.angles,
+            self.max_ray_length,
+            circles=(self.poses[:, :2], self.radii),
+            ignore=np.arange(len(self)),
+        )
+        return self.ranges
+
+    def choose_targets(self) -> np.ndarray:
+        """Beam each car steers towards, from the current scans"""
+        for policy in POLICIES:
+            cars = np.flatnonzero(self.policies == policy)
+            if len(cars) == 0:
+                continue
+            ranges = self.ranges[cars]
+            if policy == "naive":
+                self.targets[cars] = farthest_beam(ranges)
+            elif policy == "disparity":
+                extended = extend_disparities_batch(
+                    ranges, self.threshold, self.bubble_size, self.field_of_view
+                )
+                self.targets[cars] = farthest_beam(extended)
+            else:
+                self.targets[cars] = (
+                    best_window(ranges, self.window_size) + self.window_size // 2
+                )
+        return self.targets
+
+    def check_collisions(self) -> np.ndarray:
+        """
+        iTTC of every beam from the current scans, latching the brake of the
+        cars with a beam they can no longer stop for without braking now
+        """
+        speeds = self.states[:, 3]
+        self.ttc[:] = time_to_collision(self.ranges, self.beam_offsets, speeds)
+        if self.ttc_threshold is not None:
+            self.danger[:] = braking_beams(
+                self.ranges,
+                self.beam_offsets,
+                speeds,
+                self.ttc_threshold,
+                self.model.max_acceleration,
+                margin=self.radii[:, None],
+            )
+            self.braking |= self.danger.any(axis=1)
+        return self.braking
+
+    def step(self, dt: float) -> None:
+        """Scan, steer and move every car that has not crashed by ``dt``"""
+        self.time += dt
+        self.scan()
+        self.choose_targets()
+        self.check_collisions()
+        target_angles = np.take_along_axis(self.angles, self.targets[:, None], 1)[:, 0]
+        rotation = np.clip(0.1 * (target_angles - self.poses[:, 2]), -2 * dt, 2 * dt)
+        steering = self.model.steering_for_yaw_rate(rotation / dt, self.states[:, 3])
+        driving = ~self.crashed
+        self.states[driving] = self.model.step(
+            self.states[driving],
+            steering[driving],
+            np.where(self.braking[driving], 0.0, self.max_speed),
+            dt,
+        )
+        # Crashed cars stop where they are and stay in the way of the others
+        hit = self.field.contains(
+            self.poses[:, :2],
+            circles=(self.poses[:, :2], 2 * self.radii),
+            ignore=np.arange(len(self)),
+        )
+        self.crashed |= hit
+        self.states[self.crashed, 3] = 0
+
+    def run(self, duration: float, dt: float = 1 / 30) -> np.ndarray:
+        """Step for ``duration`` seconds, returning the (T, C, 3) poses"""
+        history = []
+        for _ in range(round(duration / dt)):
+            self.step(dt)
+            history.append(self.poses.copy())
+        return np.array(history)
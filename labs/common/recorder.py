@@ -0,0 +1,118 @@
+import glob
+import json
+import os
+from collections.abc import Iterator, Sequence
+from typing import Optional
+
+import numpy as np
+
+
+class TraceRecorder:
+    """
+    Append-only columnar log of a simulation, written as a directory of ``.npy``
+    chunks so memory use stays bounded by ``chunk_size`` rows.
+
+    Args:
+        path: directory to write the chunks and column names into
+        columns: name of each column of a row
+        chunk_size: number of rows buffered before a chunk is written
+    """
+
+    def __init__(self, path: str, columns: Sequence[str], chunk_size: int = 4096):
+        self.path = path
+        self.columns = list(columns)
+        self.buffer = np.empty((chunk_size, len(self.columns)))
+        self.num_buffered = 0
+        self.num_chunks = 0
+        os.makedirs(path, exist_ok=True)
+        for chunk in glob.glob(os.path.join(path, "chunk_*.npy")):
+            os.remove(chunk)
+        with open(os.path.join(path, "columns.json"), "w") as f:
+            json.dump(self.columns, f)
+
+    def append(self, *values: float) -> None:
+        self.buffer[self.num_buffered] = values
+        self.num_buffered += 1
+        if self.num_buffered == len(self.buffer):
+            self.flush()
+
+    def flush(self) -> None:
+        if self.num_buffered == 0:
+            return
+        np.save(
+            os.path.join(self.path, f"chunk_{self.num_chunks:06d}.npy"),
+            self.buffer[: self.num_buffered],
+        )
+        self.num_chunks += 1
+        self.num_buffered = 0
+
+    def close(self) -> None:
+        self.flush()
+
+    def __enter__(self) -> "TraceRecorder":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def read_columns(path: str) -> list[str]:
+    """Column names of a recorded trace"""
+    with open(os.path.join(path, "columns.json")) as f:
+        return json.load(f)
+
+
+def _chunk_paths(path: str) -> list[str]:
+    return sorted(glob.glob(os.path.join(path, "chunk_*.npy")))
+
+
+def iter_trace(path: str) -> Iterator[dict[str, np.ndarray]]:
+    """Yield a recorded trace one chunk at a time as {column: values}"""
+    columns = read_columns(path)
+    for chunk_path in _chunk_paths(path):
+        chunk = np.load(chunk_path, mmap_mode="r")
+        yield {column: chunk[:, i] for i, column in enumerate(columns)}
+
+
+def last_row(path: str) -> Optional[dict[str, float]]:
+    """The last row of a recorded trace as {column: value}, None if it has none"""
+    chunk_paths = _chunk_paths(path)
+    if not chunk_paths:
+        return None
+    row = np.load(chunk_paths[-1], mmap_mode="r")[-1]
+    return {column: float(row[i]) for i, column in enumerate(read_columns(path))}
+
+
+def load_trace(path: str) -> dict[str, np.ndarray]:
+    """Load a whole recorded trace as {column: values}"""
+    chunks = list(iter_trace(path))
+    if not chunks:
+        return {column: np.empty(0) for column in read_columns(path)}
+    return {
+        column: np.concatenate([chunk[column] for chunk in chunks])
+        for column in chunks[0]
+    }
+
+
+def compare_traces(
+    reference: dict[str, np.ndarray],
+    trace: dict[str, np.ndarray],
+    column: str = "error",
+    time_column: str = "time",
+) -> float:
+    """
+    RMS difference of ``column`` between two traces, with ``trace`` interpolated
+    onto the reference timestamps they have in common.
+    """
+    t_ref = reference[time_column]
+    t = trace[time_column]
+    if len(t_ref) == 0 or len(t) == 0:
+        raise ValueError("Cannot compare an empty trace")
+    overlap = (t_ref >= t[0]) & (t_ref <= t[-1])
+    if not overlap.any():
+        raise ValueError(
+            f"The traces do not overlap: {t_ref[0]:g} to {t_ref[-1]:g} s "
+            f"against {t[0]:g} to {t[-1]:g} s"
+        )
+    resampled = np.interp(t_ref[overlap], t, trace[column])
+    return float(np.sqrt(np.mean((resampled - reference[column][overlap]) ** 2)))
@@ -0,0 +1,226 @@
+import csv
+import os
+from collections.abc import Callable, Iterator, Sequence
+from typing import Optional
+
+import numpy as np
+
+from labs.common.lidar import ScanBuffer
+from labs.common.recorder import iter_trace, last_row, read_columns
+
+
+def _last_csv_row(path: str) -> Optional[list[str]]:
+    """The last row of a csv file read from its end, None if it only has a header"""
+    with open(path, "rb") as f:
+        size = position = f.seek(0, os.SEEK_END)
+        tail = b""
+        while position > 0 and b"\n" not in tail.rstrip():
+            position = max(position - 4096, 0)
+            f.seek(position)
+            tail = f.read(size - position)
+    lines = tail.rstrip().splitlines()
+    if len(lines) < 2 and position == 0:
+        return None
+    return next(csv.reader([lines[-1].decode()]))
+
+
+def _iter_csv_chunks(
+    path: str, chunk_size: int
+) -> tuple[list[str], Iterator[np.ndarray], Optional[np.ndarray]]:
+    with open(path, newline="") as f:
+        header = next(csv.reader(f), None)
+    if header is None:
+        raise ValueError(f"{path} is empty")
+    columns = [column.strip() for column in header]
+    last = _last_csv_row(path)
+
+    def chunks():
+        with open(path, newline="") as f:
+            reader = csv.reader(f)
+            next(reader)
+            rows = []
+            for row in reader:
+                rows.append(row)
+                if len(rows) == chunk_size:
+                    yield np.array(rows, dtype=float)
+                    rows = []
+            if rows:
+                yield np.array(rows, dtype=float)
+
+    return columns, chunks(), None if last is None else np.array(last, dtype=float)
+
+
+def _iter_npy_chunks(
+    path: str, chunk_size: int, columns: Optional[Sequence[str]]
+) -> tuple[list[str], Iterator[np.ndarray], Optional[np.ndarray]]:
+    data = np.load(path, mmap_mode="r")
+    if data.dtype.names is not None:
+        columns = list(data.dtype.names)
+    elif columns is None:
+        raise ValueError(f"{path} has no field names, pass columns explicitly")
+
+    def to_rows(chunk: np.ndarray) -> np.ndarray:
+        if chunk.dtype.names is not None:
+            chunk = np.stack([chunk[name] for name in columns], axis=1)
+        return np.asarray(chunk, dtype=float)
+
+    def chunks():
+        for start in range(0, len(data), chunk_size):
+            yield to_rows(data[start : start + chunk_size])
+
+    last = to_rows(data[-1:])[0] if len(data) else None
+    return list(columns), chunks(), last
+
+
+def _iter_trace_chunks(
+    path: str,
+) -> tuple[list[str], Iterator[np.ndarray], Optional[np.ndarray]]:
+    columns = read_columns(path)
+    chunks = (
+        np.stack([chunk[column] for column in columns], axis=1)
+        for chunk in iter_trace(path)
+    )
+    last = last_row(path)
+    return columns, chunks, None if last is None else np.array(list(last.values()))
+
+
+def _is_range_column(column: str) -> bool:
+    return column.startswith("range_") and column[len("range_") :].isdigit()
+
+
+class LogReplay:
+    """
+    Stream a recorded trajectory and interpolate it at arbitrary times.
+
+    Only the chunk containing the requested time and the row just before it are
+    held in memory, so samples must be requested in non-decreasing time order.
+
+    The log needs a ``time`` column and usually ``x``, ``y`` and ``heading``.
+    Columns named ``range_0``, ``range_1``, ... are gathered into a ``ranges`` array,
+    and every other column (steering, error, ...) is interpolated as is.
+
+    Args:
+        path: a ``.csv`` file with a header row, a ``.npy`` file, or a directory
+            written by TraceRecorder
+        chunk_size: rows read from the log at a time
+        columns: column names for a ``.npy`` file without field names
+    """
+
+    def __init__(
+        self,
+        path: str,
+        chunk_size: int = 4096,
+        columns: Optional[Sequence[str]] = None,
+    ):
+        if os.path.isdir(path):
+            self.columns, self._chunks, last = _iter_trace_chunks(path)
+        elif path.endswith(".npy"):
+            self.columns, self._chunks, last = _iter_npy_chunks(
+                path, chunk_size, columns
+            )
+        else:
+            self.columns, self._chunks, last = _iter_csv_chunks(path, chunk_size)
+        self._time_index = self.columns.index("time")
+        self._range_indices = [
+            i for i, column in enumerate(self.columns) if _is_range_column(column)
+        ]
+        self._range_indices.sort(key=lambda i: int(self.columns[i][len("range_") :]))
+        self._angle_indices = [
+            i for i, column in enumerate(self.columns) if column == "heading"
+        ]
+        self._window = next(self._chunks, np.empty((0, len(self.columns))))
+        if len(self._window) == 0:
+            raise ValueError(f"{path} has no rows to replay")
+        self.start_time = float(self._window[0, self._time_index])
+        # Read from the end of the log up front, to know how long it plays
+        self.end_time = float(last[self._time_index])
+        self.finished = False
+
+    @property
+    def duration(self) -> float:
+        """Seconds of log between the first and the last row"""
+        return self.end_time - self.start_time
+
+    def _advance(self, t: float) -> None:
+        while self._window[-1, self._time_index] < t:
+            chunk = next(self._chunks, None)
+            if chunk is None or len(chunk) == 0:
+                self.finished = True
+                return
+            self._window = np.concatenate([self._window[-1:], chunk])
+
+    def sample_row(self, t: float) -> np.ndarray:
+        """Interpolate the full log row at time ``t``"""
+        self._advance(t)
+        times = self._window[:, self._time_index]
+        i = int(np.clip(np.searchsorted(times, t), 1, len(times) - 1))
+        if len(times) == 1:
+            return self._window[0].copy()
+        t0, t1 = times[i - 1], times[i]
+        alpha = np.clip((t - t0) / (t1 - t0), 0, 1) if t1 > t0 else 1.0
+        row0, row1 = self._window[i - 1], self._window[i]
+        row = row0 + alpha * (row1 - row0)
+        for j in self._angle_indices:
+            delta = (row1[j] - row0[j] + np.pi) % (2 * np.pi) - np.pi
+            row[j] = row0[j] + alpha * delta
+        return row
+
+    def sample(self, t: float) -> dict[str, float | np.ndarray]:
+        """Interpolate the log at time ``t`` as {column: value}"""
+        row = self.sample_row(t)
+        sample = {
+            column: row[i]
+            for i, column in enumerate(self.columns)
+            if not _is_range_column(column)
+        }
+        if self._range_indices:
+            sample["ranges"] = row[self._range_indices]
+        return sample
+
+
+def fill_scan(
+    scan: ScanBuffer,
+    sample: dict[str, float | np.ndarray],
+    field_of_view: float = np.pi,
+) -> ScanBuffer:
+    """Copy the pose and ranges of a replay sample into ``scan``"""
+    heading = sample["heading"]
+    scan.origin[:2] = sample["x"], sample["y"]
+    scan.timestamp = sample["time"]
+    scan.ranges[:] = sample["ranges"]
+    scan.set_angles(
+        np.linspace(heading - field_of_view / 2, heading + field_of_view / 2, len(scan))
+    )
+    return scan
+
+
+def replay_updater(
+    replay: LogReplay,
+    heading: float = 0.0,
+    playback_speed: float = 1.0,
+    on_sample: Optional[Callable[[dict[str, float | np.ndarray]], None]] = None,
+):
+    """
+    Create an updater that moves a mobject along a recorded trajectory.
+
+    Args:
+        replay: log to play back
+        heading: heading the mobject is currently drawn at
+        playback_speed: seconds of log played per second of animation
+        on_sample: called with every interpolated sample, e.g. to update plots
+    """
+    current_time = replay.start_time
+
+    def update_from_log(mob, dt: float) -> None:
+        nonlocal current_time, heading
+        current_time += playback_speed * dt
+        sample = replay.sample(current_time)
+        mob.rotate(sample["heading"] - heading)
+        heading = sample["heading"]
+        mob.move_to([sample["x"], sample["y"], 0])
+        if on_sample is not None:
+            on_sample(sample)
+        if replay.finished:
+            mob.remove_updater(update_from_log)
+
+    return update_from_log
@@ -0,0 +1,327 @@
+"""
+Stream LiDAR scans and odometry out of a rosbag2 SQLite bag without ROS, and
+export them as a trace LogReplay can play, e.g.
+
+    python -m labs.common.rosbag path/to/bag path/to/trace --scan-topic /scan
+    REPLAY_LOG=path/to/trace manimgl labs/lab2/lab2.py Lab2Replay
+"""
+
+import argparse
+import glob
+import os
+import re
+import sqlite3
+import struct
+from collections.abc import Iterator, Sequence
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+import numpy as np
+
+from labs.common.recorder import TraceRecorder
+
+
+class CdrReader:
+    """
+    Sequential reader of a CDR (XCDR1) serialized ROS 2 message.
+
+    Primitives are aligned to their size, counted from the end of the 4 byte
+    encapsulation header, as the ROS 2 middleware writes them.
+    """
+
+    def __init__(self, data: bytes):
+        self.data = memoryview(data)
+        if len(data) < 4 or data[1] not in (0, 1):
+            raise ValueError("Not a CDR encapsulated message")
+        self.endian = "<" if data[1] == 1 else ">"
+        self.offset = 4
+
+    def _align(self, size: int) -> None:
+        self.offset += -(self.offset - 4) % size
+
+    def _unpack(self, code: str, size: int):
+        self._align(size)
+        (value,) = struct.unpack_from(self.endian + code, self.data, self.offset)
+        self.offset += size
+        return value
+
+    def uint32(self) -> int:
+        return self._unpack("I", 4)
+
+    def int32(self) -> int:
+        return self._unpack("i", 4)
+
+    def float32(self) -> float:
+        return self._unpack("f", 4)
+
+    def float64(self) -> float:
+        return self._unpack("d", 8)
+
+    def string(self) -> str:
+        length = self.uint32()
+        value = bytes(self.data[self.offset : self.offset + length])
+        self.offset += length
+        return value.rstrip(b"\0").decode()
+
+    def array(self, dtype: str, count: Optional[int] = None) -> np.ndarray:
+        """
+        A sequence of ``dtype`` primitives, prefixed with its length unless
+        ``count`` is given for a fixed size array.
+        """
+        if count is None:
+            count = self.uint32()
+        dtype = np.dtype(dtype).newbyteorder(self.endian)
+        self._align(dtype.itemsize)
+        values = np.frombuffer(self.data, dtype, count, self.offset)
+        self.offset += count * dtype.itemsize
+        return values.astype(dtype.newbyteorder("="))
+
+    def time(self) -> float:
+        """A builtin_interfaces/Time in seconds"""
+        seconds = self.int32()
+        return seconds + self.uint32() * 1e-9
+
+    def header(self) -> tuple[float, str]:
+        """A std_msgs/Header as (stamp in seconds, frame_id)"""
+        stamp = self.time()
+        return stamp, self.string()
+
+
+@dataclass
+class LaserScanMessage:
+    """sensor_msgs/msg/LaserScan, with the header stamp in seconds"""
+
+    time: float
+    frame_id: str
+    angle_min: float
+    angle_max: float
+    angle_increment: float
+    time_increment: float
+    scan_time: float
+    range_min: float
+    range_max: float
+    ranges: np.ndarray
+    intensities: np.ndarray
+
+    def get_angles(self) -> np.ndarray:
+        """Angle of each beam in the sensor frame"""
+        return self.angle_min + self.angle_increment * np.arange(len(self.ranges))
+
+    def get_clean_ranges(self) -> np.ndarray:
+        """Ranges with invalid and out of range returns set to range_max"""
+        ranges = self.ranges.astype(float)
+        invalid = ~np.isfinite(ranges) | (ranges < self.range_min)
+        ranges[invalid | (ranges > self.range_max)] = self.range_max
+        return ranges
+
+
+@dataclass
+class OdometryMessage:
+    """The planar part of a nav_msgs/msg/Odometry, with the stamp in seconds"""
+
+    time: float
+    frame_id: str
+    child_frame_id: str
+    x: float
+    y: float
+    heading: float
+    speed: float
+    yaw_rate: float
+
+
+def decode_laser_scan(data: bytes) -> LaserScanMessage:
+    reader = CdrReader(data)
+    time, frame_id = reader.header()
+    fields = [reader.float32() for _ in range(7)]
+    ranges = reader.array("f4")
+    intensities = reader.array("f4")
+    return LaserScanMessage(time, frame_id, *fields, ranges, intensities)
+
+
+def decode_odometry(data: bytes) -> OdometryMessage:
+    reader = CdrReader(data)
+    time, frame_id = reader.header()
+    child_frame_id = reader.string()
+    x, y, _ = reader.array("f8", 3)
+    qx, qy, qz, qw = reader.array("f8", 4)
+    reader.array("f8", 36)
+    linear = reader.array("f8", 3)
+    angular = reader.array("f8", 3)
+    heading = np.arctan2(2 * (qw * qz + qx * qy), 1 - 2 * (qy**2 + qz**2))
+    return OdometryMessage(
+        time,
+        frame_id,
+        child_frame_id,
+        float(x),
+        float(y),
+        float(heading),
+        float(linear[0]),
+        float(angular[2]),
+    )
+
+
+DECODERS: dict[str, Callable[[bytes], object]] = {
+    "sensor_msgs/msg/LaserScan": decode_laser_scan,
+    "nav_msgs/msg/Odometry": decode_odometry,
+}
+
+
+def _bag_files(path: str) -> list[str]:
+    if not os.path.isdir(path):
+        return [path]
+    # Split bags are numbered bag_0.db3, bag_1.db3, ..., bag_10.db3
+    files = glob.glob(os.path.join(path, "*.db3"))
+    numbers = [re.findall(r"\d+", os.path.basename(f)) for f in files]
+    order = sorted(range(len(files)), key=lambda i: [int(n) for n in numbers[i]])
+    if not files:
+        raise FileNotFoundError(f"No .db3 files in {path}")
+    return [files[i] for i in order]
+
+
+class BagReader:
+    """
+    Stream the messages of a rosbag2 SQLite bag in timestamp order.
+
+    Messages are fetched ``batch_size`` rows at a time and decoded one by one,
+    so memory use does not grow with the size of the bag.
+
+    Args:
+        path: a ``.db3`` file, or a bag directory of possibly split ``.db3`` files
+        batch_size: rows fetched from SQLite at a time
+    """
+
+    def __init__(self, path: str, batch_size: int = 256):
+        self.files = _bag_files(path)
+        self.batch_size = batch_size
+        self.topics: dict[str, str] = {}
+        for file in self.files:
+            with sqlite3.connect(f"file:{file}?mode=ro", uri=True) as connection:
+                rows = connection.execute(
+                    "SELECT name, type, serialization_format FROM topics"
+                )
+                for name, type_name, serialization_format in rows:
+                    if serialization_format != "cdr":
+                        raise ValueError(
+                            f"{name} is serialized as {serialization_format}, "
+                            "only cdr is supported"
+                        )
+                    self.topics[name] = type_name
+
+    def find_topic(self, type_name: str) -> str:
+        """The only topic of a message type"""
+        names = [name for name, t in self.topics.items() if t == type_name]
+        if len(names) != 1:
+            raise ValueError(
+                f"Expected one {type_name} topic, found {names}, pass one explicitly"
+            )
+        return names[0]
+
+    def raw_messages(
+        self, topics: Optional[Sequence[str]] = None
+    ) -> Iterator[tuple[str, int, bytes]]:
+        """(topic, timestamp in ns, serialized data) of every message"""
+        topics = list(self.topics if topics is None else topics)
+        for file in self.files:
+            connection = sqlite3.connect(f"file:{file}?mode=ro", uri=True)
+            try:
+                ids = dict(connection.execute("SELECT name, id FROM topics"))
+                names = {ids[t]: t for t in topics if t in ids}
+                if not names:
+                    continue
+                cursor = connection.execute(
+                    "SELECT topic_id, timestamp, data FROM messages "
+                    f"WHERE topic_id IN ({','.join('?' * len(names))}) "
+                    "ORDER BY timestamp",
+                    list(names),
+                )
+                while rows := cursor.fetchmany(self.batch_size):
+                    for topic_id, timestamp, data in rows:
+                        yield names[topic_id], timestamp, data
+            finally:
+                connection.close()
+
+    def messages(
+        self, topics: Optional[Sequence[str]] = None
+    ) -> Iterator[tuple[str, int, object]]:
+        """(topic, timestamp in ns, decoded message) of every supported message"""
+        topics = [
+            t
+            for t in (self.topics if topics is None else topics)
+            if self.topics.get(t) in DECODERS
+        ]
+        for topic, timestamp, data in self.raw_messages(topics):
+            yield topic, timestamp, DECODERS[self.topics[topic]](data)
+
+    def samples(
+        self, scan_topic: Optional[str] = None, odometry_topic: Optional[str] = None
+    ) -> Iterator[dict[str, float | np.ndarray]]:
+        """
+        One sample per scan in the format of LogReplay.sample, ready for
+        fill_scan: the bag time in seconds, the latest odometry pose (zeros
+        before the first one, or without an odometry topic) and the cleaned
+        ranges.
+        """
+        scan_topic = scan_topic or self.find_topic("sensor_msgs/msg/LaserScan")
+        if odometry_topic is None and "nav_msgs/msg/Odometry" in self.topics.values():
+            odometry_topic = self.find_topic("nav_msgs/msg/Odometry")
+        topics = [scan_topic] + ([odometry_topic] if odometry_topic else [])
+        pose = {"x": 0.0, "y": 0.0, "heading": 0.0}
+        for topic, timestamp, message in self.messages(topics):
+            if topic == scan_topic:
+                yield {
+                    "time": timestamp * 1e-9,
+                    **pose,
+                    "ranges": message.get_clean_ranges(),
+                }
+            else:
+                pose = {
+                    "x": message.x,
+                    "y": message.y,
+                    "heading": message.heading,
+                }
+
+
+def export_trace(
+    bag: BagReader,
+    path: str,
+    scan_topic: Optional[str] = None,
+    odometry_topic: Optional[str] = None,
+) -> int:
+    """
+    Write the scans of a bag as a TraceRecorder directory that LogReplay plays
+    back, with time relative to the first scan.
+
+    Returns:
+        the number of scans written
+    """
+    recorder = None
+    count = 0
+    for sample in bag.samples(scan_topic, odometry_topic):
+        if recorder is None:
+            start = sample["time"]
+            columns = ["time", "x", "y", "heading"]
+            columns += [f"range_{i}" for i in range(len(sample["ranges"]))]
+            recorder = TraceRecorder(path, columns)
+        recorder.append(
+            sample["time"] - start,
+            sample["x"],
+            sample["y"],
+            sample["heading"],
+            *sample["ranges"],
+        )
+        count += 1
+    if recorder is not None:
+        recorder.close()
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("bag", help=".db3 file or bag directory")
+    parser.add_argument("output", help="trace directory to write")
+    parser.add_argument("--scan-topic")
+    parser.add_argument("--odometry-topic")
+    args = parser.parse_args()
+    reader = BagReader(args.bag)
+    count = export_trace(reader, args.output, args.scan_topic, args.odometry_topic)
+    print(f"wrote {count} scans to {args.output}")
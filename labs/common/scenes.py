@@ -0,0 +1,87 @@
+from typing import Callable, Optional
+
+from manimlib import Scene
+from manimlib.logger import log
+
+from labs.common.segments import (
+    SegmentedFileWriter,
+    can_segment,
+    is_segmented_output_enabled,
+)
+
+
+class HoldFrameScene(Scene):
+    """
+    Scene that renders a static wait() once and hands the same frame to the
+    encoder for the rest of its duration.
+
+    A wait is static when it has no stop condition and no mobject on screen has
+    an updater, so nothing can change between its frames. Live previews, presenter
+    mode and skipped sections fall back to the normal Scene.wait.
+
+    With LAB_SEGMENTED=1 the movie is also written as a live HLS playlist of
+    segments, see SegmentedFileWriter, and every wait ends a section.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        if is_segmented_output_enabled():
+            if can_segment(self.file_writer_config):
+                self.file_writer = SegmentedFileWriter(self, **self.file_writer_config)
+            else:
+                log.warning(
+                    "LAB_SEGMENTED only supports a single H.264 .mp4 movie, "
+                    "writing the movie without segments"
+                )
+
+    def is_static_wait(self, stop_condition: Optional[Callable[[], bool]]) -> bool:
+        return (
+            stop_condition is None
+            and self.window is None
+            and not self.presenter_mode
+            and not self.skip_animations
+            and not self.should_update_mobjects()
+        )
+
+    def wait(
+        self,
+        duration: Optional[float] = None,
+        stop_condition: Optional[Callable[[], bool]] = None,
+        note: Optional[str] = None,
+        ignore_presenter_mode: bool = False,
+    ):
+        if not self.is_static_wait(stop_condition):
+            super().wait(duration, stop_condition, note, ignore_presenter_mode)
+        else:
+            self.hold_frame(duration)
+        if isinstance(self.file_writer, SegmentedFileWriter):
+            self.file_writer.next_section()
+        return self
+
+    def hold_frame(self, duration: Optional[float] = None) -> None:
+        """Static wait that renders its first frame only"""
+        if duration is None:
+            duration = self.default_wait_time
+        self.pre_play()
+        self.update_mobjects(dt=0)
+        raw_frame = None
+        last_t = 0
+        for t in self.get_wait_time_progression(duration):
+            if raw_frame is None:
+                self.update_frame(t - last_t)
+                raw_frame = self.camera.get_raw_fbo_data()
+            else:
+                self.increment_time(t - last_t)
+            last_t = t
+            self.emit_held_frame(raw_frame)
+        self.post_play()
+
+    def emit_held_frame(self, raw_frame: bytes) -> None:
+        """Write an already rendered frame to the movie"""
+        file_writer = self.file_writer
+        if isinstance(file_writer, SegmentedFileWriter):
+            file_writer.write_raw_frame(raw_frame)
+        elif file_writer.write_to_movie:
+            file_writer.writing_process.stdin.write(raw_frame)
+            if file_writer.progress_display is not None:
+                file_writer.progress_display.update()
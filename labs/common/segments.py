@@ -0,0 +1,247 @@
+"""
+Write a render as a growing HLS playlist of independently playable segments,
+so a long scene can be reviewed while it renders and a crash keeps everything
+up to the last finished segment. Enable it with LAB_SEGMENTED=1 and open the
+playlist in a player that follows live playlists, e.g.
+
+    LAB_SEGMENTED=1 PYTHONPATH=. uv run manimgl labs/lab2/lab2.py Lab2 -w
+    mpv videos/Lab2_segments/Lab2.m3u8
+"""
+
+import math
+import os
+import subprocess as sp
+from pathlib import Path
+
+from manimlib.scene.scene_file_writer import SceneFileWriter
+from manimlib.utils.file_ops import guarantee_existence
+from tqdm.auto import tqdm as ProgressDisplay
+
+
+def is_segmented_output_enabled() -> bool:
+    """Whether the LAB_SEGMENTED environment variable asks for segmented output"""
+    return os.environ.get("LAB_SEGMENTED", "0").lower() not in ("", "0", "false", "no")
+
+
+def can_segment(file_writer_config: dict) -> bool:
+    """
+    Whether SegmentedFileWriter can write a movie with these SceneFileWriter
+    arguments: H.264 in an .mp4, which MPEG-TS segments can carry and be joined
+    back into without re-encoding, and a single movie rather than one file per
+    animation. Transparent (ProRes .mov) and gif renders need the stock writer.
+    """
+    return (
+        file_writer_config.get("video_codec", "libx264") == "libx264"
+        and file_writer_config.get("movie_file_extension", ".mp4") == ".mp4"
+        and not file_writer_config.get("subdivide_output", False)
+    )
+
+
+class SegmentedFileWriter(SceneFileWriter):
+    """
+    SceneFileWriter that encodes the movie as a sequence of MPEG-TS segments
+    listed in an HLS event playlist, next to the usual movie file.
+
+    Each segment is its own ffmpeg process, so it is complete on disk, starting
+    on a keyframe, as soon as it is closed, and the playlist is rewritten after
+    every segment. A segment is closed at the first section boundary, see
+    next_section, once it holds ``min_segment_duration`` seconds, and in any
+    case after ``max_segment_duration`` seconds. When the scene finishes the
+    segments are joined into the movie file without re-encoding.
+
+    Args:
+        min_segment_duration: shortest segment a section boundary closes
+        max_segment_duration: longest segment, also the playlist target duration
+    """
+
+    def __init__(
+        self,
+        scene,
+        min_segment_duration: float = 2.0,
+        max_segment_duration: float = 10.0,
+        **kwargs,
+    ):
+        self.min_segment_duration = min_segment_duration
+        self.max_segment_duration = max_segment_duration
+        # Durations in seconds of the finished segments
+        self.segment_durations: list[float] = []
+        self.segment_frames = 0
+        # Whether an insert is being written, see begin_insert
+        self.inserting = False
+        self.segment_process = self.segment_progress_display = None
+        super().__init__(scene, **kwargs)
+
+    def init_output_directories(self) -> None:
+        super().init_output_directories()
+        if self.write_to_movie:
+            root = self.get_output_file_rootname()
+            self.segment_directory = Path(guarantee_existence(f"{root}_segments"))
+            self.playlist_path = self.segment_directory / f"{root.name}.m3u8"
+
+    def get_segment_path(self, index: int) -> Path:
+        return self.segment_directory / f"segment_{index:05}.ts"
+
+    def begin(self) -> None:
+        if not self.write_to_movie:
+            return
+        for old in self.segment_directory.glob("segment_*.ts"):
+            old.unlink()
+        self.segment_durations = []
+        self.write_playlist()
+        if not self.quiet:
+            self.progress_display = ProgressDisplay(
+                range(self.total_frames), leave=False, dynamic_ncols=True
+            )
+            self.set_progress_display_description()
+        self.open_segment()
+
+    def open_segment(self) -> None:
+        """Start an ffmpeg process encoding the next segment"""
+        fps = self.scene.camera.fps
+        width, height = self.scene.camera.get_pixel_shape()
+        command = [
+            self.ffmpeg_bin,
+            "-y",
+            "-f", "rawvideo",
+            "-s", f"{width}x{height}",
+            "-pix_fmt", "rgba",
+            "-r", str(fps),
+            "-i", "-",
+            "-vf", f"vflip,eq=saturation={self.saturation}:gamma={self.gamma}",
+            "-an",
+            "-loglevel", "error",
+        ]  # fmt: skip
+        if self.video_codec:
+            command += ["-vcodec", self.video_codec]
+        if self.pixel_format:
+            command += ["-pix_fmt", self.pixel_format]
+        # Continue the timestamps of the previous segments, so players and the
+        # final join see one continuous stream
+        command += [
+            "-output_ts_offset", str(sum(self.segment_durations)),
+            "-f", "mpegts",
+            str(self.get_segment_path(len(self.segment_durations))),
+        ]  # fmt: skip
+        self.writing_process = sp.Popen(command, stdin=sp.PIPE)
+        self.segment_frames = 0
+
+    def close_segment(self) -> None:
+        """Finish the current segment and add it to the playlist"""
+        self.writing_process.stdin.close()
+        returncode = self.writing_process.wait()
+        self.writing_process = None
+        path = self.get_segment_path(len(self.segment_durations))
+        if self.segment_frames and returncode == 0:
+            self.segment_durations.append(self.segment_frames / self.scene.camera.fps)
+        else:
+            path.unlink(missing_ok=True)
+        self.write_playlist()
+        if self.segment_frames and returncode != 0:
+            raise RuntimeError(f"ffmpeg exited with status {returncode} writing {path}")
+
+    def write_playlist(self, ended: bool = False) -> None:
+        """Rewrite the playlist, atomically so a player never reads half of it"""
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:3",
+            f"#EXT-X-TARGETDURATION:{math.ceil(self.max_segment_duration)}",
+            "#EXT-X-MEDIA-SEQUENCE:0",
+            "#EXT-X-PLAYLIST-TYPE:EVENT",
+        ]
+        for index, duration in enumerate(self.segment_durations):
+            lines += [f"#EXTINF:{duration:.6f},", self.get_segment_path(index).name]
+        if ended:
+            lines.append("#EXT-X-ENDLIST")
+        temporary = self.playlist_path.with_suffix(".m3u8.tmp")
+        temporary.write_text("\n".join(lines) + "\n")
+        os.replace(temporary, self.playlist_path)
+
+    def next_section(self) -> None:
+        """
+        Mark a section boundary, closing the current segment if it is long
+        enough so everything rendered so far becomes playable.
+        """
+        if (
+            self.writing_process is not None
+            and not self.inserting
+            and self.segment_frames >= self.min_segment_duration * self.scene.camera.fps
+        ):
+            self.close_segment()
+            self.open_segment()
+
+    def begin_insert(self) -> None:
+        # An insert is a plain movie written by the stock writer, so set the
+        # segment being written and its progress display aside until it ends
+        self.segment_process = self.writing_process
+        self.segment_progress_display = self.progress_display
+        self.inserting = True
+        super().begin_insert()
+
+    def end_insert(self) -> None:
+        super().end_insert()
+        self.inserting = False
+        self.writing_process = self.segment_process
+        self.progress_display = self.segment_progress_display
+        self.segment_process = self.segment_progress_display = None
+        self.write_to_movie = self.writing_process is not None
+
+    def write_raw_frame(self, raw_bytes: bytes) -> None:
+        if not self.write_to_movie:
+            return
+        self.writing_process.stdin.write(raw_bytes)
+        if self.progress_display is not None:
+            self.progress_display.update()
+        if self.inserting:
+            return
+        self.segment_frames += 1
+        if self.segment_frames >= self.max_segment_duration * self.scene.camera.fps:
+            self.close_segment()
+            self.open_segment()
+
+    def write_frame(self, camera) -> None:
+        if self.write_to_movie:
+            self.write_raw_frame(camera.get_raw_fbo_data())
+
+    def join_segments(self) -> None:
+        """Concatenate the segments into the movie file, without re-encoding"""
+        listing = self.segment_directory / "segments.txt"
+        listing.write_text(
+            "".join(
+                f"file '{self.get_segment_path(i).resolve()}'\n"
+                for i in range(len(self.segment_durations))
+            )
+        )
+        sp.run(
+            [
+                self.ffmpeg_bin,
+                "-y",
+                "-f", "concat",
+                "-safe", "0",
+                "-i", str(listing),
+                "-c", "copy",
+                "-loglevel", "error",
+                str(self.get_movie_file_path()),
+            ],
+            check=True,
+        )  # fmt: skip
+        listing.unlink()
+
+    def finish(self) -> None:
+        if self.write_to_movie and self.writing_process is not None:
+            self.close_segment()
+            if self.progress_display is not None:
+                self.progress_display.close()
+            self.write_playlist(ended=True)
+            if self.ended_with_interrupt or not self.segment_durations:
+                # Keep what was rendered as the playlist rather than a movie
+                self.movie_file_path = self.playlist_path
+            else:
+                self.join_segments()
+                if self.includes_sound:
+                    self.add_sound_to_video()
+            self.print_file_ready_message(self.get_movie_file_path())
+        if self.save_last_frame:
+            self.scene.update_frame(force_draw=True)
+            self.save_final_image(self.scene.get_image())
+        if self.should_open_file():
+            self.open_file()
@@ -0,0 +1,124 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+STATE_FIELDS = ("x", "y", "heading", "speed", "steering")
+
+
+@dataclass(frozen=True)
+class BicycleModel:
+    """
+    Kinematic bicycle model shared by the lab scenes and the headless tools.
+
+    A state is an (..., 5) array of x, y, heading, speed and steering angle of
+    the rear axle, so any number of cars step together in one call.
+
+    Args:
+        wheelbase: distance between the axles
+        max_steering: largest steering angle either way, in radians
+        max_steering_rate: fastest the steering angle can change, in rad/s
+        max_acceleration: fastest the speed can change either way
+        max_speed: largest forward speed
+    """
+
+    wheelbase: float = 0.33
+    max_steering: float = 0.42
+    max_steering_rate: float = 3.2
+    max_acceleration: float = 2.0
+    max_speed: float = 7.0
+
+    def make_states(self, poses, speed=0.0, steering=0.0) -> np.ndarray:
+        """(..., 5) states from (..., 3) x, y, heading poses"""
+        poses = np.asarray(poses, dtype=float)
+        states = np.empty((*poses.shape[:-1], 5))
+        states[..., :3] = poses[..., :3]
+        states[..., 3] = speed
+        states[..., 4] = steering
+        return states
+
+    def steering_for_yaw_rate(self, yaw_rate, speed):
+        """
+        Steering angle that turns at ``yaw_rate`` when driving at ``speed``,
+        within the steering limit. Lets controllers that output a turn rate
+        drive the model.
+        """
+        steering = np.arctan(
+            np.asarray(yaw_rate) * self.wheelbase / np.maximum(speed, 1e-6)
+        )
+        return np.clip(steering, -self.max_steering, self.max_steering)
+
+    def yaw_rate(self, speed, steering):
+        return speed * np.tan(steering) / self.wheelbase
+
+    def step(
+        self, states: np.ndarray, steering, speed, dt: float, method: str = "arc"
+    ) -> np.ndarray:
+        """
+        Advance a batch of states by ``dt``.
+
+        The steering angle and the speed first move towards their commands as
+        fast as their rate limits allow, then the pose is integrated either
+        along the exact arc driven at the mean speed and the new steering
+        angle, or with RK4 while both ramp linearly over the step.
+
+        Args:
+            states: (..., 5) current states
+            steering: commanded steering angles, broadcast against the states
+            speed: commanded speeds, broadcast against the states
+            dt: time step
+            method: "arc" or "rk4"
+
+        Returns:
+            (..., 5) new states
+        """
+        if method not in ("arc", "rk4"):
+            raise ValueError(f"Unknown method {method!r}, expected 'arc' or 'rk4'")
+        states = np.asarray(states, dtype=float)
+        x, y, heading, v0, delta0 = np.moveaxis(states, -1, 0)
+        limit = self.max_steering_rate * dt
+        target = np.clip(steering, -self.max_steering, self.max_steering)
+        delta1 = delta0 + np.clip(target - delta0, -limit, limit)
+        limit = self.max_acceleration * dt
+        v1 = v0 + np.clip(np.clip(speed, 0, self.max_speed) - v0, -limit, limit)
+
+        new = np.empty(np.broadcast_shapes(states.shape, np.shape(delta1) + (5,)))
+        new[..., 3], new[..., 4] = v1, delta1
+        if method == "arc":
+            v = (v0 + v1) / 2
+            turn = self.yaw_rate(v, delta1) * dt
+            straight = np.abs(turn) < 1e-9
+            safe_turn = np.where(straight, 1.0, turn)
+            # Chord of the arc, reducing to v * dt along the heading when straight
+            scale = np.where(straight, v * dt, v * dt / safe_turn)
+            new[..., 0] = x + np.where(
+                straight,
+                scale * np.cos(heading),
+                scale * (np.sin(heading + turn) - np.sin(heading)),
+            )
+            new[..., 1] = y + np.where(
+                straight,
+                scale * np.sin(heading),
+                scale * (np.cos(heading) - np.cos(heading + turn)),
+            )
+            new[..., 2] = heading + turn
+        else:
+
+            def derivative(pose, fraction):
+                v = v0 + fraction * (v1 - v0)
+                delta = delta0 + fraction * (delta1 - delta0)
+                return np.stack(
+                    [
+                        v * np.cos(pose[2]),
+                        v * np.sin(pose[2]),
+                        self.yaw_rate(v, delta),
+                    ]
+                )
+
+            pose = np.stack(np.broadcast_arrays(x, y, heading, delta1)[:3])
+            k1 = derivative(pose, 0.0)
+            k2 = derivative(pose + dt / 2 * k1, 0.5)
+            k3 = derivative(pose + dt / 2 * k2, 0.5)
+            k4 = derivative(pose + dt * k3, 1.0)
+            pose = pose + dt / 6 * (k1 + 2 * k2 + 2 * k3 + k4)
+            new[..., 0], new[..., 1], new[..., 2] = pose
+        return new
@@ -0,0 +1,196 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+from labs.common.lidar import cast_rays_against_segments, polylines_to_segments
+from labs.common.pid import PID
+
+
+def get_distance_from_wall(
+    a: np.ndarray | float,
+    b: np.ndarray | float,
+    theta: float = np.radians(45.0),
+    lookahead: float = 1.5,
+):
+    """
+    alpha, D and the lookahead distance from the wall, as in the Lab1p2 slide code.
+
+    Args:
+        a: range of the beam theta before the perpendicular beam
+        b: range of the beam perpendicular to the car
+        theta: angle between the two beams
+        lookahead: how far ahead of the car the distance is projected
+    """
+    alpha = np.arctan2(a * np.cos(theta) - b, a * np.sin(theta))
+    D = b * np.cos(alpha)
+    return alpha, D, D + lookahead * np.sin(alpha)
+
+
+@dataclass
+class WallFollowingRun:
+    """Per-step log of a headless wall following run"""
+
+    time: np.ndarray
+    x: np.ndarray
+    y: np.ndarray
+    heading: np.ndarray
+    a: np.ndarray
+    b: np.ndarray
+    alpha: np.ndarray
+    D: np.ndarray
+    error: np.ndarray
+    steering: np.ndarray
+
+    def to_records(self) -> np.ndarray:
+        """The run as a structured array, readable by LogReplay once saved"""
+        names = list(self.__dataclass_fields__)
+        records = np.empty(len(self.time), dtype=[(name, float) for name in names])
+        for name in names:
+            records[name] = getattr(self, name)
+        return records
+
+    def save(self, path: str) -> str:
+        np.save(path, self.to_records())
+        return path
+
+
+def simulate_wall_following(
+    walls: list[np.ndarray],
+    pid: PID,
+    start: tuple[float, float, float] = (0.0, 0.0, 0.0),
+    speed: float = 1.0,
+    dt: float = 0.01,
+    duration: float = 10.0,
+    theta: float = np.radians(45.0),
+    lookahead: float = 1.5,
+    side: int = 1,
+    max_range: float = 20.0,
+) -> WallFollowingRun:
+    """
+    Drive a car along walls with the Lab1 wall following controller, headless.
+
+    Each step casts beams a and b against the wall segments, feeds the lookahead
+    distance into the PID, whose setpoint is the desired distance from the wall,
+    and turns the car at the PID output rate before moving it along its heading.
+
+    Args:
+        walls: wall polylines as (N, 2) arrays
+        pid: controller, with its setpoint set to the desired distance
+        start: initial (x, y, heading)
+        speed: constant forward speed
+        dt: simulation step
+        duration: simulated time
+        theta: angle between beams a and b
+        lookahead: lookahead distance used for the error
+        side: 1 to follow a wall on the left, -1 for a wall on the right
+        max_range: range reported by beams that hit nothing
+    """
+    segments = polylines_to_segments(walls)
+    beam_offsets = side * np.array([np.pi / 2, np.pi / 2 - theta])
+    num_steps = round(duration / dt)
+    log = {name: np.empty(num_steps) for name in WallFollowingRun.__dataclass_fields__}
+    x, y, heading = start
+    for step in range(num_steps):
+        b, a = cast_rays_against_segments(
+            (x, y), heading + beam_offsets, segments, max_range
+        )
+        alpha, D, distance = get_distance_from_wall(a, b, theta, lookahead)
+        u, _, _, _ = pid.update(distance, dt)
+        steering = -side * u
+
+        log["time"][step] = step * dt
+        log["x"][step], log["y"][step], log["heading"][step] = x, y, heading
+        log["a"][step], log["b"][step] = a, b
+        log["alpha"][step], log["D"][step] = alpha, D
+        log["error"][step] = pid.setpoint - distance
+        log["steering"][step] = steering
+
+        heading += steering * dt
+        x += speed * np.cos(heading) * dt
+        y += speed * np.sin(heading) * dt
+    return WallFollowingRun(**log)
+
+
+def simulate_wall_following_batch(
+    walls: list[np.ndarray],
+    kp: np.ndarray,
+    ki: np.ndarray,
+    kd: np.ndarray,
+    theta: np.ndarray,
+    lookahead: np.ndarray,
+    speed: np.ndarray,
+    setpoint: float = 1.5,
+    out_limits: tuple[float, float] = (-2.0, 2.0),
+    start: tuple[float, float, float] = (0.0, 0.0, 0.0),
+    dt: float = 0.01,
+    duration: float = 10.0,
+    side: int = 1,
+    max_range: float = 20.0,
+    crash_distance: float = 0.2,
+) -> dict[str, np.ndarray]:
+    """
+    Run simulate_wall_following for many parameter sets at once, one array lane
+    per set, and summarize each run.
+
+    All parameter arrays broadcast to a common shape (N,). The PID is the same
+    as the PID dataclass, applied element-wise. A run counts as crashed once D
+    drops below ``crash_distance`` or beam b loses the wall, and stops
+    contributing to the error statistics from then on.
+
+    Returns:
+        {"rms_error", "max_error", "crashed", "crash_time"}, each of shape (N,)
+    """
+    kp, ki, kd, theta, lookahead, speed = np.broadcast_arrays(
+        *map(np.atleast_1d, (kp, ki, kd, theta, lookahead, speed))
+    )
+    num_runs = len(kp)
+    segments = polylines_to_segments(walls)
+    beam_offsets = side * np.stack(
+        [np.full(num_runs, np.pi / 2), np.pi / 2 - theta], axis=1
+    )
+    num_steps = round(duration / dt)
+    x = np.full(num_runs, start[0], dtype=float)
+    y = np.full(num_runs, start[1], dtype=float)
+    heading = np.full(num_runs, start[2], dtype=float)
+    integral = np.zeros(num_runs)
+    previous_error = None
+    squared_error = np.zeros(num_runs)
+    max_error = np.zeros(num_runs)
+    num_samples = np.zeros(num_runs)
+    crash_time = np.full(num_runs, np.inf)
+
+    for step in range(num_steps):
+        ranges = cast_rays_against_segments(
+            np.stack([x, y], axis=1),
+            heading[:, None] + beam_offsets,
+            segments,
+            max_range,
+        )
+        b, a = ranges[:, 0], ranges[:, 1]
+        _, D, distance = get_distance_from_wall(a, b, theta, lookahead)
+
+        alive = np.isinf(crash_time)
+        crashed_now = alive & ((D < crash_distance) | (b >= max_range))
+        crash_time[crashed_now] = step * dt
+        alive &= ~crashed_now
+        tracking_error = np.abs(setpoint - D)
+        squared_error += np.where(alive, tracking_error**2, 0)
+        max_error = np.where(alive, np.maximum(max_error, tracking_error), max_error)
+        num_samples += alive
+
+        error = setpoint - distance
+        integral += error * dt
+        derivative = (error - previous_error) / dt if previous_error is not None else 0
+        previous_error = error
+        u = np.clip(kp * error + ki * integral + kd * derivative, *out_limits)
+
+        heading += -side * u * dt
+        x += speed * np.cos(heading) * dt
+        y += speed * np.sin(heading) * dt
+
+    return {
+        "rms_error": np.sqrt(squared_error / np.maximum(num_samples, 1)),
+        "max_error": max_error,
+        "crashed": np.isfinite(crash_time),
+        "crash_time": crash_time,
+    }
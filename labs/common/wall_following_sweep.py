@@ -0,0 +1,187 @@
+"""
+Sweep the wall following controller over beam angle, lookahead, speed and PID
+gains on a set of corridors, e.g.
+
+    python -m labs.common.wall_following_sweep sweep.csv
+"""
+
+import argparse
+import csv
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+import numpy as np
+
+from labs.common.wall_following import simulate_wall_following_batch
+
+
+@dataclass(frozen=True)
+class Corridor:
+    """Left wall polylines of a test corridor and where the car starts in it"""
+
+    walls: tuple[np.ndarray, ...]
+    start: tuple[float, float, float]
+
+
+def _arc(center, radius, start_angle, end_angle, num_points=32) -> np.ndarray:
+    angles = np.linspace(start_angle, end_angle, num_points)
+    return np.asarray(center) + radius * np.stack([np.cos(angles), np.sin(angles)], 1)
+
+
+CORRIDORS = {
+    "straight": Corridor((np.array([[-10, 2.5], [40, 2.5]]),), (-9.0, 1.0, 0.0)),
+    "step": Corridor(
+        (np.array([[-10, 2.5], [5, 2.5], [8, 0.5], [40, 0.5]]),), (-9.0, 1.0, 0.0)
+    ),
+    "zigzag": Corridor(
+        (
+            np.array(
+                [
+                    [x, 2.5 if i % 2 == 0 else 1.8]
+                    for i, x in enumerate(range(-10, 45, 5))
+                ]
+            ),
+        ),
+        (-9.0, 1.0, 0.0),
+    ),
+    "curve": Corridor(
+        (
+            np.concatenate(
+                [
+                    [[-10, 2.5]],
+                    _arc((0, 10.5), 8, -np.pi / 2, 0),
+                    [[8, 40]],
+                ]
+            ),
+        ),
+        (-9.0, 1.0, 0.0),
+    ),
+}
+
+THETAS = tuple(np.radians([30.0, 45.0, 60.0]))
+
+PARAMETERS = ["theta", "lookahead", "speed", "kp", "ki", "kd"]
+METRICS = ["rms_error", "max_error", "crashed", "crash_time"]
+
+
+def _run_chunk(corridor_name: str, corridor: Corridor, params: np.ndarray, kwargs):
+    results = simulate_wall_following_batch(
+        list(corridor.walls),
+        start=corridor.start,
+        **{name: params[:, i] for i, name in enumerate(PARAMETERS)},
+        **kwargs,
+    )
+    return corridor_name, params, results
+
+
+def sweep_wall_following(
+    thetas=THETAS,
+    lookaheads=(0.5, 1.0, 1.5, 2.0),
+    speeds=(1.0, 2.0, 3.0),
+    kps=(0.5, 1.0, 2.0),
+    kis=(0.0, 0.1),
+    kds=(0.0, 0.5, 1.0),
+    corridors: dict[str, Corridor] = CORRIDORS,
+    runs_per_task: int = 2048,
+    max_workers: int | None = None,
+    **kwargs,
+) -> np.ndarray:
+    """
+    Evaluate every combination of the parameter grids on every corridor.
+
+    Each process pool task simulates up to ``runs_per_task`` combinations on one
+    corridor as a single vectorized batch.
+
+    Args:
+        thetas: angles between beams a and b, in radians
+        lookaheads: lookahead distances
+        speeds: forward speeds
+        kps, kis, kds: PID gains
+        corridors: {name: Corridor} to evaluate on
+        runs_per_task: combinations simulated together in one task
+        max_workers: process pool size, one per CPU by default
+        kwargs: passed on to simulate_wall_following_batch (dt, duration, ...)
+
+    Returns:
+        A structured array with one row per corridor and combination, holding
+        the corridor name, the parameters and the metrics of
+        simulate_wall_following_batch.
+    """
+    grid = np.array(list(itertools.product(thetas, lookaheads, speeds, kps, kis, kds)))
+    chunks = np.array_split(grid, max(1, int(np.ceil(len(grid) / runs_per_task))))
+    dtype = (
+        [("corridor", "U16")]
+        + [(name, float) for name in PARAMETERS]
+        + [(name, bool if name == "crashed" else float) for name in METRICS]
+    )
+    table = np.empty(len(grid) * len(corridors), dtype=dtype)
+    row = 0
+    with ProcessPoolExecutor(max_workers) as pool:
+        futures = [
+            pool.submit(_run_chunk, name, corridor, chunk, kwargs)
+            for name, corridor in corridors.items()
+            for chunk in chunks
+        ]
+        for future in futures:
+            name, params, results = future.result()
+            rows = slice(row, row + len(params))
+            table["corridor"][rows] = name
+            for i, parameter in enumerate(PARAMETERS):
+                table[parameter][rows] = params[:, i]
+            for metric in METRICS:
+                table[metric][rows] = results[metric]
+            row += len(params)
+    return table
+
+
+def pivot(
+    table: np.ndarray,
+    rows: str,
+    columns: str,
+    value: str = "rms_error",
+    reduce=np.mean,
+    include_crashed: bool = False,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Reduce ``value`` over everything but two parameters, ready for a heatmap.
+
+    Crashed runs are left out by default, as their errors only cover the time
+    before the crash, so a cell where every run crashed is NaN. Pivot
+    ``value="crashed"`` with ``include_crashed=True`` for the crash rate.
+
+    Returns:
+        (row values, column values, grid) where grid[i, j] reduces the rows of
+        the table with rows == row values[i] and columns == column values[j]
+    """
+    row_values, row_index = np.unique(table[rows], return_inverse=True)
+    column_values, column_index = np.unique(table[columns], return_inverse=True)
+    kept = np.ones(len(table), dtype=bool) if include_crashed else ~table["crashed"]
+    grid = np.full((len(row_values), len(column_values)), np.nan)
+    for i, j in itertools.product(range(len(row_values)), range(len(column_values))):
+        mask = kept & (row_index == i) & (column_index == j)
+        if mask.any():
+            grid[i, j] = reduce(table[value][mask])
+    return row_values, column_values, grid
+
+
+def save_table(table: np.ndarray, path: str) -> None:
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(table.dtype.names)
+        writer.writerows(table.tolist())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("output", help="CSV file to write the results to")
+    parser.add_argument("--dt", type=float, default=0.02)
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args()
+    table = sweep_wall_following(dt=args.dt, duration=args.duration)
+    save_table(table, args.output)
+    best = table[~table["crashed"]]
+    for corridor in np.unique(best["corridor"]):
+        rows = best[best["corridor"] == corridor]
+        top = rows[np.argmin(rows["rms_error"])]
+        print(corridor, {name: round(float(top[name]), 3) for name in PARAMETERS})
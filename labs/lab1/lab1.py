@@ -1,41 +1,16 @@
-from dataclasses import dataclass
+import os
 from typing import Optional, Tuple, List
 from manimlib import *
+from manimlib.utils.directories import get_output_dir
 
-
-@dataclass
-class PID:
-    kp: float = 0.0
-    ki: float = 0.0
-    kd: float = 0.0
-    setpoint: float = 0.0
-    out_limits: Tuple[Optional[float], Optional[float]] = (-1.0, 1.0)
-    integral: float = 0.0
-    previous_error: Optional[float] = None
-
-    def reset(self) -> None:
-        self.integral = 0.0
-        self.previous_error = None
-
-    def update(
-        self, measurement: float, dt: Optional[float]
-    ) -> Tuple[float, float, float, float]:
-        error: float = self.setpoint - measurement
-        if dt and dt > 0.0:
-            self.integral += error * dt
-        derivative: float = (
-            (error - self.previous_error) / dt
-            if dt and dt > 0.0 and self.previous_error is not None
-            else 0.0
-        )
-        u: float = self.kp * error + self.ki * self.integral + self.kd * derivative
-        low, high = self.out_limits
-        if low is not None and u < low:
-            u = low
-        if high is not None and u > high:
-            u = high
-        self.previous_error = error
-        return u, self.kp * error, self.ki * self.integral, self.kd * derivative
+from labs.common.assets import get_image
+from labs.common.pid import PID
+from labs.common.quality import get_quality
+from labs.common.recorder import TraceRecorder
+from labs.common.replay import LogReplay, replay_updater
+from labs.common.scenes import HoldFrameScene
+from labs.common.vehicle import BicycleModel
+from labs.common.wall_following import simulate_wall_following
 
 
 def create_legend(legend_data: List[Tuple[str, str]]) -> VGroup:
@@ -52,6 +27,38 @@ def create_legend(legend_data: List[Tuple[str, str]]) -> VGroup:
     )
 
 
+PLOT_SERIES = [
+    ("error", RED),
+    ("steering", ORANGE),
+    ("proportional", YELLOW),
+    ("integral", BLUE),
+    ("derivative", PURPLE),
+]
+
+
+def plot_values(
+    current_time: float,
+    values: dict[str, float],
+    axes: Axes,
+    segments: list,
+    scene: Scene,
+    plot_data: dict,
+) -> None:
+    """Extend each plotted series in plot_data by one segment"""
+    for key, color in PLOT_SERIES:
+        if key in plot_data and key in values:
+            plot_data[key].append([current_time, values[key], 0])
+            if len(plot_data[key]) > 1:
+                segment = Line(
+                    axes.coords_to_point(*plot_data[key][-2][:2]),
+                    axes.coords_to_point(*plot_data[key][-1][:2]),
+                    color=color,
+                    stroke_width=2,
+                )
+                segments.append(segment)
+                scene.add(segment)
+
+
 def create_plotting_updater(
     pid: PID,
     heading: float,
@@ -63,65 +70,57 @@ def create_plotting_updater(
     segments: Optional[list] = None,
     scene: Optional[Scene] = None,
     plot_data: Optional[dict] = None,
+    recorder: Optional[TraceRecorder] = None,
 ) -> callable:
-    """Create car movement updater with plotting"""
-    heading: ValueTracker = ValueTracker(heading)
+    """Create car movement updater with plotting and optional trace recording"""
+    model = BicycleModel(max_acceleration=acceleration, max_speed=max_speed)
+    state = model.make_states([0.0, 0.0, heading])
     time_tracker: ValueTracker = ValueTracker(0)
-    speed: ValueTracker = ValueTracker(0)
-    data = [
-        ("error", RED),
-        ("steering", ORANGE),
-        ("proportional", YELLOW),
-        ("integral", BLUE),
-        ("derivative", PURPLE),
-    ]
+    plot_stride = get_quality().plot_stride
+    frame_count = 0
 
     def follow_path_with_plots(mob: Mobject, dt: float) -> None:
+        nonlocal frame_count, state
         if not dt or dt <= 0:
             return
         x, y, _ = mob.get_center()
+        state[:2] = x, y
 
         e: float = y - line_y
         omega, p, i, d = pid.update(e, dt)
 
         current_time = time_tracker.get_value()
-        if plot_data is not None and axes is not None and segments is not None:
-            for (key, color), value in zip(data, [e, omega, p, i, d]):
-                if key in plot_data:
-                    plot_data[key].append([current_time, value, 0])
-                    if len(plot_data[key]) > 1:
-                        segment = Line(
-                            axes.coords_to_point(*plot_data[key][-2][:2]),
-                            axes.coords_to_point(*plot_data[key][-1][:2]),
-                            color=color,
-                            stroke_width=2,
-                        )
-                        segments.append(segment)
-                        scene.add(segment)
-
-        mob.rotate(omega * dt)
-        heading.increment_value(omega * dt)
+        if recorder is not None:
+            recorder.append(current_time, x, y, state[2], e, omega, p, i, d)
+        if (
+            plot_data is not None
+            and axes is not None
+            and segments is not None
+            and frame_count % plot_stride == 0
+        ):
+            values = dict(zip([key for key, _ in PLOT_SERIES], [e, omega, p, i, d]))
+            plot_values(current_time, values, axes, segments, scene, plot_data)
+        frame_count += 1
         time_tracker.increment_value(dt)
 
-        current_speed = speed.get_value()
-        if current_speed < max_speed and x < line_end_x:
-            speed.increment_value(acceleration * dt)
-        elif current_speed > 0 and x >= line_end_x:
-            speed.increment_value(-acceleration * dt)
-        elif current_speed <= 0 and x >= line_end_x:
-            speed.set_value(0)
+        if x >= line_end_x and state[3] <= 0:
             mob.remove_updater(follow_path_with_plots)
+            if recorder is not None:
+                recorder.close()
+            return
 
-        current_speed = speed.get_value()
-        current_heading = heading.get_value()
-        dx: float = current_speed * np.cos(current_heading) * dt
-        dy: float = current_speed * np.sin(current_heading) * dt
-        mob.move_to([x + dx, y + dy, 0])
+        # The PID outputs a turn rate, which the model turns into a steering angle
+        target_speed = max_speed if x < line_end_x else 0.0
+        steering = model.steering_for_yaw_rate(omega, state[3])
+        new_state = model.step(state, steering, target_speed, dt)
+        mob.rotate(new_state[2] - state[2])
+        mob.move_to([new_state[0], new_state[1], 0])
+        state = new_state
 
     return follow_path_with_plots
 
 
-class Lab1(Scene):
+class Lab1(HoldFrameScene):
     def construct(self):
         # Title
         title = TexText("F1tenth Lab 1:", font_size=100).shift(1 * UP)
@@ -162,8 +161,7 @@ class Lab1(Scene):
             line_y * UP + line_start_x * RIGHT, line_y * UP + line_end_x * RIGHT
         )
         car = (
-            ImageMobject("labs/lab1/car_topview.png")
-            .scale(0.07)
+            get_image("labs/lab1/car_topview.png", height=0.28)
             .shift(line_y * UP + line_start_x * RIGHT)
             .rotate(heading)
         )
@@ -248,8 +246,7 @@ class Lab1(Scene):
         )
         legend_group = create_legend([("Error", RED), ("Steering", BLUE)])
         car = (
-            ImageMobject("labs/lab1/car_topview.png")
-            .scale(0.07)
+            get_image("labs/lab1/car_topview.png", height=0.28)
             .shift(line_start_x * RIGHT + line_y * UP)
             .rotate(heading)
         )
@@ -362,8 +359,7 @@ class Lab1(Scene):
             ]
         )
         car = (
-            ImageMobject("labs/lab1/car_topview.png")
-            .scale(0.07)
+            get_image("labs/lab1/car_topview.png", height=0.28)
             .shift(line_start_x * RIGHT + line_y * UP)
             .rotate(heading)
         )
@@ -390,6 +386,20 @@ class Lab1(Scene):
                 "integral": [],
                 "derivative": [],
             },
+            recorder=TraceRecorder(
+                os.path.join(get_output_dir(), "lab1_pid_trace"),
+                [
+                    "time",
+                    "x",
+                    "y",
+                    "heading",
+                    "error",
+                    "steering",
+                    "proportional",
+                    "integral",
+                    "derivative",
+                ],
+            ),
         )
         car.add_updater(follow_path)
         self.wait_until(lambda: follow_path not in car.updaters)
@@ -411,10 +421,9 @@ class Lab1(Scene):
         angle_range = 270 * DEGREES
         start_angle = -20 * DEGREES
         car = (
-            ImageMobject("labs/lab1/car_topview.png")
+            get_image("labs/lab1/car_topview.png", height=0.8)
             .rotate(PI / 2 + PI / 4 + start_angle)
             .shift(DOWN * 2)
-            .scale(0.2)
         )
         wall = Line(RIGHT * 2 + UP * 4, RIGHT * 2 + DOWN * 4, stroke_width=6)
         rays = []
@@ -642,3 +651,128 @@ class Lab1(Scene):
 
         the_end = TexText("The End!", font_size=100)
         self.play(Write(the_end))
+
+
+class Lab1Replay(HoldFrameScene):
+    """
+    Replay a recorded run (by default the trace written by Lab1) with its PID plots.
+
+    Set REPLAY_LOG to the trace directory, CSV or NPY file to play back.
+    """
+
+    def construct(self):
+        replay = LogReplay(
+            os.environ.get(
+                "REPLAY_LOG", os.path.join(get_output_dir(), "lab1_pid_trace")
+            )
+        )
+        start = replay.sample(replay.start_time)
+
+        axes = Axes(
+            x_range=(0, 8),
+            y_range=(-2, 2, 0.5),
+            height=6,
+            width=10,
+        ).shift(UP * 0.5)
+        axes.add_coordinate_labels(
+            font_size=20,
+            num_decimal_places=1,
+        )
+        plot_data = {key: [] for key, _ in PLOT_SERIES if key in start}
+        legend_group = create_legend(
+            [(key.capitalize(), color) for key, color in PLOT_SERIES if key in start]
+        )
+        car = (
+            get_image("labs/lab1/car_topview.png", height=0.28)
+            .move_to([start["x"], start["y"], 0])
+            .rotate(start["heading"])
+        )
+        segments = []
+
+        self.play(Write(axes), Write(legend_group), FadeIn(car))
+
+        plot_stride = get_quality().plot_stride
+        frame_count = 0
+
+        def plot_sample(sample):
+            nonlocal frame_count
+            if frame_count % plot_stride == 0:
+                plot_values(
+                    sample["time"] - replay.start_time,
+                    sample,
+                    axes,
+                    segments,
+                    self,
+                    plot_data,
+                )
+            frame_count += 1
+
+        follow_log = replay_updater(
+            replay, heading=start["heading"], on_sample=plot_sample
+        )
+        car.add_updater(follow_log)
+        self.wait_until(
+            lambda: follow_log not in car.updaters, max_time=replay.duration + 1
+        )
+        self.play(
+            FadeOut(car),
+            FadeOut(axes),
+            *[FadeOut(segment) for segment in segments],
+            FadeOut(legend_group),
+        )
+
+
+class WallFollowingSim(HoldFrameScene):
+    """Animate a precomputed headless wall following run with its a and b beams"""
+
+    def construct(self):
+        wall_points = np.array([[-7, 2.5], [0, 2.5], [3, 0.5], [7, 0.5]])
+        theta = 45 * DEGREES
+        run = simulate_wall_following(
+            [wall_points],
+            PID(kp=1.0, ki=0.0, kd=0.5, setpoint=1.5, out_limits=(-2.0, 2.0)),
+            start=(-6.0, 0.5, 0.0),
+            speed=1.5,
+            dt=1 / self.camera.fps,
+            duration=8.0,
+            theta=theta,
+        )
+        replay = LogReplay(
+            run.save(os.path.join(get_output_dir(), "wall_following_run.npy"))
+        )
+        start = replay.sample(replay.start_time)
+
+        wall = VMobject(stroke_width=6).set_points_as_corners(
+            np.hstack([wall_points, np.zeros((len(wall_points), 1))])
+        )
+        car = (
+            get_image("labs/lab1/car_topview.png", height=0.28)
+            .move_to([start["x"], start["y"], 0])
+            .rotate(start["heading"])
+        )
+        line_a = Line(LEFT, RIGHT, color=TEAL)
+        line_b = Line(LEFT, RIGHT, color=YELLOW)
+
+        def put_beams(sample):
+            center = np.array([sample["x"], sample["y"], 0])
+            for line, offset, length in [
+                (line_b, PI / 2, sample["b"]),
+                (line_a, PI / 2 - theta, sample["a"]),
+            ]:
+                angle = sample["heading"] + offset
+                line.put_start_and_end_on(
+                    center,
+                    center + length * (np.cos(angle) * RIGHT + np.sin(angle) * UP),
+                )
+
+        put_beams(start)
+        self.play(Write(wall), FadeIn(car), FadeIn(line_a), FadeIn(line_b))
+
+        follow_log = replay_updater(
+            replay, heading=start["heading"], on_sample=put_beams
+        )
+        car.add_updater(follow_log)
+        self.wait_until(
+            lambda: follow_log not in car.updaters, max_time=replay.duration + 1
+        )
+        self.play(FadeOut(car), FadeOut(wall), FadeOut(line_a), FadeOut(line_b))
@@ -1,7 +1,134 @@
 from manimlib import *
 
+from labs.common.quality import get_quality
+from labs.common.scenes import HoldFrameScene
 
-class Lab1p2(Scene):
+
+class SampledGraph:
+    """
+    Dense table of the points on a graph, so tracker-driven dots and lines can
+    look up any x without going back to the axes.
+
+    Args:
+        axes: axes the graph is plotted on
+        graph: graph created with axes.get_graph
+        x_range: [x_min, x_max] to sample, the axes range by default
+        num_samples: number of samples in the table
+    """
+
+    def __init__(
+        self,
+        axes: Axes,
+        graph: ParametricCurve,
+        x_range=None,
+        num_samples: int = 2001,
+    ):
+        x_min, x_max = x_range if x_range is not None else axes.x_range[:2]
+        self.xs = np.linspace(x_min, x_max, num_samples)
+        self.step = self.xs[1] - self.xs[0]
+        ys = np.array([graph.underlying_function(x) for x in self.xs])
+        self.points = axes.c2p(self.xs, ys)
+        self.derivatives = np.gradient(self.points, self.xs, axis=0)
+
+    def _interpolate(self, table: np.ndarray, x: float) -> np.ndarray:
+        position = np.clip((x - self.xs[0]) / self.step, 0, len(self.xs) - 1)
+        i = min(int(position), len(self.xs) - 2)
+        alpha = position - i
+        return (1 - alpha) * table[i] + alpha * table[i + 1]
+
+    def point(self, x: float) -> np.ndarray:
+        """Point on the graph above x"""
+        return self._interpolate(self.points, x)
+
+    def derivative(self, x: float) -> np.ndarray:
+        """Derivative of the graph point with respect to x, in scene coordinates"""
+        return self._interpolate(self.derivatives, x)
+
+    def put_secant_on(self, line: Line, x: float, dx: float, length: float) -> Line:
+        """Move line onto the secant through x and x + dx"""
+        return line.put_start_and_end_on(self.point(x), self.point(x + dx)).set_length(
+            length
+        )
+
+    def put_tangent_on(self, line: Line, x: float, length: float) -> Line:
+        """Move line onto the tangent at x"""
+        point = self.point(x)
+        direction = normalize(self.derivative(x))
+        return line.put_start_and_end_on(
+            point - direction * length / 2, point + direction * length / 2
+        )
+
+
+class RiemannSum(VGroup):
+    """
+    Riemann rectangles under a graph that are built once and then revealed up to
+    a moving x value, so each frame only touches the rectangles that changed.
+
+    Args:
+        axes: axes the graph is plotted on
+        graph: graph created with axes.get_graph
+        x_range: [x_min, x_max] covered by the rectangles once fully revealed
+        dx: width of each rectangle
+        kwargs: passed on to axes.get_riemann_rectangles
+    """
+
+    def __init__(self, axes: Axes, graph: ParametricCurve, x_range, dx, **kwargs):
+        rectangles = axes.get_riemann_rectangles(
+            graph, x_range=list(x_range), dx=dx, **kwargs
+        )
+        super().__init__(*rectangles)
+        self.x_min = x_range[0]
+        self.dx = dx
+        self.full_points = [rect.get_points().copy() for rect in self]
+        self.opacities = [
+            (rect.get_fill_opacity(), rect.get_stroke_opacity()) for rect in self
+        ]
+        lefts = self.x_min + dx * np.arange(len(self))
+        self.areas = np.array([graph.underlying_function(x) for x in lefts]) * dx
+        self.cumulative_areas = np.concatenate([[0], np.cumsum(self.areas)])
+        self.revealed_x = self.x_min
+        self.num_visible = len(self)
+        self.grown_index = None
+        self.reveal_to(self.x_min)
+
+    def reveal_to(self, x: float) -> "RiemannSum":
+        """Show the rectangles between x_min and x, growing the one containing x"""
+        self.revealed_x = x
+        progress = np.clip((x - self.x_min) / self.dx, 0, len(self))
+        num_visible = int(np.ceil(progress))
+        for i in range(
+            min(num_visible, self.num_visible), max(num_visible, self.num_visible)
+        ):
+            fill_opacity, stroke_opacity = (
+                self.opacities[i] if i < num_visible else (0, 0)
+            )
+            self[i].set_fill(opacity=fill_opacity).set_stroke(opacity=stroke_opacity)
+        self.num_visible = num_visible
+
+        if self.grown_index is not None:
+            self[self.grown_index].set_points(self.full_points[self.grown_index])
+            self.grown_index = None
+        fraction = progress - np.floor(progress)
+        if num_visible > 0 and fraction > 0:
+            self.grown_index = num_visible - 1
+            self[self.grown_index].stretch(max(fraction, 1e-3), 0, about_edge=LEFT)
+        return self
+
+    def get_integral(self) -> float:
+        """Signed area of the rectangles currently shown"""
+        progress = np.clip((self.revealed_x - self.x_min) / self.dx, 0, len(self))
+        whole = int(progress)
+        partial = self.areas[whole] * (progress - whole) if whole < len(self) else 0
+        return float(self.cumulative_areas[whole] + partial)
+
+    def get_integral_readout(self, **kwargs) -> DecimalNumber:
+        """A number that tracks get_integral()"""
+        readout = DecimalNumber(self.get_integral(), **kwargs)
+        readout.add_updater(lambda m: m.set_value(self.get_integral()))
+        return readout
+
+
+class Lab1p2(HoldFrameScene):
     def construct(self):
         # Title
         title = TexText("F1tenth Lab 1 Part 2:").shift(1 * UP)
@@ -52,17 +179,27 @@ class Lab1p2(Scene):
 
         x_tracker = ValueTracker(0)
         dot1 = Dot(color=RED)
-        rectangles = always_redraw(
-            lambda: axes.get_riemann_rectangles(
-                graph,
-                x_range=[0, x_tracker.get_value()],
-                dx=0.5,
-                fill_opacity=0.6,
-                stroke_width=1,
-            )
+        rectangles = RiemannSum(
+            axes,
+            graph,
+            x_range=[0, 5],
+            dx=0.5 * get_quality().riemann_dx_scale,
+            fill_opacity=0.6,
+            stroke_width=1,
+        )
+        f_always(rectangles.reveal_to, x_tracker.get_value)
+        integral_label = Tex(r"\int_0^t e(\tau) d\tau \approx").to_corner(UR)
+        integral_readout = rectangles.get_integral_readout().next_to(
+            integral_label, RIGHT
+        )
+        sampled_graph = SampledGraph(axes, graph)
+        f_always(dot1.move_to, lambda: sampled_graph.point(x_tracker.get_value()))
+        self.play(
+            FadeIn(dot1),
+            ShowCreation(rectangles),
+            Write(integral_label),
+            FadeIn(integral_readout),
         )
-        f_always(dot1.move_to, lambda: axes.i2gp(x_tracker.get_value(), graph))
-        self.play(FadeIn(dot1), ShowCreation(rectangles))
         self.play(x_tracker.animate.set_value(5), run_time=5)
         self.wait()
         self.play(
@@ -72,6 +209,8 @@ class Lab1p2(Scene):
             FadeOut(graph),
             FadeOut(dot1),
             FadeOut(rectangles),
+            FadeOut(integral_label),
+            FadeOut(integral_readout),
         )
 
         # Integral code
@@ -101,19 +240,24 @@ class Lab1p2(Scene):
         dt = 1
         dot1 = Dot()
         dot2 = Dot()
-        f_always(dot1.move_to, lambda: axes.i2gp(x_tracker.get_value(), graph))
-        f_always(dot2.move_to, lambda: axes.i2gp(x_tracker.get_value() + dt, graph))
-        line = always_redraw(
-            lambda: Line(
-                axes.i2gp(x_tracker.get_value(), graph),
-                axes.i2gp(x_tracker.get_value() + dt, graph),
-                color=RED,
-            ).set_length(4)
+        sampled_graph = SampledGraph(axes, graph)
+        f_always(dot1.move_to, lambda: sampled_graph.point(x_tracker.get_value()))
+        f_always(dot2.move_to, lambda: sampled_graph.point(x_tracker.get_value() + dt))
+        line = Line(LEFT, RIGHT, color=RED)
+        line.add_updater(
+            lambda m: sampled_graph.put_secant_on(m, x_tracker.get_value(), dt, 4)
+        )
+        tangent = Line(LEFT, RIGHT, color=YELLOW)
+        tangent.add_updater(
+            lambda m: sampled_graph.put_tangent_on(m, x_tracker.get_value(), 4)
         )
 
         self.play(FadeIn(dot1), FadeIn(dot2), ShowCreation(line))
         self.play(x_tracker.animate.set_value(9), run_time=5)
         self.wait()
+        self.play(ShowCreation(tangent))
+        self.play(x_tracker.animate.set_value(0), run_time=5)
+        self.wait()
         self.play(
             FadeOut(axes),
             FadeOut(x_label),
@@ -122,6 +266,7 @@ class Lab1p2(Scene):
             FadeOut(dot1),
             FadeOut(dot2),
             FadeOut(line),
+            FadeOut(tangent),
         )
 
         # Derivative code
@@ -1,6 +1,24 @@
+import os
 from enum import Enum
+from typing import Callable, Optional
 from manimlib import *
 
+from labs.common.aeb import EmergencyBrake
+from labs.common.assets import get_image
+from labs.common.lidar import (
+    ScanBuffer,
+    best_window,
+    cast_scan,
+    extend_disparities,
+    farthest_beam,
+)
+from labs.common.obstacles import MovingObstacles, ObstacleField
+from labs.common.quality import get_quality
+from labs.common.race import FollowTheGapRace
+from labs.common.replay import LogReplay, fill_scan, replay_updater
+from labs.common.scenes import HoldFrameScene
+from labs.common.vehicle import BicycleModel
+
 
 class ObstacleType(Enum):
     POSITIVE_SPACE = 1
@@ -52,10 +70,39 @@ def get_is_in(*obstacles: tuple[Mobject, ObstacleType]):
     return is_in
 
 
-def ray_updater(
-    car: Mobject,
+def get_obstacle_field(
+    *obstacles: tuple[Mobject, ObstacleType],
+    moving: Optional[MovingObstacles] = None,
+) -> ObstacleField:
+    """
+    Same obstacles as get_is_in, as an ObstacleField for batched ray casting.
+
+    Args:
+        obstacles: tuples of (obstacle, obstacle_type) of Circles, Ellipses and
+                  Rectangles
+        moving: obstacles that move during the scene, seen by every query
+    """
+    field = ObstacleField(moving)
+    for obstacle, obstacle_type in obstacles:
+        negative = obstacle_type == ObstacleType.NEGATIVE_SPACE
+        if type(obstacle) is Circle:
+            field.add_circle(obstacle.get_center(), obstacle.get_radius(), negative)
+        elif type(obstacle) is Ellipse:
+            field.add_ellipse(
+                obstacle.get_center(),
+                (obstacle.get_width() / 2, obstacle.get_height() / 2),
+                negative,
+            )
+        elif type(obstacle) is Rectangle:
+            field.add_box(obstacle.get_corner(DL), obstacle.get_corner(UR), negative)
+        else:
+            raise TypeError(f"Unsupported obstacle {type(obstacle).__name__}")
+    return field
+
+
+def lidar_updater(
     car_angle: ValueTracker,
-    rays: list[Line],
+    scan: ScanBuffer,
     is_outside,
     max_ray_length=20,
     dx=0.1,
@@ -64,125 +111,118 @@ def ray_updater(
     threshold: float = 2.0,
     bubble_size: float = 0.3,
 ):
-    def update_rays(mob: Mobject, dt: float):
-        angles = np.linspace(
-            car_angle.get_value() - np.pi / 2,
-            car_angle.get_value() + np.pi / 2,
-            len(rays),
-        )
-        for ray, angle in zip(
-            rays,
-            angles,
-        ):
-            unit_vector = np.cos(angle) * RIGHT + np.sin(angle) * UP
-            for t in np.arange(0, max_ray_length, dx):
-                sample_point = car.get_center() + t * unit_vector
-
-                if is_outside(sample_point):
-                    low, high = t - dx, t
-                    for _ in range(binary_search_iterations):
-                        mid = (low + high) / 2
-                        mid_point = car.get_center() + mid * unit_vector
-                        if is_outside(mid_point):
-                            high = mid
-                        else:
-                            low = mid
-                    sample_point = car.get_center() + high * unit_vector
-                    ray.put_start_and_end_on(car.get_center(), sample_point)
-                    break
-
+    def update_scan(car: Mobject, dt: float):
+        scan.timestamp += dt
+        cast_scan(
+            scan,
+            car.get_center(),
+            car_angle.get_value(),
+            is_outside,
+            max_ray_length=max_ray_length,
+            dx=dx,
+            binary_search_iterations=binary_search_iterations,
+        )
         if use_disparity_extender:
-            lidar_range_array = np.array([ray.get_length() for ray in rays])
-            disparities = np.where(abs(np.diff(lidar_range_array)) > threshold)[0]
-            for d in disparities:
-                if lidar_range_array[d] < lidar_range_array[d + 1]:
-                    bubble_indices = int(
-                        bubble_size
-                        * len(lidar_range_array)
-                        / (lidar_range_array[d] * np.pi)
-                    )
-                    lidar_range_array[d + 1 : d + bubble_indices + 2] = (
-                        lidar_range_array[d]
-                    )
-                else:
-                    bubble_indices = int(
-                        bubble_size
-                        * len(lidar_range_array)
-                        / (lidar_range_array[d + 1] * np.pi)
-                    )
-                    lidar_range_array[d - bubble_indices : d + 1] = lidar_range_array[
-                        d + 1
-                    ]
-            for i, ray in enumerate(rays):
-                angle = angles[i]
-                unit_vector = np.cos(angle) * RIGHT + np.sin(angle) * UP
-                ray.put_start_and_end_on(
-                    car.get_center(),
-                    car.get_center() + lidar_range_array[i] * unit_vector,
-                )
+            extend_disparities(scan.ranges, threshold, bubble_size)
+
+    return update_scan
+
+
+def get_ray_indices(num_rays: int, num_beams: int) -> np.ndarray:
+    """Indices of the beams that are drawn when only num_rays rays are shown"""
+    return np.linspace(0, num_beams - 1, num_rays).round().astype(int)
+
+
+def ray_updater(rays: list[Line], scan: ScanBuffer):
+    ray_indices = get_ray_indices(len(rays), len(scan))
+
+    def update_rays(mob: Mobject, dt: float):
+        for ray, end in zip(rays, scan.get_endpoints()[ray_indices]):
+            ray.put_start_and_end_on(scan.origin, end)
 
     return update_rays
 
 
+def color_braking_rays(
+    rays: list[Line], danger: np.ndarray, color=RED, brake_color=PURPLE
+):
+    """Color the drawn rays of the beams that make the car brake"""
+    for ray, is_danger in zip(rays, danger[get_ray_indices(len(rays), len(danger))]):
+        ray.set_color(brake_color if is_danger else color)
+
+
 def car_updater(
     car_velocity: ValueTracker,
     car_angle: ValueTracker,
-    rays: list[Line],
+    scan: ScanBuffer,
+    rays: Optional[list[Line]] = None,
     window_approach: bool = False,
     window_size: int = 13,
+    brake: Optional[EmergencyBrake] = None,
 ):
-    previous_max_ray = None
+    """
+    Steer the car towards the farthest beam or best window of ``scan``. With a
+    ``brake`` the car stops for good once a beam's iTTC is too short to stop
+    in, and the rays of those beams turn purple.
+    """
+    previous_highlight = []
+    model = BicycleModel(max_acceleration=1.0, max_speed=1.0)
+    steering = 0.0
 
     def update_car(car: Mobject, dt: float):
-        nonlocal previous_max_ray
-        if car_velocity.get_value() < 1:
-            car_velocity.set_value(car_velocity.get_value() + dt)
+        nonlocal previous_highlight, steering
+        if not dt:
+            return
 
         if window_approach:
-            lidar_range_array = np.array([ray.get_length() for ray in rays])
-            best_index = 0
-            best_min_distance = 0.0
-
-            for i in range(len(lidar_range_array) - window_size + 1):
-                window = lidar_range_array[i : i + window_size]
-                min_distance = np.min(window)
-
-                if min_distance > best_min_distance:
-                    best_min_distance = min_distance
-                    best_index = i
-
-            if previous_max_ray is not None:
-                for ray in previous_max_ray:
-                    ray.set_color(RED)
-            previous_max_ray = rays[best_index : best_index + window_size]
-            for ray in rays[best_index : best_index + window_size]:
-                ray.set_color(YELLOW)
-            max_ray = rays[best_index + window_size // 2]
-            max_ray.set_color(BLUE)
-            target_angle = max_ray.get_angle()
+            best_index = best_window(scan.ranges, window_size)
+            target_index = best_index + window_size // 2
+            highlight = range(best_index, best_index + window_size)
         else:
-            max_ray = max(rays, key=lambda ray: ray.get_length())
-            if previous_max_ray is not None:
-                previous_max_ray.set_color(RED)
-            previous_max_ray = max_ray
-            max_ray.set_color(YELLOW)
-            target_angle = max_ray.get_angle()
-
+            target_index = farthest_beam(scan.ranges)
+            highlight = [target_index]
+        target_angle = scan.angles[target_index]
+        speed = model.max_speed
+        if brake is not None:
+            brake.step(scan.ranges, car_velocity.get_value())
+            speed = brake.get_speed(speed)
+
+        if rays is not None:
+            if brake is not None:
+                color_braking_rays(rays, brake.danger)
+            ray_scale = (len(rays) - 1) / max(len(scan) - 1, 1)
+            for i in previous_highlight:
+                rays[i].set_color(RED)
+            previous_highlight = sorted({round(i * ray_scale) for i in highlight})
+            for i in previous_highlight:
+                rays[i].set_color(YELLOW)
+            if window_approach:
+                rays[round(target_index * ray_scale)].set_color(BLUE)
+
+        # Turn towards the target at the same rate as before, through the model
         rotation = np.clip(
             0.1 * (target_angle - car_angle.get_value()), -2 * dt, 2 * dt
         )
-        car.rotate(rotation)
-        car_angle.increment_value(rotation)
-
-        forward_direction = np.array(
-            [np.cos(car_angle.get_value()), np.sin(car_angle.get_value()), 0]
+        x, y, _ = car.get_center()
+        state = np.array(
+            [x, y, car_angle.get_value(), car_velocity.get_value(), steering]
         )
-        car.shift(car_velocity.get_value() * dt * forward_direction)
+        new_state = model.step(
+            state,
+            model.steering_for_yaw_rate(rotation / dt, state[3]),
+            speed,
+            dt,
+        )
+        car.rotate(new_state[2] - state[2])
+        car.move_to([new_state[0], new_state[1], 0])
+        car_angle.set_value(new_state[2])
+        car_velocity.set_value(new_state[3])
+        steering = new_state[4]
 
     return update_car
 
 
-class Lab2(Scene):
+class Lab2(HoldFrameScene):
     def construct(self):
         # Title
         title = TexText("F1tenth Lab 2:").shift(1 * UP)
@@ -218,9 +258,7 @@ class Lab2(Scene):
         self.play(FadeOut(title2))
 
         # Visualize Naive Approach With Obstacles
-        car = (
-            ImageMobject("labs/lab1/car_topview.png").scale(0.1).shift(LEFT * 4 + DOWN)
-        )
+        car = get_image("labs/lab1/car_topview.png", height=0.4).shift(LEFT * 4 + DOWN)
         self.add(car)
         car_velocity = ValueTracker(0)
         car_angle = ValueTracker(0)
@@ -244,6 +282,7 @@ class Lab2(Scene):
             (bounding_rectangle, ObstacleType.NEGATIVE_SPACE),
         )
 
+        num_beams = 15
         rays = [
             Line(
                 car.get_center(),
@@ -251,19 +290,22 @@ class Lab2(Scene):
                 stroke_width=2,
                 color=RED,
             )
-            for _ in range(15)
+            for _ in range(get_quality().num_rays(num_beams))
         ]
         rays_group = VGroup(*rays)
-        rays_updater_instance = ray_updater(car, car_angle, rays, is_outside_track)
+        scan = ScanBuffer.empty(num_beams)
+        lidar_updater_instance = lidar_updater(car_angle, scan, is_outside_track)
+        rays_updater_instance = ray_updater(rays, scan)
 
         self.play(
             FadeIn(car),
             FadeIn(rays_group),
             Write(obstacles),
         )
+        car.add_updater(lidar_updater_instance)
         rays_group.add_updater(rays_updater_instance)
         self.wait()
-        car_updater_instance = car_updater(car_velocity, car_angle, rays)
+        car_updater_instance = car_updater(car_velocity, car_angle, scan, rays)
 
         car.add_updater(car_updater_instance)
         self.wait_until(
@@ -271,14 +313,14 @@ class Lab2(Scene):
             max_time=10,
         )
         car.remove_updater(car_updater_instance)
+        car.remove_updater(lidar_updater_instance)
         rays_group.remove_updater(rays_updater_instance)
         self.wait()
         self.play(FadeOut(car), FadeOut(rays_group), FadeOut(obstacles))
 
         # Visualize Naive Approach On Track
         car = (
-            ImageMobject("labs/lab1/car_topview.png")
-            .scale(0.1)
+            get_image("labs/lab1/car_topview.png", height=0.4)
             .rotate(PI / 2)
             .shift(LEFT * 2.5 + DOWN)
         )
@@ -293,6 +335,7 @@ class Lab2(Scene):
             (track_outer, ObstacleType.NEGATIVE_SPACE),
         )
 
+        num_beams = 15
         rays = [
             Line(
                 car.get_center(),
@@ -300,10 +343,13 @@ class Lab2(Scene):
                 stroke_width=2,
                 color=RED,
             )
-            for _ in range(15)
+            for _ in range(get_quality().num_rays(num_beams))
         ]
         rays_group = VGroup(*rays)
-        rays_updater_instance = ray_updater(car, car_angle, rays, is_outside_track)
+        scan = ScanBuffer.empty(num_beams)
+        lidar_updater_instance = lidar_updater(car_angle, scan, is_outside_track)
+        rays_updater_instance = ray_updater(rays, scan)
+        car.add_updater(lidar_updater_instance)
         rays_group.add_updater(rays_updater_instance)
 
         self.play(
@@ -312,7 +358,7 @@ class Lab2(Scene):
             Write(obstacles),
         )
         self.wait()
-        car_updater_instance = car_updater(car_velocity, car_angle, rays)
+        car_updater_instance = car_updater(car_velocity, car_angle, scan, rays)
 
         car.add_updater(car_updater_instance)
         self.wait_until(
@@ -320,6 +366,7 @@ class Lab2(Scene):
             max_time=10,
         )
         car.remove_updater(car_updater_instance)
+        car.remove_updater(lidar_updater_instance)
         rays_group.remove_updater(rays_updater_instance)
         self.wait()
         self.play(FadeOut(car), FadeOut(rays_group), FadeOut(obstacles))
@@ -348,9 +395,7 @@ class Lab2(Scene):
         self.play(FadeOut(title3))
 
         # Visualize Disparity Extender With Obstacles
-        car = (
-            ImageMobject("labs/lab1/car_topview.png").scale(0.1).shift(LEFT * 4 + DOWN)
-        )
+        car = get_image("labs/lab1/car_topview.png", height=0.4).shift(LEFT * 4 + DOWN)
         self.add(car)
         car_velocity = ValueTracker(0)
         car_angle = ValueTracker(0)
@@ -374,6 +419,7 @@ class Lab2(Scene):
             (bounding_rectangle, ObstacleType.NEGATIVE_SPACE),
         )
 
+        num_beams = 60
         rays = [
             Line(
                 car.get_center(),
@@ -381,21 +427,24 @@ class Lab2(Scene):
                 stroke_width=0.5,
                 color=RED,
             )
-            for _ in range(60)
+            for _ in range(get_quality().num_rays(num_beams))
         ]
         rays_group = VGroup(*rays)
-        rays_updater_instance = ray_updater(
-            car, car_angle, rays, is_outside_track, use_disparity_extender=True
+        scan = ScanBuffer.empty(num_beams)
+        lidar_updater_instance = lidar_updater(
+            car_angle, scan, is_outside_track, use_disparity_extender=True
         )
+        rays_updater_instance = ray_updater(rays, scan)
 
         self.play(
             FadeIn(car),
             FadeIn(rays_group),
             Write(obstacles),
         )
+        car.add_updater(lidar_updater_instance)
         rays_group.add_updater(rays_updater_instance)
         self.wait()
-        car_updater_instance = car_updater(car_velocity, car_angle, rays)
+        car_updater_instance = car_updater(car_velocity, car_angle, scan, rays)
 
         car.add_updater(car_updater_instance)
         self.wait_until(
@@ -403,14 +452,14 @@ class Lab2(Scene):
             max_time=10,
         )
         car.remove_updater(car_updater_instance)
+        car.remove_updater(lidar_updater_instance)
         rays_group.remove_updater(rays_updater_instance)
         self.wait()
         self.play(FadeOut(car), FadeOut(rays_group), FadeOut(obstacles))
 
         # Visualize Disparity Extender On Track
         car = (
-            ImageMobject("labs/lab1/car_topview.png")
-            .scale(0.1)
+            get_image("labs/lab1/car_topview.png", height=0.4)
             .rotate(PI / 2)
             .shift(LEFT * 2.5 + DOWN)
         )
@@ -425,6 +474,7 @@ class Lab2(Scene):
             (track_outer, ObstacleType.NEGATIVE_SPACE),
         )
 
+        num_beams = 60
         rays = [
             Line(
                 car.get_center(),
@@ -432,16 +482,18 @@ class Lab2(Scene):
                 stroke_width=0.5,
                 color=RED,
             )
-            for _ in range(60)
+            for _ in range(get_quality().num_rays(num_beams))
         ]
         rays_group = VGroup(*rays)
-        rays_updater_instance = ray_updater(
-            car,
+        scan = ScanBuffer.empty(num_beams)
+        lidar_updater_instance = lidar_updater(
             car_angle,
-            rays,
+            scan,
             is_outside_track,
             use_disparity_extender=True,
         )
+        rays_updater_instance = ray_updater(rays, scan)
+        car.add_updater(lidar_updater_instance)
         rays_group.add_updater(rays_updater_instance)
 
         self.play(
@@ -450,7 +502,7 @@ class Lab2(Scene):
             Write(obstacles),
         )
         self.wait()
-        car_updater_instance = car_updater(car_velocity, car_angle, rays)
+        car_updater_instance = car_updater(car_velocity, car_angle, scan, rays)
 
         car.add_updater(car_updater_instance)
         self.wait_until(
@@ -458,6 +510,7 @@ class Lab2(Scene):
             max_time=10,
         )
         car.remove_updater(car_updater_instance)
+        car.remove_updater(lidar_updater_instance)
         rays_group.remove_updater(rays_updater_instance)
         self.wait()
         self.play(FadeOut(car), FadeOut(rays_group), FadeOut(obstacles))
@@ -634,7 +687,7 @@ class Lab2(Scene):
 
         # Visualize Window Approach With Obstacles
         car = (
-            ImageMobject("labs/lab1/car_topview.png").scale(0.1).shift(LEFT * 4 + DOWN)
+            get_image("labs/lab1/car_topview.png", height=0.4).shift(LEFT * 4 + DOWN)
         ).rotate(np.pi / 4)
         self.add(car)
         car_velocity = ValueTracker(0)
@@ -659,6 +712,7 @@ class Lab2(Scene):
             (bounding_rectangle, ObstacleType.NEGATIVE_SPACE),
         )
 
+        num_beams = 60
         rays = [
             Line(
                 car.get_center(),
@@ -666,20 +720,23 @@ class Lab2(Scene):
                 stroke_width=0.5,
                 color=RED,
             )
-            for _ in range(60)
+            for _ in range(get_quality().num_rays(num_beams))
         ]
         rays_group = VGroup(*rays)
-        rays_updater_instance = ray_updater(car, car_angle, rays, is_outside_track)
+        scan = ScanBuffer.empty(num_beams)
+        lidar_updater_instance = lidar_updater(car_angle, scan, is_outside_track)
+        rays_updater_instance = ray_updater(rays, scan)
 
         self.play(
             FadeIn(car),
             FadeIn(rays_group),
             Write(obstacles),
         )
+        car.add_updater(lidar_updater_instance)
         rays_group.add_updater(rays_updater_instance)
         self.wait()
         car_updater_instance = car_updater(
-            car_velocity, car_angle, rays, window_approach=True
+            car_velocity, car_angle, scan, rays, window_approach=True
         )
 
         car.add_updater(car_updater_instance)
@@ -688,14 +745,14 @@ class Lab2(Scene):
             max_time=10,
         )
         car.remove_updater(car_updater_instance)
+        car.remove_updater(lidar_updater_instance)
         rays_group.remove_updater(rays_updater_instance)
         self.wait()
         self.play(FadeOut(car), FadeOut(rays_group), FadeOut(obstacles))
 
         # Visualize Window Approach On Track
         car = (
-            ImageMobject("labs/lab1/car_topview.png")
-            .scale(0.1)
+            get_image("labs/lab1/car_topview.png", height=0.4)
             .rotate(PI / 2)
             .shift(LEFT * 2.5 + DOWN)
         )
@@ -710,6 +767,7 @@ class Lab2(Scene):
             (track_outer, ObstacleType.NEGATIVE_SPACE),
         )
 
+        num_beams = 60
         rays = [
             Line(
                 car.get_center(),
@@ -717,10 +775,13 @@ class Lab2(Scene):
                 stroke_width=0.5,
                 color=RED,
             )
-            for _ in range(60)
+            for _ in range(get_quality().num_rays(num_beams))
         ]
         rays_group = VGroup(*rays)
-        rays_updater_instance = ray_updater(car, car_angle, rays, is_outside_track)
+        scan = ScanBuffer.empty(num_beams)
+        lidar_updater_instance = lidar_updater(car_angle, scan, is_outside_track)
+        rays_updater_instance = ray_updater(rays, scan)
+        car.add_updater(lidar_updater_instance)
         rays_group.add_updater(rays_updater_instance)
 
         self.play(
@@ -730,7 +791,7 @@ class Lab2(Scene):
         )
         self.wait()
         car_updater_instance = car_updater(
-            car_velocity, car_angle, rays, window_approach=True
+            car_velocity, car_angle, scan, rays, window_approach=True
         )
 
         car.add_updater(car_updater_instance)
@@ -739,6 +800,7 @@ class Lab2(Scene):
             max_time=10,
         )
         car.remove_updater(car_updater_instance)
+        car.remove_updater(lidar_updater_instance)
         rays_group.remove_updater(rays_updater_instance)
         self.wait()
         self.play(FadeOut(car), FadeOut(rays_group), FadeOut(obstacles))
@@ -746,3 +808,434 @@ class Lab2(Scene):
         # conclusion
         title = TexText("Thanks for Listening!")
         self.play(Write(title))
+
+
+def race_updater(
+    race: FollowTheGapRace,
+    cars: list[Mobject],
+    scans: Optional[dict[int, ScanBuffer]] = None,
+):
+    """
+    Step every car of ``race`` at once and move their images along, dimming the
+    cars that crashed. ``scans`` maps car indices to buffers to fill for ray
+    drawing.
+    """
+    headings = race.poses[:, 2].copy()
+
+    def update_race(group: Mobject, dt: float):
+        if dt == 0:
+            return
+        race.step(dt)
+        for i, car in enumerate(cars):
+            car.rotate(race.poses[i, 2] - headings[i])
+            car.move_to([race.poses[i, 0], race.poses[i, 1], 0])
+            if race.crashed[i]:
+                car.set_opacity(0.3)
+        headings[:] = race.poses[:, 2]
+        for i, scan in (scans or {}).items():
+            scan.timestamp = race.time
+            scan.origin[:2] = race.poses[i, :2]
+            scan.set_angles(race.angles[i])
+            scan.ranges[:] = race.ranges[i]
+
+    return update_race
+
+
+# Color of the rays of each Follow the Gap policy in the race scenes
+POLICY_COLORS = {"naive": RED, "disparity": YELLOW, "window": BLUE}
+
+
+def make_race_track() -> tuple[VGroup, ObstacleField]:
+    """The elliptical race track, drawn and as the field the cars drive in"""
+    track_outer = Ellipse(width=13, height=7.5, stroke_color=WHITE, stroke_width=4)
+    track_inner = Ellipse(width=8, height=3, stroke_color=WHITE, stroke_width=4)
+    field = get_obstacle_field(
+        (track_inner, ObstacleType.POSITIVE_SPACE),
+        (track_outer, ObstacleType.NEGATIVE_SPACE),
+    )
+    return VGroup(track_outer, track_inner), field
+
+
+def make_track_poses(num_cars: int) -> np.ndarray:
+    """(C, 3) poses evenly spaced on the center line of the track, heading along it"""
+    t = np.linspace(0, 2 * np.pi, num_cars, endpoint=False)
+    a, b = 5.25, 2.625
+    return np.stack(
+        [a * np.cos(t), b * np.sin(t), np.arctan2(b * np.cos(t), -a * np.sin(t))],
+        axis=1,
+    )
+
+
+def make_race_cars(poses: np.ndarray, height: float = 0.3) -> list[Mobject]:
+    """A car image at every pose"""
+    return [
+        get_image("labs/lab1/car_topview.png", height=height)
+        .rotate(pose[2])
+        .move_to([pose[0], pose[1], 0])
+        for pose in poses
+    ]
+
+
+def make_policy_rays(
+    race: FollowTheGapRace, cars: list[Mobject], colors: dict[str, str]
+) -> tuple[dict[int, ScanBuffer], dict[int, VGroup]]:
+    """
+    Rays in its color for the first car of every policy in ``colors``.
+
+    Returns:
+        (scans, rays_groups), both keyed by car index, with the scans for
+        race_updater to fill and the rays following them
+    """
+    num_beams = race.angles.shape[1]
+    scans, rays_groups = {}, {}
+    for policy, color in colors.items():
+        indices = np.flatnonzero(race.policies == policy)
+        if len(indices) == 0:
+            continue
+        i = int(indices[0])
+        scans[i] = ScanBuffer.empty(num_beams)
+        rays = [
+            Line(
+                cars[i].get_center(),
+                cars[i].get_center(),
+                stroke_width=0.5,
+                color=color,
+            )
+            for _ in range(get_quality().num_rays(num_beams))
+        ]
+        rays_groups[i] = VGroup(*rays)
+        rays_groups[i].add_updater(ray_updater(rays, scans[i]))
+    return scans, rays_groups
+
+
+class Lab2Race(HoldFrameScene):
+    """
+    Twenty Follow the Gap cars on one track, each treating the others as
+    moving obstacles. The naive, disparity extender and best window policies
+    alternate between cars, and one car of each shows its rays.
+    """
+
+    def construct(self):
+        title = TexText("Follow The Gap Race")
+        self.play(Write(title))
+        self.wait()
+        self.play(FadeOut(title))
+
+        obstacles, field = make_race_track()
+        num_cars = 20
+        policies = list(POLICY_COLORS)
+        poses = make_track_poses(num_cars)
+        race = FollowTheGapRace(
+            field,
+            poses,
+            policies=[policies[i % len(policies)] for i in range(num_cars)],
+            num_beams=60,
+        )
+        cars = make_race_cars(poses)
+        cars_group = Group(*cars)
+
+        legend = VGroup(
+            *[
+                TexText(name, color=POLICY_COLORS[policy]).scale(0.6)
+                for policy, name in zip(
+                    policies, ["Naive", "Disparity Extender", "Best Window"]
+                )
+            ]
+        ).arrange(DOWN)
+
+        scans, rays_groups = make_policy_rays(race, cars, POLICY_COLORS)
+        rays = VGroup(*rays_groups.values())
+
+        self.play(Write(obstacles), FadeIn(cars_group), Write(legend))
+        self.wait()
+
+        race_updater_instance = race_updater(race, cars, scans)
+        cars_group.add_updater(race_updater_instance)
+        self.add(rays)
+        self.wait_until(lambda: race.crashed.all(), max_time=30)
+        cars_group.remove_updater(race_updater_instance)
+        for rays_group in rays:
+            rays_group.clear_updaters()
+        self.wait()
+        self.play(
+            FadeOut(cars_group),
+            FadeOut(rays),
+            FadeOut(obstacles),
+            FadeOut(legend),
+        )
+
+
+def moving_obstacle_updater(
+    moving: MovingObstacles, obstacles: list[Mobject], paths: list[Callable]
+):
+    """
+    Move every obstacle along its path, a function of time returning (x, y),
+    and update ``moving`` with the new positions.
+    """
+    indices = np.arange(len(obstacles))
+    time = 0.0
+
+    def update_obstacles(group: Mobject, dt: float):
+        nonlocal time
+        time += dt
+        centers = np.array([path(time) for path in paths])
+        moving.move(indices, centers)
+        for obstacle, center in zip(obstacles, centers):
+            obstacle.move_to([center[0], center[1], 0])
+
+    return update_obstacles
+
+
+class Lab2MovingObstacles(HoldFrameScene):
+    """
+    Follow the Gap between obstacles that sweep across the room on scripted
+    paths. The obstacles are moved in the spatial index every frame, so the
+    rays and collisions of the cars always see where they are now.
+    """
+
+    def construct(self):
+        title = TexText("Moving Obstacles")
+        self.play(Write(title))
+        self.wait()
+        self.play(FadeOut(title))
+
+        bounding_rectangle = Rectangle(width=12, height=6)
+        moving = MovingObstacles(
+            bounding_rectangle.get_corner(DL),
+            bounding_rectangle.get_corner(UR),
+            cell_size=0.5,
+        )
+        field = get_obstacle_field(
+            (bounding_rectangle, ObstacleType.NEGATIVE_SPACE), moving=moving
+        )
+
+        radius = 0.5
+        paths = [
+            lambda t, x=x, phase=phase: (x, 2 * np.sin(0.6 * t + phase))
+            for x, phase in zip([-3, -1.5, 0, 1.5, 3], [0, 2, 4, 1, 3])
+        ]
+        obstacles = []
+        for path in paths:
+            center = path(0)
+            moving.add(center, radius)
+            obstacles.append(
+                Circle(radius=radius, stroke_color=WHITE, stroke_width=4).move_to(
+                    [center[0], center[1], 0]
+                )
+            )
+        obstacles_group = VGroup(*obstacles)
+
+        poses = np.array([[-5, -2, 0], [-5, 0, 0], [-5, 2, 0]], dtype=float)
+        race = FollowTheGapRace(
+            field, poses, policies=list(POLICY_COLORS), num_beams=60
+        )
+        cars = make_race_cars(poses, height=0.4)
+        cars_group = Group(*cars)
+        scans, rays_groups = make_policy_rays(race, cars, POLICY_COLORS)
+        rays = VGroup(*rays_groups.values())
+
+        self.play(Write(bounding_rectangle), Write(obstacles_group), FadeIn(cars_group))
+        self.wait()
+
+        obstacles_updater_instance = moving_obstacle_updater(moving, obstacles, paths)
+        race_updater_instance = race_updater(race, cars, scans)
+        obstacles_group.add_updater(obstacles_updater_instance)
+        cars_group.add_updater(race_updater_instance)
+        self.add(rays)
+        self.wait_until(lambda: race.crashed.all(), max_time=20)
+        obstacles_group.remove_updater(obstacles_updater_instance)
+        cars_group.remove_updater(race_updater_instance)
+        for rays_group in rays:
+            rays_group.clear_updaters()
+        self.wait()
+        self.play(
+            FadeOut(cars_group),
+            FadeOut(rays),
+            FadeOut(obstacles_group),
+            FadeOut(bounding_rectangle),
+        )
+
+
+def race_ttc_updater(race: FollowTheGapRace, index: int, rays: list[Line], color):
+    """Color the rays of car ``index`` of ``race`` that make it brake"""
+
+    def update_colors(mob: Mobject):
+        color_braking_rays(rays, race.danger[index], color=color)
+
+    return update_colors
+
+
+class Lab2EmergencyBraking(HoldFrameScene):
+    """
+    Automatic emergency braking on the instantaneous time to collision of each
+    beam, first for the naive car in the obstacle room, then for the race,
+    where the rays of beams about to collide turn purple.
+    """
+
+    def construct(self):
+        title = TexText("Automatic Emergency Braking")
+        self.play(Write(title))
+        self.wait()
+        title2 = TexText(
+            "Automatic Emergency Braking:\\\\",
+            "1. Time to collision of each ray: $r / \\max(v \\cos\\theta, 0)$\\\\",
+            "2. Brake when a ray is shorter than the distance it takes to stop",
+        )
+        self.play(TransformMatchingTex(title, title2))
+        self.wait()
+        self.play(FadeOut(title2))
+
+        # Naive Approach With Emergency Braking
+        car = get_image("labs/lab1/car_topview.png", height=0.4).shift(LEFT * 4 + DOWN)
+        car_velocity = ValueTracker(0)
+        car_angle = ValueTracker(0)
+
+        bounding_rectangle = Rectangle(width=12, height=6)
+        obstacle_1 = Circle(radius=1, stroke_color=WHITE, stroke_width=4).shift(
+            RIGHT * 2 + UP * 2
+        )
+        obstacle_2 = Circle(radius=1.5, stroke_color=WHITE, stroke_width=4).shift(
+            DOWN * 1.5
+        )
+        obstacle_3 = Circle(radius=1, stroke_color=WHITE, stroke_width=4).shift(
+            LEFT * 2 + UP * 0.5
+        )
+        obstacles = VGroup(bounding_rectangle, obstacle_1, obstacle_2, obstacle_3)
+        is_outside_track = get_is_in(
+            (obstacle_1, ObstacleType.POSITIVE_SPACE),
+            (obstacle_2, ObstacleType.POSITIVE_SPACE),
+            (obstacle_3, ObstacleType.POSITIVE_SPACE),
+            (bounding_rectangle, ObstacleType.NEGATIVE_SPACE),
+        )
+
+        num_beams = 31
+        # The beams of cast_scan cover pi, centered on the heading
+        # Braking at the car's acceleration of 1 to stop 0.4 short of
+        # obstacles, a bit more than half a car length, with 0.1 s to react
+        brake = EmergencyBrake(
+            np.linspace(-np.pi / 2, np.pi / 2, num_beams),
+            threshold=0.1,
+            max_deceleration=1.0,
+            margin=0.4,
+        )
+        rays = [
+            Line(car.get_center(), car.get_center(), stroke_width=2, color=RED)
+            for _ in range(get_quality().num_rays(num_beams))
+        ]
+        rays_group = VGroup(*rays)
+        scan = ScanBuffer.empty(num_beams)
+        lidar_updater_instance = lidar_updater(car_angle, scan, is_outside_track)
+        rays_updater_instance = ray_updater(rays, scan)
+
+        self.play(FadeIn(car), FadeIn(rays_group), Write(obstacles))
+        car.add_updater(lidar_updater_instance)
+        rays_group.add_updater(rays_updater_instance)
+        self.wait()
+        car_updater_instance = car_updater(
+            car_velocity, car_angle, scan, rays, brake=brake
+        )
+        car.add_updater(car_updater_instance)
+        self.wait_until(
+            lambda: (
+                (brake.braking and car_velocity.get_value() <= 0)
+                or sum(is_outside_track(corner) for corner in car.get_points()) >= 1
+            ),
+            max_time=10,
+        )
+        car.remove_updater(car_updater_instance)
+        car.remove_updater(lidar_updater_instance)
+        rays_group.remove_updater(rays_updater_instance)
+        self.wait()
+        self.play(FadeOut(car), FadeOut(rays_group), FadeOut(obstacles))
+
+        # Race With Emergency Braking
+        obstacles, field = make_race_track()
+        num_cars = 20
+        policies = list(POLICY_COLORS)
+        poses = make_track_poses(num_cars)
+        race = FollowTheGapRace(
+            field,
+            poses,
+            policies=[policies[i % len(policies)] for i in range(num_cars)],
+            num_beams=60,
+            ttc_threshold=0.1,
+        )
+        cars = make_race_cars(poses)
+        cars_group = Group(*cars)
+        scans, rays_groups = make_policy_rays(race, cars, POLICY_COLORS)
+        for i, rays_group in rays_groups.items():
+            rays_group.add_updater(
+                race_ttc_updater(
+                    race, i, list(rays_group), POLICY_COLORS[race.policies[i]]
+                )
+            )
+        rays = VGroup(*rays_groups.values())
+
+        self.play(Write(obstacles), FadeIn(cars_group))
+        self.wait()
+
+        race_updater_instance = race_updater(race, cars, scans)
+        cars_group.add_updater(race_updater_instance)
+        self.add(rays)
+        self.wait_until(
+            lambda: (race.crashed | (race.braking & (race.states[:, 3] <= 0))).all(),
+            max_time=30,
+        )
+        cars_group.remove_updater(race_updater_instance)
+        for rays_group in rays:
+            rays_group.clear_updaters()
+        self.wait()
+        self.play(
+            FadeOut(cars_group),
+            FadeOut(rays),
+            FadeOut(obstacles),
+        )
+
+
+class Lab2Replay(HoldFrameScene):
+    """
+    Replay a recorded lap with its LiDAR rays.
+
+    Set REPLAY_LOG to a CSV or NPY log with time, x, y, heading and range_0 ...
+    range_n columns, e.g. exported from a rosbag of the real car.
+    """
+
+    def construct(self):
+        replay = LogReplay(os.environ["REPLAY_LOG"])
+        start = replay.sample(replay.start_time)
+
+        car = (
+            get_image("labs/lab1/car_topview.png", height=0.4)
+            .move_to([start["x"], start["y"], 0])
+            .rotate(start["heading"])
+        )
+        # Pose only logs have no range columns, and get no rays
+        num_beams = len(start.get("ranges", []))
+        rays = [
+            Line(
+                car.get_center(),
+                car.get_center(),
+                stroke_width=0.5,
+                color=RED,
+            )
+            for _ in range(get_quality().num_rays(num_beams) if num_beams else 0)
+        ]
+        rays_group = VGroup(*rays)
+        scan = fill_scan(ScanBuffer.empty(num_beams), start) if rays else None
+        if scan is not None:
+            rays_group.add_updater(ray_updater(rays, scan))
+
+        self.play(FadeIn(car), FadeIn(rays_group))
+
+        follow_log = replay_updater(
+            replay,
+            heading=start["heading"],
+            on_sample=lambda sample: fill_scan(scan, sample) if rays else None,
+        )
+        car.add_updater(follow_log)
+        self.wait_until(
+            lambda: follow_log not in car.updaters, max_time=replay.duration + 1
+        )
+        rays_group.clear_updaters()
+        self.wait()
+        self.play(FadeOut(car), FadeOut(rays_group))
@@ -0,0 +1,224 @@
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+from scipy.ndimage import distance_transform_edt
+
+
+@dataclass
+class MatchResult:
+    """
+    Args:
+        pose: (x, y, theta) of the matched scan in the reference frame, ready
+            for PoseGraph.add_edge(reference, matched, pose)
+        score: mean likelihood of the matched points, between 0 and 1
+        num_evaluated: candidate poses scored, at any resolution
+    """
+
+    pose: np.ndarray
+    score: float
+    num_evaluated: int
+
+
+@dataclass
+class _SearchState:
+    """Best full-resolution candidate of one match and the work done so far"""
+
+    score: float
+    best: Optional[tuple[int, np.ndarray]] = None
+    num_evaluated: int = 0
+
+
+class CorrelativeScanMatcher:
+    """
+    Correlative scan matcher: finds the pose of a scan that best overlaps a
+    reference scan within a search window, without needing a good initial
+    guess.
+
+    The reference points are rasterized into a likelihood grid that falls off
+    with the distance to the nearest point. Level h of a precomputed pyramid
+    holds, for every cell, the maximum of the grid over the 2^h by 2^h block
+    starting there, so scoring a translation on level h bounds the score of
+    every finer translation in that block. Branch and bound over those levels
+    then only refines the blocks that can still beat the best full-resolution
+    match found so far.
+
+    Args:
+        reference: (N, 2) points of the reference scan in its sensor frame,
+            e.g. from ScanPreprocessor.process
+        resolution: side of a cell of the finest level in meters
+        num_levels: levels of the pyramid, the coarsest has 2^(num_levels-1)
+            cell blocks
+        sigma: distance in meters at which the likelihood drops to exp(-1/2)
+        margin: meters the grid extends past the reference points
+    """
+
+    def __init__(
+        self,
+        reference: np.ndarray,
+        resolution: float = 0.05,
+        num_levels: int = 6,
+        sigma: float = 0.1,
+        margin: float = 1.0,
+    ):
+        reference = np.asarray(reference, float)[:, :2]
+        self.resolution = resolution
+        self.num_levels = num_levels
+        # One empty cell below the points and a full coarse block above them,
+        # so clipped lookups read zeros and every block stays inside the grid
+        self.origin = reference.min(axis=0) - margin - resolution
+        size = (
+            np.ceil((reference.max(axis=0) + margin - self.origin) / resolution).astype(
+                int
+            )
+            + 2 ** (num_levels - 1)
+            + 1
+        )
+        occupied = np.ones(size, dtype=bool)
+        cells = np.floor((reference - self.origin) / resolution).astype(int)
+        occupied[cells[:, 0], cells[:, 1]] = False
+        distance = distance_transform_edt(occupied) * resolution
+        grid = np.exp(-0.5 * (distance / sigma) ** 2).astype(np.float32)
+        grid[0, :] = grid[:, 0] = 0
+        grid[-(2 ** (num_levels - 1)) - 1 :, :] = 0
+        grid[:, -(2 ** (num_levels - 1)) - 1 :] = 0
+
+        self.levels = [grid]
+        for h in range(1, num_levels):
+            width = 2 ** (h - 1)
+            previous = self.levels[-1]
+            level = previous.copy()
+            level[:-width] = np.maximum(previous[:-width], previous[width:])
+            coarse = level.copy()
+            coarse[:, :-width] = np.maximum(level[:, :-width], level[:, width:])
+            self.levels.append(coarse)
+
+    def _score(
+        self, level: int, cells: np.ndarray, rotations: np.ndarray, offsets: np.ndarray
+    ) -> np.ndarray:
+        """Mean value on ``level`` of the points of each (rotation, offset)"""
+        grid = self.levels[level]
+        x = np.clip(cells[rotations, :, 0] + offsets[:, :1], 0, grid.shape[0] - 1)
+        y = np.clip(cells[rotations, :, 1] + offsets[:, 1:], 0, grid.shape[1] - 1)
+        return grid[x, y].mean(axis=1)
+
+    def _rotated_cells(
+        self, points: np.ndarray, initial_pose, angular_window: float
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Candidate angles and the grid cell of every point at each of them"""
+        max_range = max(np.hypot(points[:, 0], points[:, 1]).max(), self.resolution)
+        # Smallest turn that moves the furthest point by a whole cell
+        step = np.arccos(1 - self.resolution**2 / (2 * max_range**2))
+        num_steps = int(np.ceil(angular_window / step))
+        angles = initial_pose[2] + step * np.arange(-num_steps, num_steps + 1)
+        c, s = np.cos(angles)[:, None], np.sin(angles)[:, None]
+        rotated = np.stack(
+            [
+                c * points[:, 0] - s * points[:, 1],
+                s * points[:, 0] + c * points[:, 1],
+            ],
+            axis=-1,
+        )
+        cells = np.floor(
+            (rotated + np.asarray(initial_pose[:2]) - self.origin) / self.resolution
+        ).astype(np.int32)
+        return angles, cells
+
+    def match(
+        self,
+        points: np.ndarray,
+        initial_pose=(0.0, 0.0, 0.0),
+        linear_window: float = 1.0,
+        angular_window: float = np.radians(30),
+        min_score: float = 0.0,
+    ) -> MatchResult:
+        """
+        Best pose of ``points`` within the windows around ``initial_pose``.
+
+        Args:
+            points: (N, 2) scan points in their sensor frame, preprocessed
+                like the reference
+            initial_pose: (x, y, theta) to center the search on
+            linear_window: search +- this many meters in x and y
+            angular_window: search +- this many radians
+            min_score: only accept matches scoring above this
+        """
+        points = np.asarray(points, float)[:, :2]
+        angles, cells = self._rotated_cells(points, initial_pose, angular_window)
+        reach = int(np.ceil(linear_window / self.resolution))
+        top = self.num_levels - 1
+        block = 2**top
+        starts = np.arange(-reach, reach + 1, block)
+        rotations, dx, dy = np.meshgrid(
+            np.arange(len(angles)), starts, starts, indexing="ij"
+        )
+        rotations, offsets = rotations.ravel(), np.stack([dx.ravel(), dy.ravel()], 1)
+        scores = self._score(top, cells, rotations, offsets)
+        state = _SearchState(min_score, num_evaluated=len(scores))
+        self._search(state, cells, reach, top, rotations, offsets, scores)
+
+        if state.best is None:
+            return MatchResult(
+                np.asarray(initial_pose, float), 0.0, state.num_evaluated
+            )
+        rotation, offset = state.best
+        pose = np.array(
+            [
+                initial_pose[0] + offset[0] * self.resolution,
+                initial_pose[1] + offset[1] * self.resolution,
+                angles[rotation],
+            ]
+        )
+        return MatchResult(pose, float(state.score), state.num_evaluated)
+
+    def _search(
+        self, state: _SearchState, cells, reach, level, rotations, offsets, scores
+    ) -> None:
+        """Depth first branch and bound, best scoring candidates first"""
+        for k in np.argsort(-scores):
+            if scores[k] <= state.score:
+                return
+            if level == 0:
+                state.score = scores[k]
+                state.best = (rotations[k], offsets[k])
+                return
+            half = 2 ** (level - 1)
+            children = offsets[k] + np.array(
+                [[0, 0], [0, half], [half, 0], [half, half]]
+            )
+            children = children[(children <= reach).all(axis=1)]
+            child_rotations = np.full(len(children), rotations[k])
+            child_scores = self._score(level - 1, cells, child_rotations, children)
+            state.num_evaluated += len(children)
+            self._search(
+                state, cells, reach, level - 1, child_rotations, children, child_scores
+            )
+
+    def match_exhaustive(
+        self,
+        points: np.ndarray,
+        initial_pose=(0.0, 0.0, 0.0),
+        linear_window: float = 1.0,
+        angular_window: float = np.radians(30),
+    ) -> MatchResult:
+        """Brute force version of match that scores every candidate, for testing"""
+        points = np.asarray(points, float)[:, :2]
+        angles, cells = self._rotated_cells(points, initial_pose, angular_window)
+        reach = int(np.ceil(linear_window / self.resolution))
+        dx, dy = np.meshgrid(np.arange(-reach, reach + 1), np.arange(-reach, reach + 1))
+        offsets = np.stack([dx.ravel(), dy.ravel()], 1)
+        best = (-1.0, 0, offsets[0])
+        for rotation in range(len(angles)):
+            scores = self._score(0, cells, np.full(len(offsets), rotation), offsets)
+            k = np.argmax(scores)
+            if scores[k] > best[0]:
+                best = (scores[k], rotation, offsets[k])
+        score, rotation, offset = best
+        pose = np.array(
+            [
+                initial_pose[0] + offset[0] * self.resolution,
+                initial_pose[1] + offset[1] * self.resolution,
+                angles[rotation],
+            ]
+        )
+        return MatchResult(pose, float(score), len(angles) * len(offsets))
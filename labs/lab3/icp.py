@@ -0,0 +1,159 @@
+from dataclasses import dataclass, field
+from typing import Optional
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+def make_transform(x: float, y: float, theta: float) -> np.ndarray:
+    """3x3 homogeneous transform of a 2D pose"""
+    c, s = np.cos(theta), np.sin(theta)
+    return np.array([[c, -s, x], [s, c, y], [0, 0, 1]])
+
+
+def apply_transform(transform: np.ndarray, points: np.ndarray) -> np.ndarray:
+    """Apply a 3x3 homogeneous transform to (N, 2) points"""
+    return points @ transform[:2, :2].T + transform[:2, 2]
+
+
+def estimate_normals(points: np.ndarray, tree: cKDTree, k: int = 5) -> np.ndarray:
+    """Unit normals of (N, 2) points from the covariance of their k neighbours"""
+    _, neighbours = tree.query(points, k=min(k, len(points)))
+    centered = points[neighbours] - points[neighbours].mean(axis=1, keepdims=True)
+    sxx = np.einsum("nk,nk->n", centered[..., 0], centered[..., 0])
+    syy = np.einsum("nk,nk->n", centered[..., 1], centered[..., 1])
+    sxy = np.einsum("nk,nk->n", centered[..., 0], centered[..., 1])
+    # Closed form of the principal axis of a 2x2 covariance matrix
+    angle = 0.5 * np.arctan2(2 * sxy, sxx - syy)
+    return np.stack([-np.sin(angle), np.cos(angle)], axis=1)
+
+
+def _point_to_point_step(source: np.ndarray, target: np.ndarray) -> np.ndarray:
+    """Align centroids, then find the rotation with an SVD"""
+    source_center = source.mean(axis=0)
+    target_center = target.mean(axis=0)
+    covariance = (source - source_center).T @ (target - target_center)
+    u, _, vt = np.linalg.svd(covariance)
+    rotation = vt.T @ u.T
+    if np.linalg.det(rotation) < 0:
+        vt[1] *= -1
+        rotation = vt.T @ u.T
+    step = np.eye(3)
+    step[:2, :2] = rotation
+    step[:2, 2] = target_center - rotation @ source_center
+    return step
+
+
+def _point_to_line_step(
+    source: np.ndarray, target: np.ndarray, normals: np.ndarray
+) -> np.ndarray:
+    """Linearized least squares for (x, y, theta) along the target normals"""
+    cross = source[:, 0] * normals[:, 1] - source[:, 1] * normals[:, 0]
+    A = np.column_stack([normals, cross])
+    b = np.einsum("ni,ni->n", normals, target - source)
+    x, y, theta = np.linalg.lstsq(A, b, rcond=None)[0]
+    return make_transform(x, y, theta)
+
+
+@dataclass
+class ICPResult:
+    """
+    Outcome of an ICP alignment.
+
+    Args:
+        transform: 3x3 transform taking source points onto the target
+        residuals: RMS correspondence distance of the inliers at each iteration
+        transforms: estimate of the transform after each iteration
+        converged: whether the residual stopped changing before max_iterations
+        inliers: mask of source points used in the last iteration
+    """
+
+    transform: np.ndarray
+    residuals: list[float] = field(default_factory=list)
+    transforms: list[np.ndarray] = field(default_factory=list)
+    converged: bool = False
+    inliers: Optional[np.ndarray] = None
+
+    @property
+    def num_iterations(self) -> int:
+        return len(self.residuals)
+
+
+def icp(
+    source: np.ndarray,
+    target: np.ndarray,
+    initial_transform: Optional[np.ndarray] = None,
+    method: str = "point_to_point",
+    max_iterations: int = 30,
+    tolerance: float = 1e-6,
+    max_correspondence_distance: float = np.inf,
+    inlier_fraction: float = 1.0,
+    target_tree: Optional[cKDTree] = None,
+    target_normals: Optional[np.ndarray] = None,
+) -> ICPResult:
+    """
+    Align a 2D source point cloud to a target point cloud with iterative closest
+    point.
+
+    Each iteration associates every source point with its nearest target point
+    through a KD-tree, drops pairs further apart than
+    ``max_correspondence_distance`` and all but the closest ``inlier_fraction``
+    of pairs, and solves for the transform that best aligns the rest.
+
+    Args:
+        source: (N, 2) points to move, e.g. a scan from ScanPreprocessor.process
+        target: (M, 2) points to align to
+        initial_transform: 3x3 initial guess, identity by default
+        method: "point_to_point" (SVD) or "point_to_line" (distance along the
+            target normals)
+        max_iterations: iteration limit
+        tolerance: stop once the RMS residual changes by less than this
+        max_correspondence_distance: pairs further apart are outliers
+        inlier_fraction: fraction of the closest pairs to keep each iteration
+        target_tree: prebuilt cKDTree of the target, to reuse across calls
+        target_normals: precomputed normals of the target for point_to_line
+    """
+    if method not in ("point_to_point", "point_to_line"):
+        raise ValueError(f"Unknown ICP method {method!r}")
+    source = np.asarray(source, dtype=float)[:, :2]
+    target = np.asarray(target, dtype=float)[:, :2]
+    tree = target_tree if target_tree is not None else cKDTree(target)
+    normals = target_normals
+    if method == "point_to_line" and normals is None:
+        normals = estimate_normals(target, tree)
+    transform = np.eye(3) if initial_transform is None else initial_transform.copy()
+    result = ICPResult(transform)
+
+    for _ in range(max_iterations):
+        moved = apply_transform(transform, source)
+        distances, indices = tree.query(
+            moved, distance_upper_bound=max_correspondence_distance
+        )
+        inliers = np.isfinite(distances)
+        if inlier_fraction < 1.0 and inliers.any():
+            cutoff = np.quantile(distances[inliers], inlier_fraction)
+            inliers &= distances <= cutoff
+        if inliers.sum() < 3:
+            break
+        matched = target[indices[inliers]]
+        if method == "point_to_point":
+            step = _point_to_point_step(moved[inliers], matched)
+        else:
+            step = _point_to_line_step(
+                moved[inliers], matched, normals[indices[inliers]]
+            )
+        transform = step @ transform
+
+        residual = float(np.sqrt(np.mean(distances[inliers] ** 2)))
+        result.residuals.append(residual)
+        result.transforms.append(transform)
+        result.inliers = inliers
+        if (
+            len(result.residuals) > 1
+            and abs(result.residuals[-2] - residual) < tolerance
+        ):
+            result.converged = True
+            break
+
+    result.transform = transform
+    return result
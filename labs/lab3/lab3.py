@@ -0,0 +1,179 @@
+from manimlib import *
+from scipy.spatial import cKDTree
+
+from labs.common.lidar import cast_rays_against_segments, polylines_to_segments
+from labs.common.scenes import HoldFrameScene
+from labs.lab3.icp import apply_transform, icp, make_transform
+from labs.lab3.point_cloud import ScanPreprocessor
+from labs.lab3.pose_graph import PoseGraph, compose_pose, optimize, relative_pose
+
+ROOM = np.array(
+    [[-5, -3], [5, -3], [5, 3], [1, 3], [1, 1], [-1, 1], [-1, 3], [-5, 3], [-5, -3]]
+)
+# Every beam is drawn, so the scans are not thinned out
+PREPROCESSOR = ScanPreprocessor(voxel_size=0)
+
+
+def scan_room(
+    room: np.ndarray, pose: tuple[float, float, float], num_beams: int = 180
+) -> np.ndarray:
+    """LiDAR points seen from a pose in the room, in the sensor frame"""
+    angles = np.linspace(-0.75 * PI, 0.75 * PI, num_beams)
+    ranges = cast_rays_against_segments(
+        pose[:2], angles + pose[2], polylines_to_segments([room])
+    )
+    return PREPROCESSOR.process(ranges, angles[0], angles[1] - angles[0])
+
+
+def to_scene_points(points: np.ndarray) -> np.ndarray:
+    return np.hstack([points, np.zeros((len(points), 1))])
+
+
+class ICPScene(HoldFrameScene):
+    def construct(self):
+        # Title
+        title = TexText("Iterative Closest Point")
+        self.play(Write(title))
+        self.wait()
+        self.play(FadeOut(title))
+
+        # Two scans of the same room
+        pose_a = (-2.0, -1.0, 0.0)
+        pose_b = (-1.4, -1.3, 0.25)
+        target = scan_room(ROOM, pose_a)
+        source = scan_room(ROOM, pose_b)
+        world_from_a = make_transform(*pose_a)
+
+        room = VMobject(stroke_width=2, stroke_opacity=0.3).set_points_as_corners(
+            to_scene_points(ROOM)
+        )
+        target_dots = DotCloud(
+            to_scene_points(apply_transform(world_from_a, target)),
+            color=BLUE,
+            radius=0.04,
+        )
+        source_dots = DotCloud(
+            to_scene_points(apply_transform(world_from_a, source)),
+            color=RED,
+            radius=0.04,
+        )
+        residual_label = Text("RMS error: ", font_size=30).to_corner(UL)
+        residual_value = DecimalNumber(0, font_size=30).next_to(residual_label, RIGHT)
+
+        self.play(ShowCreation(room))
+        self.play(FadeIn(target_dots), FadeIn(source_dots))
+        self.wait()
+
+        # Iterate: associate, then align
+        result = icp(source, target, method="point_to_point", max_iterations=15)
+        tree = cKDTree(target)
+        target_points = to_scene_points(apply_transform(world_from_a, target))
+        previous = np.eye(3)
+        self.play(Write(residual_label), FadeIn(residual_value))
+        for transform, residual in zip(result.transforms, result.residuals):
+            moved = apply_transform(previous, source)
+            _, indices = tree.query(moved)
+            moved_points = to_scene_points(apply_transform(world_from_a, moved))
+            correspondences = VGroup(
+                *[
+                    Line(
+                        moved_points[i],
+                        target_points[indices[i]],
+                        stroke_width=1,
+                        color=GREY,
+                    )
+                    for i in range(0, len(moved), 6)
+                ]
+            )
+            self.play(ShowCreation(correspondences), run_time=0.5)
+            self.play(
+                source_dots.animate.set_points(
+                    to_scene_points(apply_transform(world_from_a @ transform, source))
+                ),
+                FadeOut(correspondences),
+                residual_value.animate.set_value(residual),
+                run_time=0.5,
+            )
+            previous = transform
+        self.wait()
+
+        self.play(
+            FadeOut(room),
+            FadeOut(target_dots),
+            FadeOut(source_dots),
+            FadeOut(residual_label),
+            FadeOut(residual_value),
+        )
+
+
+def make_loop_graph(
+    num_poses: int = 80, radius: float = 2.5, seed: int = 0
+) -> tuple[PoseGraph, np.ndarray]:
+    """Dead-reckoned lap of a circle with one loop closure, and the true poses"""
+    rng = np.random.default_rng(seed)
+    angles = np.linspace(0, 2 * PI, num_poses, endpoint=False)
+    truth = np.stack(
+        [radius * np.cos(angles), radius * np.sin(angles), angles + PI / 2], axis=1
+    )
+    information = np.diag([400.0, 400.0, 2500.0])
+    graph = PoseGraph(truth[:1])
+    for k in range(1, num_poses):
+        measurement = relative_pose(truth[k - 1], truth[k])
+        measurement += rng.normal(0, [0.02, 0.02, 0.03])
+        graph.add_pose(compose_pose(graph.poses[-1], measurement))
+        graph.add_edge(k - 1, k, measurement, information)
+    graph.add_edge(num_poses - 1, 0, relative_pose(truth[-1], truth[0]), information)
+    return graph, truth
+
+
+class PoseGraphScene(HoldFrameScene):
+    def construct(self):
+        # Title
+        title = TexText("Pose Graph Optimization")
+        self.play(Write(title))
+        self.wait()
+        self.play(FadeOut(title))
+
+        # Odometry drifts, so the loop does not close
+        graph, truth = make_loop_graph()
+        initial = graph.poses.copy()
+        truth_path = VMobject(stroke_width=2, stroke_opacity=0.3).set_points_as_corners(
+            to_scene_points(np.vstack([truth[:, :2], truth[:1, :2]]))
+        )
+        path = VMobject(color=YELLOW, stroke_width=3).set_points_as_corners(
+            to_scene_points(initial[:, :2])
+        )
+        loop_closure = Line(
+            to_scene_points(initial[-1:, :2])[0],
+            to_scene_points(initial[:1, :2])[0],
+            color=RED,
+        )
+        error_label = Text("Error: ", font_size=30).to_corner(UL)
+        error_value = DecimalNumber(0, font_size=30).next_to(error_label, RIGHT)
+
+        self.play(ShowCreation(truth_path))
+        self.play(ShowCreation(path), run_time=2)
+        self.play(ShowCreation(loop_closure))
+        self.wait()
+
+        # Each Gauss-Newton step spreads the loop closure error along the path
+        result = optimize(graph, keep_history=True)
+        error_value.set_value(result.errors[0])
+        self.play(Write(error_label), FadeIn(error_value))
+        for poses, error in zip(result.pose_history, result.errors[1:]):
+            points = to_scene_points(poses[:, :2])
+            self.play(
+                path.animate.set_points_as_corners(points),
+                loop_closure.animate.put_start_and_end_on(points[-1], points[0]),
+                error_value.animate.set_value(error),
+                run_time=0.75,
+            )
+        self.wait()
+
+        self.play(
+            FadeOut(truth_path),
+            FadeOut(path),
+            FadeOut(loop_closure),
+            FadeOut(error_label),
+            FadeOut(error_value),
+        )
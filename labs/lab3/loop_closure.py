@@ -0,0 +1,239 @@
+from collections import defaultdict
+from dataclasses import dataclass
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from labs.lab3.icp import apply_transform, icp, make_transform
+from labs.lab3.pose_graph import relative_pose
+
+
+def scan_descriptor(
+    points: np.ndarray, num_bins: int = 16, max_range: float = 20.0
+) -> np.ndarray:
+    """
+    Compact rotation-invariant signature of a scan in its sensor frame.
+
+    Concatenates the histogram of point ranges with the histogram of point
+    distances from the scan centroid; neither changes when the sensor turns in
+    place, so revisits match whatever the heading.
+
+    Args:
+        points: (N, 2) scan points in the sensor frame
+        num_bins: bins of each histogram
+        max_range: upper edge of the last bin
+    """
+    ranges = np.hypot(points[:, 0], points[:, 1])
+    spread = np.hypot(*(points - points.mean(axis=0)).T)
+    bins = np.linspace(0, max_range, num_bins + 1)
+    descriptor = np.concatenate(
+        [np.histogram(ranges, bins)[0], np.histogram(spread, bins)[0]]
+    ).astype(float)
+    return descriptor / max(np.linalg.norm(descriptor), 1e-12)
+
+
+class PoseGrid:
+    """
+    Spatial hash of 2D positions, so that finding the positions near a point
+    only looks at a few cells instead of the whole trajectory.
+
+    Args:
+        cell_size: side of a cell, best close to the search radius
+    """
+
+    def __init__(self, cell_size: float):
+        self.cell_size = cell_size
+        self.cells: dict[tuple[int, int], list[int]] = defaultdict(list)
+        self.positions = np.empty((0, 2))
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _cell(self, xy) -> tuple[int, int]:
+        return int(np.floor(xy[0] / self.cell_size)), int(
+            np.floor(xy[1] / self.cell_size)
+        )
+
+    def insert(self, xy) -> int:
+        if self._count == len(self.positions):
+            grown = np.empty((max(16, 2 * self._count), 2))
+            grown[: self._count] = self.positions[: self._count]
+            self.positions = grown
+        self.positions[self._count] = xy[:2]
+        self.cells[self._cell(xy)].append(self._count)
+        self._count += 1
+        return self._count - 1
+
+    def query(self, xy, radius: float) -> np.ndarray:
+        """Indices of the positions within ``radius`` of ``xy``"""
+        reach = int(np.ceil(radius / self.cell_size))
+        cx, cy = self._cell(xy)
+        indices = [
+            index
+            for dx in range(-reach, reach + 1)
+            for dy in range(-reach, reach + 1)
+            for index in self.cells.get((cx + dx, cy + dy), ())
+        ]
+        indices = np.array(indices, dtype=int)
+        if len(indices) == 0:
+            return indices
+        distances = np.hypot(*(self.positions[indices] - xy[:2]).T)
+        return indices[distances <= radius]
+
+
+@dataclass
+class LoopClosure:
+    """
+    Args:
+        index: past pose the current scan was matched to
+        measurement: current pose seen from the past pose, (x, y, theta), ready
+            for PoseGraph.add_edge(index, current, measurement)
+        residual: RMS distance of the aligned scans
+        overlap: fraction of the current scan that lands on the past one
+        descriptor_distance: distance between the two scan descriptors
+    """
+
+    index: int
+    measurement: np.ndarray
+    residual: float
+    overlap: float
+    descriptor_distance: float
+
+
+class LoopClosureDetector:
+    """
+    Finds loop closures for a stream of scans in three stages of increasing
+    cost: past poses within ``search_radius`` of the current estimate from a
+    spatial grid, the ``top_k`` of those with the closest scan descriptors,
+    and ICP on just those to accept or reject them.
+
+    Args:
+        search_radius: how far the current pose estimate may have drifted
+        min_index_gap: ignore the most recent poses, which are odometry
+            neighbours rather than revisits
+        top_k: candidates passed to scan matching
+        max_descriptor_distance: candidates with less similar scans are skipped
+        max_residual: RMS residual below which an ICP alignment is accepted
+        min_overlap: fraction of points that must land within twice
+            ``max_residual`` of the matched scan
+        max_correspondence_distance: ICP pairs further apart are outliers
+        num_bins: bins of each scan descriptor histogram
+        max_range: LiDAR range used for the descriptor bins
+    """
+
+    def __init__(
+        self,
+        search_radius: float = 2.0,
+        min_index_gap: int = 100,
+        top_k: int = 3,
+        max_descriptor_distance: float = 0.5,
+        max_residual: float = 0.1,
+        min_overlap: float = 0.8,
+        max_correspondence_distance: float = 1.0,
+        num_bins: int = 16,
+        max_range: float = 20.0,
+    ):
+        self.search_radius = search_radius
+        self.min_index_gap = min_index_gap
+        self.top_k = top_k
+        self.max_descriptor_distance = max_descriptor_distance
+        self.max_residual = max_residual
+        self.min_overlap = min_overlap
+        self.max_correspondence_distance = max_correspondence_distance
+        self.num_bins = num_bins
+        self.max_range = max_range
+        self.grid = PoseGrid(search_radius)
+        self.poses: list[np.ndarray] = []
+        self.scans: list[np.ndarray] = []
+        self.descriptors = np.empty((0, 2 * num_bins))
+
+    def __len__(self) -> int:
+        return len(self.scans)
+
+    def add_scan(self, pose, points: np.ndarray) -> int:
+        """Index a scan taken at ``pose`` for later queries"""
+        index = len(self.scans)
+        if index == len(self.descriptors):
+            grown = np.empty((max(16, 2 * index), 2 * self.num_bins))
+            grown[:index] = self.descriptors[:index]
+            self.descriptors = grown
+        self.descriptors[index] = scan_descriptor(points, self.num_bins, self.max_range)
+        self.poses.append(np.asarray(pose, float))
+        self.scans.append(np.asarray(points, float)[:, :2])
+        self.grid.insert(pose)
+        return index
+
+    def update_poses(self, poses: np.ndarray) -> None:
+        """Re-index the scans after the pose graph moved them"""
+        self.grid = PoseGrid(self.search_radius)
+        for k, pose in enumerate(poses[: len(self.scans)]):
+            self.poses[k] = np.asarray(pose, float)
+            self.grid.insert(pose)
+
+    def find_candidates(self, pose, descriptor: np.ndarray) -> np.ndarray:
+        """Past scans near ``pose`` ranked by descriptor distance, best first"""
+        nearby = self.grid.query(np.asarray(pose, float), self.search_radius)
+        nearby = nearby[nearby < len(self.scans) - self.min_index_gap]
+        if len(nearby) == 0:
+            return nearby
+        distances = np.linalg.norm(self.descriptors[nearby] - descriptor, axis=1)
+        keep = distances <= self.max_descriptor_distance
+        nearby, distances = nearby[keep], distances[keep]
+        best = np.argsort(distances)[: self.top_k]
+        return nearby[best]
+
+    def detect(self, pose, points: np.ndarray) -> list[LoopClosure]:
+        """
+        Match a new scan against the indexed ones, then index it.
+
+        Args:
+            pose: current (x, y, theta) estimate
+            points: (N, 2) scan points in the sensor frame
+
+        Returns:
+            accepted loop closures, best first
+        """
+        pose = np.asarray(pose, float)
+        points = np.asarray(points, float)[:, :2]
+        descriptor = scan_descriptor(points, self.num_bins, self.max_range)
+        closures = []
+        for index in self.find_candidates(pose, descriptor):
+            guess = relative_pose(self.poses[index], pose)
+            tree = cKDTree(self.scans[index])
+            result = icp(
+                points,
+                self.scans[index],
+                initial_transform=make_transform(*guess),
+                method="point_to_line",
+                max_iterations=20,
+                max_correspondence_distance=self.max_correspondence_distance,
+                inlier_fraction=0.9,
+                target_tree=tree,
+            )
+            transform = result.transform
+            # A low residual over a few inliers is easy to get by sliding along
+            # a wall, so also require most of the scan to land on the target
+            distances, _ = tree.query(apply_transform(transform, points))
+            residual = float(np.sqrt(np.mean(np.minimum(distances, 1.0) ** 2)))
+            overlap = float(np.mean(distances <= 2 * self.max_residual))
+            if residual > self.max_residual or overlap < self.min_overlap:
+                continue
+            closures.append(
+                LoopClosure(
+                    int(index),
+                    np.array(
+                        [
+                            transform[0, 2],
+                            transform[1, 2],
+                            np.arctan2(transform[1, 0], transform[0, 0]),
+                        ]
+                    ),
+                    residual,
+                    overlap,
+                    float(np.linalg.norm(self.descriptors[index] - descriptor)),
+                )
+            )
+        self.add_scan(pose, points)
+        closures.sort(key=lambda closure: closure.residual)
+        return closures
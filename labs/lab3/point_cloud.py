@@ -0,0 +1,107 @@
+"""
+Preprocessing of LiDAR scans into the point clouds that icp, the correlative
+scan matcher and loop closure detection take, shared so every consumer sees
+the same filtered and downsampled points.
+"""
+
+from collections.abc import Iterable, Iterator
+from typing import Optional
+
+import numpy as np
+
+
+class ScanPreprocessor:
+    """
+    Turns LiDAR ranges into the 2D point clouds scan matching works on: drops
+    invalid and out of range returns, then thins the points out with a voxel
+    grid and optionally a random subsample.
+
+    The cosine and sine of every beam are computed once per beam layout and
+    reused for every scan with that layout.
+
+    Args:
+        voxel_size: side of the voxel grid cells, each voxel keeping the
+            centroid of its points, or 0 to keep every point
+        max_points: randomly keep at most this many points after the voxel grid
+        min_range: returns closer than this are dropped, e.g. the car itself
+        max_range: returns at or beyond this are dropped as misses
+        seed: seed of the random subsample
+    """
+
+    def __init__(
+        self,
+        voxel_size: float = 0.05,
+        max_points: Optional[int] = None,
+        min_range: float = 0.06,
+        max_range: float = 20.0,
+        seed: int = 0,
+    ):
+        self.voxel_size = voxel_size
+        self.max_points = max_points
+        self.min_range = min_range
+        self.max_range = max_range
+        self.rng = np.random.default_rng(seed)
+        self._angle_tables: dict[tuple[float, float, int], np.ndarray] = {}
+
+    def get_angle_table(
+        self, angle_min: float, angle_increment: float, num_beams: int
+    ) -> np.ndarray:
+        """(2, num_beams) cosine and sine of each beam of a layout, cached"""
+        key = (float(angle_min), float(angle_increment), int(num_beams))
+        table = self._angle_tables.get(key)
+        if table is None:
+            angles = angle_min + angle_increment * np.arange(num_beams)
+            table = np.stack([np.cos(angles), np.sin(angles)])
+            self._angle_tables[key] = table
+        return table
+
+    def to_points(
+        self, ranges: np.ndarray, angle_min: float, angle_increment: float
+    ) -> np.ndarray:
+        """(N, 2) points in the sensor frame of the valid returns of a scan"""
+        ranges = np.asarray(ranges)
+        table = self.get_angle_table(angle_min, angle_increment, len(ranges))
+        # NaN compares false, so it is dropped along with the out of range
+        valid = (ranges >= self.min_range) & (ranges < self.max_range)
+        return (ranges[valid] * table[:, valid]).T
+
+    def voxel_downsample(self, points: np.ndarray) -> np.ndarray:
+        """Centroid of the points of each voxel, in the order of the scan"""
+        if self.voxel_size <= 0 or len(points) == 0:
+            return points
+        cells = np.floor(points / self.voxel_size).astype(np.int64)
+        keys = cells[:, 0] << 32 | (cells[:, 1] & 0xFFFFFFFF)
+        _, first, voxel = np.unique(keys, return_index=True, return_inverse=True)
+        counts = np.bincount(voxel)
+        centroids = np.stack(
+            [
+                np.bincount(voxel, points[:, 0]) / counts,
+                np.bincount(voxel, points[:, 1]) / counts,
+            ],
+            axis=1,
+        )
+        return centroids[np.argsort(first)]
+
+    def random_downsample(self, points: np.ndarray) -> np.ndarray:
+        """At most max_points of the points, keeping their order"""
+        if self.max_points is None or len(points) <= self.max_points:
+            return points
+        keep = self.rng.choice(len(points), self.max_points, replace=False)
+        return points[np.sort(keep)]
+
+    def process(
+        self, ranges: np.ndarray, angle_min: float, angle_increment: float
+    ) -> np.ndarray:
+        """Downsampled (N, 2) point cloud of a scan"""
+        points = self.to_points(ranges, angle_min, angle_increment)
+        return self.random_downsample(self.voxel_downsample(points))
+
+    def stream(
+        self,
+        scans: Iterable[np.ndarray],
+        angle_min: float,
+        angle_increment: float,
+    ) -> Iterator[np.ndarray]:
+        """Point clouds of a stream of scans sharing one beam layout"""
+        for ranges in scans:
+            yield self.process(ranges, angle_min, angle_increment)
@@ -0,0 +1,460 @@
+from dataclasses import dataclass, field
+from typing import Optional
+
+import numpy as np
+import scipy.sparse as sp
+import scipy.sparse.linalg as spla
+
+
+def wrap_angle(angle: np.ndarray | float) -> np.ndarray | float:
+    return (angle + np.pi) % (2 * np.pi) - np.pi
+
+
+def _rotations(theta: np.ndarray) -> np.ndarray:
+    c, s = np.cos(theta), np.sin(theta)
+    return np.stack([np.stack([c, -s], -1), np.stack([s, c], -1)], -2)
+
+
+def relative_pose(pose_i: np.ndarray, pose_j: np.ndarray) -> np.ndarray:
+    """Pose of j in the frame of i, for (..., 3) arrays of (x, y, theta)"""
+    delta = pose_j[..., :2] - pose_i[..., :2]
+    rotation_t = np.swapaxes(_rotations(pose_i[..., 2]), -1, -2)
+    xy = np.einsum("...ij,...j->...i", rotation_t, delta)
+    return np.concatenate(
+        [xy, wrap_angle(pose_j[..., 2] - pose_i[..., 2])[..., None]], axis=-1
+    )
+
+
+def compose_pose(pose: np.ndarray, delta: np.ndarray) -> np.ndarray:
+    """Apply a relative pose ``delta`` expressed in the frame of ``pose``"""
+    xy = pose[..., :2] + np.einsum(
+        "...ij,...j->...i", _rotations(pose[..., 2]), delta[..., :2]
+    )
+    return np.concatenate(
+        [xy, wrap_angle(pose[..., 2] + delta[..., 2])[..., None]], axis=-1
+    )
+
+
+def _grow(buffer: np.ndarray, size: int) -> np.ndarray:
+    if size <= len(buffer):
+        return buffer
+    grown = np.empty((max(size, 2 * len(buffer), 16),) + buffer.shape[1:], buffer.dtype)
+    grown[: len(buffer)] = buffer
+    return grown
+
+
+class PoseGraph:
+    """
+    2D pose graph: nodes are (x, y, theta) poses, edges are measured relative
+    poses between two nodes with a 3x3 information matrix. Poses and edges are
+    kept in arrays that grow by doubling, so adding one is amortized O(1).
+
+    Args:
+        poses: initial (N, 3) pose estimates
+    """
+
+    def __init__(self, poses: Optional[np.ndarray] = None):
+        poses = np.zeros((0, 3)) if poses is None else np.array(poses, float)
+        self._poses = poses.reshape(-1, 3)
+        self._num_poses = len(self._poses)
+        self._edges_i = np.empty(0, dtype=int)
+        self._edges_j = np.empty(0, dtype=int)
+        self._measurements = np.empty((0, 3))
+        self._information = np.empty((0, 3, 3))
+        self.num_edges = 0
+
+    def __len__(self) -> int:
+        return self._num_poses
+
+    @property
+    def poses(self) -> np.ndarray:
+        """(N, 3) view of the pose estimates"""
+        return self._poses[: self._num_poses]
+
+    @poses.setter
+    def poses(self, poses: np.ndarray) -> None:
+        self._poses[: self._num_poses] = poses
+
+    def add_pose(self, pose) -> int:
+        self._poses = _grow(self._poses, self._num_poses + 1)
+        self._poses[self._num_poses] = pose
+        self._num_poses += 1
+        return self._num_poses - 1
+
+    def add_edge(self, i: int, j: int, measurement, information=None) -> int:
+        """Add the constraint that pose j seen from pose i is ``measurement``"""
+        k = self.num_edges
+        self._edges_i = _grow(self._edges_i, k + 1)
+        self._edges_j = _grow(self._edges_j, k + 1)
+        self._measurements = _grow(self._measurements, k + 1)
+        self._information = _grow(self._information, k + 1)
+        self._edges_i[k] = i
+        self._edges_j[k] = j
+        self._measurements[k] = measurement
+        self._information[k] = np.eye(3) if information is None else information
+        self.num_edges += 1
+        return k
+
+    def get_edges(self):
+        """Views of the edges as arrays (i, j, measurements, information)"""
+        k = self.num_edges
+        return (
+            self._edges_i[:k],
+            self._edges_j[:k],
+            self._measurements[:k],
+            self._information[:k],
+        )
+
+    def get_errors(self, poses: Optional[np.ndarray] = None) -> np.ndarray:
+        """(E, 3) error of every edge, e_ij = (x_j - x_i) - z_ij on SE(2)"""
+        poses = self.poses if poses is None else poses
+        i, j, measurements, _ = self.get_edges()
+        return relative_pose(measurements, relative_pose(poses[i], poses[j]))
+
+    def get_chi2(self, poses: Optional[np.ndarray] = None) -> np.ndarray:
+        """e_ij^T Omega_ij e_ij of every edge"""
+        errors = self.get_errors(poses)
+        information = self.get_edges()[3]
+        return np.einsum("ei,eij,ej->e", errors, information, errors)
+
+
+def _huber(chi2: np.ndarray, delta: float):
+    root = np.sqrt(np.maximum(chi2, 1e-300))
+    inlier = chi2 <= delta**2
+    cost = np.where(inlier, chi2, 2 * delta * root - delta**2)
+    return cost, np.where(inlier, 1.0, delta / root)
+
+
+def _cauchy(chi2: np.ndarray, delta: float):
+    return delta**2 * np.log1p(chi2 / delta**2), 1.0 / (1.0 + chi2 / delta**2)
+
+
+# Robust kernels map the chi2 of every edge to (rho(chi2), rho'(chi2)); the
+# derivative re-weights the information matrix of the edge.
+ROBUST_KERNELS = {"huber": _huber, "cauchy": _cauchy}
+
+
+def linearize(
+    edges: tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray],
+    poses: np.ndarray,
+    robust_kernel: Optional[str] = None,
+    kernel_delta: float = 1.0,
+):
+    """
+    Build the sparse normal equations H dx = -b of the pose graph error.
+
+    Args:
+        edges: (i, j, measurements, information), see PoseGraph.get_edges
+        poses: (N, 3) linearization point
+
+    Returns:
+        (H, b, chi2) with H a (3N, 3N) CSC matrix, b a 3N vector and chi2 the
+        robustified error of every edge
+    """
+    i, j, measurements, information = edges
+    errors = relative_pose(measurements, relative_pose(poses[i], poses[j]))
+    chi2 = np.einsum("ei,eij,ej->e", errors, information, errors)
+    if robust_kernel is not None:
+        chi2, weights = ROBUST_KERNELS[robust_kernel](chi2, kernel_delta)
+        information = information * weights[:, None, None]
+
+    # Jacobians of e_ij with respect to x_i (A) and x_j (B), see Grisetti et al.
+    rz_t = np.swapaxes(_rotations(measurements[:, 2]), -1, -2)
+    ri_t = np.swapaxes(_rotations(poses[i, 2]), -1, -2)
+    c, s = np.cos(poses[i, 2]), np.sin(poses[i, 2])
+    d_ri_t = np.stack([np.stack([-s, c], -1), np.stack([-c, -s], -1)], -2)
+    delta = poses[j, :2] - poses[i, :2]
+    num_edges = len(i)
+    A = np.zeros((num_edges, 3, 3))
+    B = np.zeros((num_edges, 3, 3))
+    A[:, :2, :2] = -rz_t @ ri_t
+    A[:, :2, 2] = np.einsum("eij,ejk,ek->ei", rz_t, d_ri_t, delta)
+    A[:, 2, 2] = -1
+    B[:, :2, :2] = rz_t @ ri_t
+    B[:, 2, 2] = 1
+
+    omega_a = information @ A
+    omega_b = information @ B
+    blocks = [
+        (i, i, np.swapaxes(A, 1, 2) @ omega_a),
+        (i, j, np.swapaxes(A, 1, 2) @ omega_b),
+        (j, i, np.swapaxes(B, 1, 2) @ omega_a),
+        (j, j, np.swapaxes(B, 1, 2) @ omega_b),
+    ]
+    offsets = np.arange(3)
+    rows = np.concatenate(
+        [
+            (3 * r[:, None, None] + offsets[:, None]).repeat(3, 2).ravel()
+            for r, _, _ in blocks
+        ]
+    )
+    cols = np.concatenate(
+        [
+            (3 * c[:, None, None] + offsets[None, :]).repeat(3, 1).ravel()
+            for _, c, _ in blocks
+        ]
+    )
+    values = np.concatenate([block.ravel() for _, _, block in blocks])
+    size = 3 * len(poses)
+    H = sp.csc_matrix((values, (rows, cols)), shape=(size, size))
+
+    b = np.zeros(size)
+    ea = np.einsum("eji,ej->ei", omega_a, errors)
+    eb = np.einsum("eji,ej->ei", omega_b, errors)
+    np.add.at(b, (3 * i[:, None] + offsets).ravel(), ea.ravel())
+    np.add.at(b, (3 * j[:, None] + offsets).ravel(), eb.ravel())
+    return H, b, chi2
+
+
+def solve_normal_equations(
+    H: sp.csc_matrix,
+    b: np.ndarray,
+    fixed: np.ndarray,
+    solver: str = "direct",
+    x0: Optional[np.ndarray] = None,
+    max_cg_iterations: int = 500,
+) -> np.ndarray:
+    """
+    Solve H dx = -b with the variables in ``fixed`` held at zero.
+
+    Args:
+        solver: "direct" for a sparse factorization with a fill-reducing
+            ordering, or "cg" for Jacobi-preconditioned conjugate gradients,
+            which needs less memory but converges slowly on long chains
+        x0: starting point for "cg"
+        max_cg_iterations: iteration limit for "cg"; an inexact step is
+            still a descent direction for the outer iteration
+    """
+    free = np.ones(len(b), dtype=bool)
+    free[fixed] = False
+    H_free = H[free][:, free]
+    dx = np.zeros(len(b))
+    if solver == "direct":
+        # H is symmetric positive definite, so skip pivoting and keep the
+        # symmetric fill-reducing ordering, which is close to a Cholesky
+        lu = spla.splu(
+            H_free,
+            permc_spec="MMD_AT_PLUS_A",
+            diag_pivot_thresh=0,
+            options={"SymmetricMode": True},
+        )
+        dx[free] = lu.solve(-b[free])
+    elif solver == "cg":
+        preconditioner = sp.diags(1.0 / np.maximum(H_free.diagonal(), 1e-12))
+        dx[free], _ = spla.cg(
+            H_free,
+            -b[free],
+            x0=None if x0 is None else x0[free],
+            M=preconditioner,
+            rtol=1e-8,
+            maxiter=max_cg_iterations,
+        )
+    else:
+        raise ValueError(f"Unknown solver {solver!r}")
+    return dx
+
+
+@dataclass
+class OptimizationResult:
+    """
+    Args:
+        poses: optimized (N, 3) poses
+        errors: total (robustified) chi2 before the first and after each iteration
+        pose_history: poses after each iteration, if requested
+        converged: whether the error stopped decreasing before max_iterations
+    """
+
+    poses: np.ndarray
+    errors: list[float] = field(default_factory=list)
+    pose_history: list[np.ndarray] = field(default_factory=list)
+    converged: bool = False
+
+
+def optimize(
+    graph: PoseGraph,
+    method: str = "gauss_newton",
+    max_iterations: int = 20,
+    tolerance: float = 1e-6,
+    robust_kernel: Optional[str] = None,
+    kernel_delta: float = 1.0,
+    solver: str = "direct",
+    fixed_poses: tuple[int, ...] = (0,),
+    initial_damping: float = 1e-4,
+    keep_history: bool = False,
+) -> OptimizationResult:
+    """
+    Minimize sum_ij e_ij^T Omega_ij e_ij over the poses of a graph.
+
+    Args:
+        graph: graph to optimize; its poses are updated in place
+        method: "gauss_newton" or "levenberg_marquardt"
+        max_iterations: iteration limit
+        tolerance: stop once the relative decrease of the error is below this
+        robust_kernel: None, "huber" or "cauchy", to down-weight outlier edges
+        kernel_delta: chi2 scale at which the robust kernel kicks in
+        solver: "direct" or "cg", see solve_normal_equations
+        fixed_poses: poses held in place to remove the gauge freedom
+        initial_damping: starting lambda for Levenberg-Marquardt
+        keep_history: keep the poses after every iteration, e.g. to animate them
+    """
+    result = optimize_poses(
+        graph.get_edges(),
+        graph.poses.copy(),
+        fixed_poses,
+        method=method,
+        max_iterations=max_iterations,
+        tolerance=tolerance,
+        robust_kernel=robust_kernel,
+        kernel_delta=kernel_delta,
+        solver=solver,
+        initial_damping=initial_damping,
+        keep_history=keep_history,
+    )
+    graph.poses = result.poses
+    return result
+
+
+def optimize_poses(
+    edges: tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray],
+    poses: np.ndarray,
+    fixed_poses,
+    method: str = "gauss_newton",
+    max_iterations: int = 20,
+    tolerance: float = 1e-6,
+    robust_kernel: Optional[str] = None,
+    kernel_delta: float = 1.0,
+    solver: str = "direct",
+    initial_damping: float = 1e-4,
+    keep_history: bool = False,
+) -> OptimizationResult:
+    """
+    Optimize (N, 3) ``poses`` under ``edges`` that index into them, see optimize.
+    """
+    if method not in ("gauss_newton", "levenberg_marquardt"):
+        raise ValueError(f"Unknown method {method!r}")
+    fixed = (3 * np.asarray(fixed_poses, dtype=int)[:, None] + np.arange(3)).ravel()
+    result = OptimizationResult(poses)
+    damping = initial_damping
+    H, b, chi2 = linearize(edges, poses, robust_kernel, kernel_delta)
+    error = float(chi2.sum())
+    result.errors.append(error)
+    dx = None
+
+    for _ in range(max_iterations):
+        if method == "levenberg_marquardt":
+            H_solve = H + damping * sp.diags(H.diagonal() + 1e-9)
+        else:
+            H_solve = H
+        dx = solve_normal_equations(H_solve, b, fixed, solver, dx)
+        candidate = poses + dx.reshape(-1, 3)
+        candidate[:, 2] = wrap_angle(candidate[:, 2])
+        H_new, b_new, chi2_new = linearize(
+            edges, candidate, robust_kernel, kernel_delta
+        )
+        new_error = float(chi2_new.sum())
+
+        if method == "levenberg_marquardt" and new_error > error:
+            damping *= 10
+            if damping > 1e10:
+                break
+            continue
+        damping = max(damping / 10, 1e-12)
+        poses, H, b = candidate, H_new, b_new
+        decrease = error - new_error
+        error = new_error
+        result.errors.append(error)
+        if keep_history:
+            result.pose_history.append(poses)
+        if abs(decrease) <= tolerance * max(error, 1e-12):
+            result.converged = True
+            break
+
+    result.poses = poses
+    return result
+
+
+class IncrementalOptimizer:
+    """
+    Keeps a pose graph optimized while poses and edges arrive one at a time.
+
+    Odometry to a new pose only initializes that pose by composing the
+    measurement, which leaves every edge error at zero, so it costs O(1) and
+    needs no solve. Any other edge, typically a loop closure, marks the poses
+    from its older end onwards as active. update() then relinearizes only the
+    edges that touch active poses and solves for those poses, warm-started
+    from the current estimate, with the older poses they reference held fixed.
+    The cost of an update therefore follows the length of the loop being
+    closed instead of the size of the graph.
+
+    Holding the older poses fixed is an approximation; ``margin`` extra poses
+    before the loop are re-optimized too so the correction can spread past it,
+    and optimize_all() runs the exact batch solve.
+
+    Args:
+        graph: graph to extend; may already hold poses and edges
+        max_iterations: iteration limit of every update
+        margin: poses before the older end of a new edge that are also active
+        optimize_kwargs: forwarded to optimize_poses, e.g. robust_kernel
+    """
+
+    def __init__(
+        self,
+        graph: PoseGraph,
+        max_iterations: int = 5,
+        margin: int = 250,
+        **optimize_kwargs,
+    ):
+        self.graph = graph
+        self.max_iterations = max_iterations
+        self.margin = margin
+        self.optimize_kwargs = optimize_kwargs
+        self.first_active: Optional[int] = None
+
+    def add_odometry(self, measurement, information=None) -> int:
+        """Add a pose after the last one, measured relative to it"""
+        previous = len(self.graph) - 1
+        index = self.graph.add_pose(
+            compose_pose(self.graph.poses[previous], np.asarray(measurement, float))
+        )
+        self.graph.add_edge(previous, index, measurement, information)
+        return index
+
+    def add_edge(self, i: int, j: int, measurement, information=None) -> int:
+        """Add an edge between existing poses, e.g. a loop closure"""
+        oldest = max(min(i, j) - self.margin, 0)
+        if self.first_active is None or oldest < self.first_active:
+            self.first_active = oldest
+        return self.graph.add_edge(i, j, measurement, information)
+
+    def update(self) -> Optional[OptimizationResult]:
+        """Re-optimize the active poses; returns None if nothing was active"""
+        if self.first_active is None:
+            return None
+        first_active, self.first_active = self.first_active, None
+        i, j, measurements, information = self.graph.get_edges()
+        selected = np.flatnonzero(np.maximum(i, j) >= first_active)
+        nodes, local = np.unique(
+            np.concatenate([i[selected], j[selected]]), return_inverse=True
+        )
+        fixed = np.flatnonzero(nodes < first_active)
+        if len(fixed) == 0:
+            fixed = np.array([0])
+        result = optimize_poses(
+            (
+                local[: len(selected)],
+                local[len(selected) :],
+                measurements[selected],
+                information[selected],
+            ),
+            self.graph.poses[nodes],
+            fixed,
+            max_iterations=self.max_iterations,
+            **self.optimize_kwargs,
+        )
+        self.graph.poses[nodes] = result.poses
+        return result
+
+    def optimize_all(self, **kwargs) -> OptimizationResult:
+        """Full batch optimization, e.g. once at the end of a run"""
+        self.first_active = None
+        return optimize(self.graph, **{**self.optimize_kwargs, **kwargs})
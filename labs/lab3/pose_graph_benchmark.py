@@ -0,0 +1,155 @@
+"""
+Replay a long run edge by edge into an incremental pose graph and report what
+every edge costs as the graph grows, e.g.
+
+    python -m labs.lab3.pose_graph_benchmark --log path/to/lab1_pid_trace
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from labs.common.recorder import load_trace
+from labs.lab3.pose_graph import (
+    IncrementalOptimizer,
+    PoseGraph,
+    optimize,
+    relative_pose,
+)
+
+ODOMETRY_NOISE = np.array([0.02, 0.02, 0.005])
+INFORMATION = np.diag(1.0 / ODOMETRY_NOISE**2)
+
+
+def load_run(path: str) -> np.ndarray:
+    """(N, 3) x, y, heading of a TraceRecorder directory, ``.npy`` or CSV log"""
+    if os.path.isdir(path):
+        log = load_trace(path)
+    elif path.endswith(".npy"):
+        log = np.load(path)
+    else:
+        log = np.genfromtxt(path, delimiter=",", names=True)
+    return np.stack([log["x"], log["y"], log["heading"]], axis=1).astype(float)
+
+
+def synthesize_run(num_poses: int = 20000, poses_per_lap: int = 500) -> np.ndarray:
+    """Laps of a slowly drifting ellipse, so that every lap revisits the last"""
+    t = 2 * np.pi * np.arange(num_poses) / poses_per_lap
+    x = 20 * np.cos(t) + 0.0005 * np.arange(num_poses)
+    y = 12 * np.sin(t)
+    heading = np.arctan2(np.gradient(y), np.gradient(x))
+    return np.stack([x, y, heading], axis=1)
+
+
+def subsample_run(poses: np.ndarray, min_distance: float) -> np.ndarray:
+    """Keep a pose whenever the car moved ``min_distance`` since the last kept"""
+    kept = [0]
+    for k in range(1, len(poses)):
+        if np.hypot(*(poses[k, :2] - poses[kept[-1], :2])) >= min_distance:
+            kept.append(k)
+    return poses[kept]
+
+
+def make_edge_stream(
+    truth: np.ndarray,
+    closure_radius: float = 1.0,
+    closure_every: int = 10,
+    min_closure_gap: int = 100,
+    seed: int = 0,
+):
+    """
+    Noisy edges in the order a robot would produce them: odometry to every new
+    pose, plus a loop closure from every ``closure_every``-th pose to the most
+    recent pose within ``closure_radius`` that is at least ``min_closure_gap``
+    poses older.
+
+    Yields:
+        (i, j, measurement) with i = -1 for odometry to a new pose j
+    """
+    rng = np.random.default_rng(seed)
+    tree = cKDTree(truth[:, :2])
+    for k in range(1, len(truth)):
+        measurement = relative_pose(truth[k - 1], truth[k])
+        yield -1, k, measurement + rng.normal(0, ODOMETRY_NOISE)
+        if k % closure_every:
+            continue
+        candidates = [
+            c
+            for c in tree.query_ball_point(truth[k, :2], closure_radius)
+            if c < k - min_closure_gap
+        ]
+        if candidates:
+            c = max(candidates)
+            measurement = relative_pose(truth[c], truth[k])
+            yield c, k, measurement + rng.normal(0, ODOMETRY_NOISE)
+
+
+def replay(truth: np.ndarray, **stream_kwargs):
+    """
+    Feed the edge stream of a run into an IncrementalOptimizer one edge at a
+    time, updating after each.
+
+    Returns:
+        (optimizer, timings) with timings a structured array of the graph size,
+        edge kind and seconds spent on every edge
+    """
+    optimizer = IncrementalOptimizer(PoseGraph(truth[:1]), robust_kernel="cauchy")
+    timings = []
+    for i, j, measurement in make_edge_stream(truth, **stream_kwargs):
+        start = time.perf_counter()
+        if i < 0:
+            optimizer.add_odometry(measurement, INFORMATION)
+        else:
+            optimizer.add_edge(i, j, measurement, INFORMATION)
+        optimizer.update()
+        timings.append((len(optimizer.graph), i >= 0, time.perf_counter() - start))
+    return optimizer, np.array(
+        timings, dtype=[("num_poses", int), ("loop_closure", bool), ("seconds", float)]
+    )
+
+
+def summarize(timings: np.ndarray, num_buckets: int = 4) -> None:
+    """Print per-edge latency percentiles for growing slices of the run"""
+    print(f"{'poses':>14} {'kind':>9} {'edges':>6}   p50 ms   p99 ms   max ms")
+    for bucket in np.array_split(timings, num_buckets):
+        sizes = f"{bucket['num_poses'][0]}-{bucket['num_poses'][-1]}"
+        for kind, mask in (
+            ("odometry", ~bucket["loop_closure"]),
+            ("loop", bucket["loop_closure"]),
+        ):
+            seconds = bucket["seconds"][mask] * 1e3
+            if len(seconds) == 0:
+                continue
+            p50, p99 = np.percentile(seconds, [50, 99])
+            print(
+                f"{sizes:>14} {kind:>9} {len(seconds):>6} "
+                f"{p50:>8.3f} {p99:>8.3f} {seconds.max():>8.3f}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--log", help="recorded run; synthesized when omitted")
+    parser.add_argument("--num-poses", type=int, default=20000)
+    parser.add_argument("--spacing", type=float, default=0.1)
+    args = parser.parse_args()
+    if args.log:
+        truth = subsample_run(load_run(args.log), args.spacing)
+    else:
+        truth = synthesize_run(args.num_poses)
+
+    optimizer, timings = replay(truth)
+    summarize(timings)
+    incremental_error = float(optimizer.graph.get_chi2().sum())
+
+    start = time.perf_counter()
+    batch = optimize(optimizer.graph, robust_kernel="cauchy")
+    batch_seconds = time.perf_counter() - start
+    print(
+        f"incremental: {timings['seconds'].sum():.2f} s in total, "
+        f"error {incremental_error:.4g}"
+    )
+    print(f"one batch solve: {batch_seconds:.2f} s, error {batch.errors[-1]:.4g}")
@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+
+from labs.common.lidar import cast_rays_against_segments, polylines_to_segments
+from labs.lab3.point_cloud import ScanPreprocessor
+
+# The room of the Lab3 scenes
+ROOM = np.array(
+    [[-5, -3], [5, -3], [5, 3], [1, 3], [1, 1], [-1, 1], [-1, 3], [-5, 3], [-5, -3]]
+)
+
+
+@pytest.fixture
+def scan_room():
+    """Function returning the points seen from a pose in the Lab3 room"""
+    preprocessor = ScanPreprocessor(voxel_size=0)
+    segments = polylines_to_segments([ROOM])
+
+    def scan(pose, num_beams: int = 180) -> np.ndarray:
+        angles = np.linspace(-0.75 * np.pi, 0.75 * np.pi, num_beams)
+        ranges = cast_rays_against_segments(pose[:2], angles + pose[2], segments)
+        return preprocessor.process(ranges, angles[0], angles[1] - angles[0])
+
+    return scan
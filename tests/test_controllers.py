@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from labs.common.controllers import (
+    GapFollower,
+    WallFollower,
+    WindowFollower,
+    _reference_steps,
+    make_scans,
+    measure_allocations,
+)
+from labs.common.lidar import extend_disparities
+
+
+def make_steps(num_beams: int, dt: float = 1 / 40):
+    wall = WallFollower(num_beams)
+    return {
+        "naive": GapFollower(num_beams, extend=False).step,
+        "disparity": GapFollower(num_beams).step,
+        "window": WindowFollower(num_beams).step,
+        "wall_following": lambda ranges: wall.step(ranges, dt),
+    }
+
+
+@pytest.mark.parametrize("num_beams", [60, 100, 1080])
+@pytest.mark.parametrize("name", ["naive", "disparity", "window", "wall_following"])
+def test_steady_state_allocates_nothing(name, num_beams):
+    scans = make_scans(num_beams, 200)
+    retained, peak = measure_allocations(make_steps(num_beams)[name], scans)
+    assert retained == 0
+    assert peak == 0
+
+
+def test_invalid_returns_allocate_nothing():
+    scans = make_scans(1080, 50)
+    # Zero ranges, as LiDARs report invalid returns, next to every disparity
+    scans[:, ::97] = 0.0
+    retained, peak = measure_allocations(GapFollower(1080).step, scans)
+    assert (retained, peak) == (0, 0)
+
+
+@pytest.mark.parametrize("num_beams", [60, 1080])
+def test_matches_reference(num_beams):
+    dt = 1 / 40
+    steps = make_steps(num_beams, dt)
+    offsets = GapFollower(num_beams).offsets
+    references = _reference_steps(num_beams, offsets, dt)
+    for scan in make_scans(num_beams, 50, seed=1):
+        for name in ["disparity", "window"]:
+            expected = np.clip(references[name](scan), -0.42, 0.42)
+            assert float(steps[name](scan)) == pytest.approx(expected)
+        u, _, _, _ = references["wall_following"](scan)
+        assert float(steps["wall_following"](scan)) == pytest.approx(-u)
+
+
+@pytest.mark.parametrize("beam", [0, 3, 9])
+def test_zero_range_next_to_a_disparity(beam):
+    ranges = np.full(10, 5.0)
+    ranges[beam] = 0.0
+    follower = GapFollower(10)
+    follower.step(ranges)
+    np.testing.assert_array_equal(follower.ranges, extend_disparities(ranges.copy()))
+
+
+@pytest.mark.parametrize("field_of_view", [np.pi, np.radians(270.0)])
+def test_bubble_follows_the_field_of_view(field_of_view):
+    follower = GapFollower(1080, field_of_view)
+    for scan in make_scans(1080, 20, seed=2):
+        follower.step(scan)
+        expected = extend_disparities(scan.copy(), field_of_view=field_of_view)
+        np.testing.assert_array_equal(follower.ranges, expected)
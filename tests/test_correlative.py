@@ -0,0 +1,18 @@
+import numpy as np
+import pytest
+
+from labs.lab3.correlative import CorrelativeScanMatcher
+
+
+@pytest.mark.parametrize(
+    "pose", [(0.3, -0.2, 0.1), (-0.6, 0.45, -0.2), (0.05, 0.0, 0.0)]
+)
+def test_match_equals_exhaustive_search(scan_room, pose):
+    matcher = CorrelativeScanMatcher(scan_room((-2.0, 0.0, 0.0)))
+    points = scan_room((-2.0 + pose[0], pose[1], pose[2]))
+    result = matcher.match(points)
+    expected = matcher.match_exhaustive(points)
+    np.testing.assert_allclose(result.pose, expected.pose)
+    assert result.score == pytest.approx(expected.score)
+    assert result.num_evaluated < expected.num_evaluated
+    np.testing.assert_allclose(result.pose, pose, atol=0.06)
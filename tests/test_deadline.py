@@ -0,0 +1,54 @@
+import time
+
+import numpy as np
+
+from labs.common.deadline import make_controllers, make_track, simulate_loop
+from labs.common.vehicle import BicycleModel
+
+
+def test_controller_dt_spans_dropped_scans():
+    dts = []
+
+    def slow(ranges, dt):
+        dts.append(dt)
+        # Busy for more than one period once slowed down, so every other scan
+        # arrives while the controller is still working
+        time.sleep(2e-3)
+        return 0.0
+
+    beam_offsets = np.linspace(-np.pi / 2, np.pi / 2, 11)
+    _, dropped, _ = simulate_loop(
+        slow,
+        make_track(),
+        rate=40.0,
+        duration=0.5,
+        beam_offsets=beam_offsets,
+        slowdown=15.0,
+    )
+    assert dropped > 0
+    # Scans arrive on the 1 ms simulation steps, so every dt is a whole number
+    # of periods give or take a step, far from the half periods in between
+    periods = np.array(dts) * 40
+    np.testing.assert_allclose(periods, np.round(periods), atol=0.2)
+    assert periods.max() > 1.5
+
+
+def test_controller_dt_is_the_period_without_drops():
+    dts = []
+    simulate_loop(
+        lambda ranges, dt: dts.append(dt) or 0.0,
+        make_track(),
+        duration=0.5,
+        beam_offsets=np.linspace(-np.pi / 2, np.pi / 2, 11),
+    )
+    np.testing.assert_allclose(dts, 1 / 40, atol=1e-3)
+
+
+def test_disparity_controller_leaves_the_scan_alone():
+    beam_offsets = np.linspace(-3 * np.pi / 4, 3 * np.pi / 4, 1080)
+    controller = make_controllers(beam_offsets, BicycleModel())["disparity"]()
+    ranges = np.full(1080, 10.0)
+    ranges[500:540] = 1.0
+    scan = ranges.copy()
+    controller(scan, 1 / 40)
+    np.testing.assert_array_equal(scan, ranges)
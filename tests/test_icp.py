@@ -0,0 +1,23 @@
+import numpy as np
+import pytest
+
+from labs.lab3.icp import apply_transform, icp, make_transform
+
+
+# Point to point pairs each point with a neighbour along the wall, so it stops
+# about a point spacing short, while point to line slides along the walls
+@pytest.mark.parametrize(
+    "method, atol", [("point_to_point", 1e-2), ("point_to_line", 1e-6)]
+)
+def test_icp_recovers_a_known_transform(scan_room, method, atol):
+    target = scan_room((-2.0, 0.0, 0.0), num_beams=1080)
+    transform = make_transform(0.15, -0.1, 0.08)
+    source = apply_transform(np.linalg.inv(transform), target)
+    result = icp(source, target, method=method, max_iterations=100, tolerance=1e-9)
+    assert result.converged
+    np.testing.assert_allclose(result.transform, transform, atol=atol)
+
+
+def test_icp_rejects_unknown_methods():
+    with pytest.raises(ValueError, match="Unknown ICP method"):
+        icp(np.zeros((3, 2)), np.zeros((3, 2)), method="point_to_plane")
@@ -0,0 +1,30 @@
+import numpy as np
+
+from labs.lab3.loop_closure import LoopClosureDetector
+from labs.lab3.pose_graph import relative_pose
+
+
+def test_detects_a_revisited_pose(scan_room):
+    # A lap and a bit around the left half of the room
+    angles = np.linspace(0, 2.25 * np.pi, 46)
+    truth = np.stack(
+        [-3 + 1.5 * np.cos(angles), 1.5 * np.sin(angles), angles + np.pi / 2], axis=1
+    )
+    # Odometry drifted by the time the lap closes
+    drift = np.linspace(0, 1, len(truth))[:, None] * [0.3, -0.2, 0.05]
+    detector = LoopClosureDetector(min_index_gap=20)
+    found = {}
+    for k, pose in enumerate(truth):
+        found[k] = detector.detect(pose + drift[k], scan_room(pose))
+
+    # Pose 40 is back where the lap started
+    assert not any(found[k] for k in range(40))
+    assert found[40][0].index == 0
+    for k in range(40, len(truth)):
+        assert found[k]
+        for closure in found[k]:
+            np.testing.assert_allclose(
+                closure.measurement,
+                relative_pose(truth[closure.index], truth[k]),
+                atol=0.01,
+            )
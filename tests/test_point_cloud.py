@@ -0,0 +1,35 @@
+import numpy as np
+
+from labs.lab3.point_cloud import ScanPreprocessor
+
+
+def test_to_points_drops_invalid_returns():
+    preprocessor = ScanPreprocessor(voxel_size=0, min_range=0.1, max_range=10.0)
+    ranges = np.array([1.0, np.nan, 0.05, 10.0, np.inf, 2.0])
+    points = preprocessor.to_points(ranges, 0.0, np.pi / 2)
+    np.testing.assert_allclose(points, [[1.0, 0.0], [0.0, 2.0]], atol=1e-12)
+
+
+def test_angle_table_is_cached_per_layout():
+    preprocessor = ScanPreprocessor()
+    table = preprocessor.get_angle_table(-1.0, 0.01, 200)
+    assert preprocessor.get_angle_table(-1.0, 0.01, 200) is table
+    assert preprocessor.get_angle_table(-1.0, 0.01, 100) is not table
+
+
+def test_voxel_downsample_keeps_centroids_in_scan_order():
+    preprocessor = ScanPreprocessor(voxel_size=1.0)
+    points = np.array([[2.2, 0.5], [0.2, 0.2], [2.8, 0.5], [0.4, 0.6]])
+    np.testing.assert_allclose(
+        preprocessor.voxel_downsample(points), [[2.5, 0.5], [0.3, 0.4]]
+    )
+
+
+def test_process_limits_the_number_of_points():
+    preprocessor = ScanPreprocessor(voxel_size=0.05, max_points=50)
+    angles = np.linspace(-np.pi, np.pi, 1080, endpoint=False)
+    points = preprocessor.process(np.full(1080, 5.0), angles[0], angles[1] - angles[0])
+    assert len(points) == 50
+    np.testing.assert_allclose(np.hypot(*points.T), 5.0, atol=0.05)
+    # Still in scan order, i.e. by increasing angle
+    assert np.all(np.diff(np.arctan2(points[:, 1], points[:, 0])) > 0)
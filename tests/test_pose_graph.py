@@ -0,0 +1,54 @@
+import numpy as np
+
+from labs.lab3.pose_graph import (
+    IncrementalOptimizer,
+    PoseGraph,
+    compose_pose,
+    optimize,
+    relative_pose,
+)
+
+INFORMATION = np.diag([400.0, 400.0, 2500.0])
+
+
+def make_loop(num_poses: int = 80, radius: float = 2.5, seed: int = 0):
+    """True poses of a lap of a circle and its noisy odometry"""
+    rng = np.random.default_rng(seed)
+    angles = np.linspace(0, 2 * np.pi, num_poses, endpoint=False)
+    truth = np.stack(
+        [radius * np.cos(angles), radius * np.sin(angles), angles + np.pi / 2], axis=1
+    )
+    odometry = relative_pose(truth[:-1], truth[1:])
+    return truth, odometry + rng.normal(0, [0.02, 0.02, 0.03], odometry.shape)
+
+
+def position_errors(poses: np.ndarray, truth: np.ndarray) -> np.ndarray:
+    return np.hypot(*(poses[:, :2] - truth[:, :2]).T)
+
+
+def test_incremental_matches_batch_on_a_noisy_loop():
+    truth, odometry = make_loop()
+    closure = relative_pose(truth[-1], truth[0])
+
+    incremental = IncrementalOptimizer(PoseGraph(truth[:1]))
+    for measurement in odometry:
+        incremental.add_odometry(measurement, INFORMATION)
+        assert incremental.update() is None
+    dead_reckoning = incremental.graph.poses.copy()
+    incremental.add_edge(len(truth) - 1, 0, closure, INFORMATION)
+    assert incremental.update() is not None
+
+    batch = PoseGraph(truth[:1])
+    for k, measurement in enumerate(odometry, 1):
+        batch.add_pose(compose_pose(batch.poses[-1], measurement))
+        batch.add_edge(k - 1, k, measurement, INFORMATION)
+    np.testing.assert_allclose(batch.poses, dead_reckoning)
+    batch.add_edge(len(truth) - 1, 0, closure, INFORMATION)
+    assert optimize(batch).converged
+
+    offsets = relative_pose(batch.poses, incremental.graph.poses)
+    np.testing.assert_allclose(offsets, 0, atol=1e-6)
+    assert (
+        position_errors(batch.poses, truth).max()
+        < 0.5 * position_errors(dead_reckoning, truth).max()
+    )
@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+
+from labs.common.recorder import compare_traces
+
+
+def make_trace(start: float, stop: float) -> dict[str, np.ndarray]:
+    time = np.linspace(start, stop, 11)
+    return {"time": time, "error": np.sin(time)}
+
+
+def test_compare_traces():
+    reference = make_trace(0.0, 10.0)
+    assert compare_traces(reference, make_trace(5.0, 15.0)) < 0.1
+
+
+def test_compare_empty_trace_raises():
+    empty = {"time": np.empty(0), "error": np.empty(0)}
+    with pytest.raises(ValueError, match="empty"):
+        compare_traces(make_trace(0.0, 10.0), empty)
+    with pytest.raises(ValueError, match="empty"):
+        compare_traces(empty, make_trace(0.0, 10.0))
+
+
+def test_compare_disjoint_traces_raises():
+    with pytest.raises(ValueError, match="do not overlap"):
+        compare_traces(make_trace(0.0, 10.0), make_trace(20.0, 30.0))
@@ -0,0 +1,72 @@
+import os
+
+import numpy as np
+import pytest
+
+from labs.common.recorder import TraceRecorder
+from labs.common.replay import LogReplay
+
+
+def test_replay_recorded_trace(tmp_path):
+    path = os.path.join(tmp_path, "trace")
+    with TraceRecorder(path, ["time", "x", "y", "heading", "range_0"], 2) as recorder:
+        for t in range(5):
+            recorder.append(t, 2 * t, 0.0, 0.0, 1.0 + t)
+    replay = LogReplay(path)
+    assert replay.start_time == 0.0
+    sample = replay.sample(2.5)
+    assert sample["x"] == pytest.approx(5.0)
+    np.testing.assert_allclose(sample["ranges"], [3.5])
+    replay.sample(10.0)
+    assert replay.finished
+
+
+def test_empty_trace_raises(tmp_path):
+    path = os.path.join(tmp_path, "trace")
+    TraceRecorder(path, ["time", "x", "y", "heading"]).close()
+    with pytest.raises(ValueError, match="no rows"):
+        LogReplay(path)
+
+
+def test_header_only_csv_raises(tmp_path):
+    path = os.path.join(tmp_path, "log.csv")
+    with open(path, "w") as f:
+        f.write("time,x,y,heading\n")
+    with pytest.raises(ValueError, match="no rows"):
+        LogReplay(path)
+
+
+def test_end_time_of_every_format(tmp_path):
+    times = np.linspace(0.5, 90.0, 2000)
+    rows = np.stack([times, times, np.zeros_like(times), np.zeros_like(times)], 1)
+    trace = os.path.join(tmp_path, "trace")
+    with TraceRecorder(trace, ["time", "x", "y", "heading"], 256) as recorder:
+        for row in rows:
+            recorder.append(*row)
+    csv_path = os.path.join(tmp_path, "log.csv")
+    # Longer than one block read from the end, without a trailing newline
+    np.savetxt(csv_path, rows, delimiter=",", header="time,x,y,heading", comments="")
+    with open(csv_path, "rb+") as f:
+        f.truncate(f.seek(0, os.SEEK_END) - 1)
+    npy_path = os.path.join(tmp_path, "log.npy")
+    np.save(npy_path, rows)
+    structured_path = os.path.join(tmp_path, "structured.npy")
+    structured = np.zeros(len(rows), [("heading", float), ("time", float)])
+    structured["time"] = times
+    np.save(structured_path, structured)
+    for replay in [
+        LogReplay(trace),
+        LogReplay(csv_path),
+        LogReplay(npy_path, columns=["time", "x", "y", "heading"]),
+        LogReplay(structured_path),
+    ]:
+        assert replay.start_time == 0.5
+        assert replay.end_time == pytest.approx(90.0)
+        assert replay.duration == pytest.approx(89.5)
+
+
+def test_empty_csv_raises(tmp_path):
+    path = os.path.join(tmp_path, "log.csv")
+    open(path, "w").close()
+    with pytest.raises(ValueError, match="empty"):
+        LogReplay(path)
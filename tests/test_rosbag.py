@@ -0,0 +1,196 @@
+import os
+import sqlite3
+import struct
+
+import numpy as np
+import pytest
+
+from labs.common.recorder import load_trace
+from labs.common.rosbag import (
+    BagReader,
+    CdrReader,
+    decode_laser_scan,
+    decode_odometry,
+    export_trace,
+)
+
+SCAN = "sensor_msgs/msg/LaserScan"
+ODOMETRY = "nav_msgs/msg/Odometry"
+
+
+class CdrWriter:
+    """Little endian XCDR1 writer mirroring CdrReader, to build bag fixtures"""
+
+    def __init__(self):
+        self.data = bytearray(b"\x00\x01\x00\x00")
+
+    def _pack(self, code: str, size: int, *values) -> None:
+        self.data += b"\0" * (-(len(self.data) - 4) % size)
+        self.data += struct.pack("<" + code * len(values), *values)
+
+    def string(self, value: str) -> None:
+        encoded = value.encode() + b"\0"
+        self._pack("I", 4, len(encoded))
+        self.data += encoded
+
+    def header(self, stamp: float, frame_id: str) -> None:
+        seconds = int(stamp)
+        self._pack("i", 4, seconds)
+        self._pack("I", 4, round((stamp - seconds) * 1e9))
+        self.string(frame_id)
+
+
+def laser_scan(stamp, frame_id, ranges, range_min=0.1, range_max=10.0) -> bytes:
+    writer = CdrWriter()
+    writer.header(stamp, frame_id)
+    angle_min, angle_max = -np.pi / 2, np.pi / 2
+    increment = (angle_max - angle_min) / (len(ranges) - 1)
+    writer._pack("f", 4, angle_min, angle_max, increment, 0.0, 0.025)
+    writer._pack("f", 4, range_min, range_max)
+    writer._pack("I", 4, len(ranges))
+    writer._pack("f", 4, *ranges)
+    writer._pack("I", 4, 0)
+    return bytes(writer.data)
+
+
+def odometry(stamp, frame_id, x, y, heading, speed=1.0, yaw_rate=0.5) -> bytes:
+    writer = CdrWriter()
+    writer.header(stamp, frame_id)
+    writer.string("base_link")
+    writer._pack("d", 8, x, y, 0.0)
+    writer._pack("d", 8, 0.0, 0.0, np.sin(heading / 2), np.cos(heading / 2))
+    writer._pack("d", 8, *np.zeros(36))
+    writer._pack("d", 8, speed, 0.0, 0.0, 0.0, 0.0, yaw_rate)
+    writer._pack("d", 8, *np.zeros(36))
+    return bytes(writer.data)
+
+
+def write_bag(path: str, messages) -> None:
+    """A rosbag2 SQLite file of (topic, type, timestamp in ns, data) messages"""
+    with sqlite3.connect(path) as connection:
+        connection.execute(
+            "CREATE TABLE topics(id INTEGER PRIMARY KEY, name TEXT NOT NULL, "
+            "type TEXT NOT NULL, serialization_format TEXT NOT NULL, "
+            "offered_qos_profiles TEXT NOT NULL)"
+        )
+        connection.execute(
+            "CREATE TABLE messages(id INTEGER PRIMARY KEY, topic_id INTEGER NOT NULL, "
+            "timestamp INTEGER NOT NULL, data BLOB NOT NULL)"
+        )
+        ids = {}
+        for topic, type_name, timestamp, data in messages:
+            if topic not in ids:
+                ids[topic] = len(ids) + 1
+                connection.execute(
+                    "INSERT INTO topics VALUES (?, ?, ?, 'cdr', '')",
+                    (ids[topic], topic, type_name),
+                )
+            connection.execute(
+                "INSERT INTO messages(topic_id, timestamp, data) VALUES (?, ?, ?)",
+                (ids[topic], timestamp, data),
+            )
+    connection.close()
+
+
+@pytest.mark.parametrize("frame_id", ["", "a", "ab", "abc", "laser", "laser_frame"])
+def test_decode_laser_scan_aligns_after_frame_id(frame_id):
+    ranges = np.array([1.0, 2.5, 4.0], dtype=np.float32)
+    message = decode_laser_scan(laser_scan(12.5, frame_id, ranges))
+    assert message.frame_id == frame_id
+    assert message.time == pytest.approx(12.5)
+    assert message.angle_min == pytest.approx(-np.pi / 2)
+    assert message.range_min == pytest.approx(0.1)
+    assert message.range_max == pytest.approx(10.0)
+    np.testing.assert_array_equal(message.ranges, ranges)
+    assert len(message.intensities) == 0
+
+
+@pytest.mark.parametrize("frame_id", ["odom", "odom1", "o"])
+def test_decode_odometry_aligns_float64(frame_id):
+    message = decode_odometry(odometry(3.0, frame_id, 1.5, -2.0, 0.75))
+    assert message.frame_id == frame_id
+    assert message.child_frame_id == "base_link"
+    assert (message.x, message.y) == (1.5, -2.0)
+    assert message.heading == pytest.approx(0.75)
+    assert message.speed == 1.0
+    assert message.yaw_rate == 0.5
+
+
+def test_cdr_reader_rejects_unknown_encapsulation():
+    with pytest.raises(ValueError):
+        CdrReader(b"\x00\x02\x00\x00")
+
+
+def test_clean_ranges():
+    ranges = np.array([np.nan, np.inf, -np.inf, 0.05, 1.0, 12.0], dtype=np.float32)
+    message = decode_laser_scan(laser_scan(0.0, "laser", ranges))
+    np.testing.assert_array_equal(
+        message.get_clean_ranges(), [10.0, 10.0, 10.0, 10.0, 1.0, 10.0]
+    )
+
+
+@pytest.fixture
+def split_bag(tmp_path):
+    """
+    A bag split over three files, numbered so that lexical order is wrong, with
+    odometry arriving after the first scan and carried over between files
+    """
+    ranges = np.array([1.0, np.nan, 0.01, 3.0], dtype=np.float32)
+    files = {
+        "bag_0.db3": [
+            ("/scan", SCAN, 1_000_000_000, laser_scan(1.0, "laser", ranges)),
+            ("/odom", ODOMETRY, 1_010_000_000, odometry(1.01, "odom", 1.0, 2.0, 0.5)),
+        ],
+        "bag_2.db3": [
+            ("/scan", SCAN, 1_100_000_000, laser_scan(1.1, "laser", ranges + 1)),
+        ],
+        "bag_10.db3": [
+            ("/odom", ODOMETRY, 1_150_000_000, odometry(1.15, "odom", 3.0, 4.0, -1.0)),
+            ("/scan", SCAN, 1_200_000_000, laser_scan(1.2, "laser", ranges + 2)),
+        ],
+    }
+    for name, messages in files.items():
+        write_bag(os.path.join(tmp_path, name), messages)
+    return str(tmp_path)
+
+
+def test_split_bag_in_numeric_order(split_bag):
+    reader = BagReader(split_bag, batch_size=1)
+    assert [os.path.basename(f) for f in reader.files] == [
+        "bag_0.db3",
+        "bag_2.db3",
+        "bag_10.db3",
+    ]
+    assert reader.topics == {"/scan": SCAN, "/odom": ODOMETRY}
+    timestamps = [timestamp for _, timestamp, _ in reader.raw_messages()]
+    assert timestamps == sorted(timestamps)
+    assert len(timestamps) == 5
+
+
+def test_samples_carry_the_latest_pose(split_bag):
+    samples = list(BagReader(split_bag).samples())
+    assert [s["time"] for s in samples] == pytest.approx([1.0, 1.1, 1.2])
+    poses = [(s["x"], s["y"], s["heading"]) for s in samples]
+    assert poses[0] == (0.0, 0.0, 0.0)
+    assert poses[1] == pytest.approx((1.0, 2.0, 0.5))
+    assert poses[2] == pytest.approx((3.0, 4.0, -1.0))
+    np.testing.assert_allclose(samples[0]["ranges"], [1.0, 10.0, 10.0, 3.0])
+    np.testing.assert_allclose(samples[1]["ranges"], [2.0, 10.0, 1.01, 4.0])
+
+
+def test_samples_without_odometry(tmp_path):
+    path = os.path.join(tmp_path, "scans.db3")
+    ranges = np.ones(3, dtype=np.float32)
+    write_bag(path, [("/scan", SCAN, 5, laser_scan(0.0, "", ranges))])
+    (sample,) = BagReader(path).samples()
+    assert (sample["x"], sample["y"], sample["heading"]) == (0.0, 0.0, 0.0)
+
+
+def test_export_trace(split_bag, tmp_path):
+    path = os.path.join(tmp_path, "trace")
+    assert export_trace(BagReader(split_bag), path) == 3
+    trace = load_trace(path)
+    np.testing.assert_allclose(trace["time"], [0.0, 0.1, 0.2])
+    np.testing.assert_allclose(trace["x"], [0.0, 1.0, 3.0])
+    np.testing.assert_allclose(trace["range_1"], [10.0, 10.0, 10.0])
+    np.testing.assert_allclose(trace["range_3"], [3.0, 4.0, 5.0])
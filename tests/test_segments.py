@@ -0,0 +1,90 @@
+import shutil
+import subprocess as sp
+from types import SimpleNamespace
+
+import pytest
+
+try:
+    from labs.common.segments import SegmentedFileWriter, can_segment
+except Exception as error:  # manimgl needs a display to import
+    pytest.skip(f"manimgl does not import: {error}", allow_module_level=True)
+
+WIDTH, HEIGHT, FPS = 32, 16, 10
+
+
+def make_writer(tmp_path, **kwargs) -> SegmentedFileWriter:
+    camera = SimpleNamespace(fps=FPS, get_pixel_shape=lambda: (WIDTH, HEIGHT))
+    return SegmentedFileWriter(
+        SimpleNamespace(camera=camera),
+        write_to_movie=True,
+        output_directory=str(tmp_path),
+        file_name="Scene",
+        quiet=True,
+        **kwargs,
+    )
+
+
+def write_frames(writer: SegmentedFileWriter, count: int) -> None:
+    for i in range(count):
+        writer.write_raw_frame(bytes([i % 256]) * (4 * WIDTH * HEIGHT))
+
+
+def test_can_segment():
+    assert can_segment({})
+    assert not can_segment({"video_codec": "prores_ks", "movie_file_extension": ".mov"})
+    assert not can_segment({"movie_file_extension": ".gif"})
+    assert not can_segment({"subdivide_output": True})
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="needs ffmpeg")
+def test_segments_join_into_the_movie(tmp_path):
+    writer = make_writer(tmp_path, min_segment_duration=0.5, max_segment_duration=1.0)
+    writer.begin()
+    write_frames(writer, 7)
+    writer.next_section()
+    write_frames(writer, 18)
+    writer.finish()
+
+    # 7 frames up to the section, then 10 at the maximum duration, then 8
+    playlist = writer.playlist_path.read_text().splitlines()
+    durations = [float(line[8:-1]) for line in playlist if line.startswith("#EXTINF")]
+    assert durations == pytest.approx([0.7, 1.0, 0.8])
+    assert playlist[-1] == "#EXT-X-ENDLIST"
+    for index in range(3):
+        assert writer.get_segment_path(index).name in playlist
+        assert writer.get_segment_path(index).exists()
+
+    movie = writer.get_movie_file_path()
+    assert movie == tmp_path / "Scene.mp4"
+    if shutil.which("ffprobe") is not None:
+        frames = sp.run(
+            [
+                "ffprobe",
+                "-v", "error",
+                "-count_frames",
+                "-select_streams", "v:0",
+                "-show_entries", "stream=nb_read_frames",
+                "-of", "csv=p=0",
+                str(movie),
+            ],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout  # fmt: skip
+        assert int(frames) == 25
+    else:
+        assert movie.stat().st_size > 0
+
+
+def test_failed_segment_raises(tmp_path):
+    # Reads the frames like ffmpeg would, then fails
+    failing = tmp_path / "ffmpeg"
+    failing.write_text("#!/bin/sh\ncat > /dev/null\nexit 1\n")
+    failing.chmod(0o755)
+    writer = make_writer(tmp_path, ffmpeg_bin=str(failing))
+    writer.begin()
+    write_frames(writer, 3)
+    with pytest.raises(RuntimeError, match="status 1"):
+        writer.close_segment()
+    assert "#EXTINF" not in writer.playlist_path.read_text()
+    assert not writer.get_segment_path(0).exists()